@@ -0,0 +1,306 @@
+"""
+nfl-web-scraping.benchmarks.fixture_utils
+~~~~~~~~~~~~~~
+This module provides a local HTTP fixture server that mimics the layout of www.playerprofiler.com.
+It is used by scraping/benchmark.py and the benchmark tests to time the web crawler without sending
+requests to the real website. Pages recorded from the real website (record_fixtures) can be served
+instead of the synthetic ones. A small recorded set is kept in benchmarks/fixtures/.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+import threading
+import hashlib
+import json
+import os
+import random
+import time
+
+# Host of the recorded pages. Links to it are rewritten to the fixture server when served
+RECORDED_HOST = "https://www.playerprofiler.com"
+
+# The recorded pages kept in the repository
+FIXTURES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "quarterback"
+)
+
+
+PROFILE_TEMPLATE = """<html>
+<body>
+<div class="flex-1 md:space-y-1">
+<h1>{name}</h1>
+<div class="leading-none text-xl md:text-2xl -mb-px md:mb-0">{position}</div>
+<a class="text-blue-light hover:underline" href="/team">
+{team}
+</a>
+</div>
+<div>
+{player_card}
+</div>
+<div>
+{metrics_card}
+</div>
+<section id="key-stats">
+{key_card}
+</section>
+<table>
+{season_rows}
+</table>
+</body>
+</html>
+"""
+
+LINK_TEMPLATE = """<a class="flex items-center justify-between space-x-3 px-4 md:px-8 pt-2" href="{href}">
+<span>{pop_index}</span>
+</a>"""
+
+
+def span(text, tag_class=None):
+    """
+    Returns a html span, with an optional class string
+    """
+    if tag_class:
+        return f'<span class="{tag_class}">{text}</span>'
+    return f"<span>{text}</span>"
+
+
+def make_profile(player_id, n_seasons=3, seed=None):
+    """
+    Builds a synthetic player profile page with the same card layout that scrapePage reads.
+
+    Parameters
+    ----------
+    player_id (int): The id of the fake player, used in the player name
+    n_seasons (int): The number of season rows in the season stats card
+    seed (int): Seed for the random stat values. Defaults to player_id
+
+    Returns
+    --------
+    str: The html text of the profile page
+    """
+    rng = random.Random(player_id if seed is None else seed)
+
+    player_card = "\n".join(
+        [
+            span(f"6' {rng.randint(0, 11)}\"", "leading-none whitespace-nowrap"),
+            span(f"{rng.randint(180, 250)} lbs", "leading-none whitespace-nowrap"),
+            span(f"{rng.randint(2010, 2022)}", "leading-none whitespace-nowrap"),
+            span(
+                rng.choice(["1.02", "2.15", "Undrafted", "2019"]),
+                "leading-none whitespace-nowrap",
+            ),
+            span(
+                rng.choice(["Alabama", "Ohio State", "LSU", "Clemson"]),
+                "leading-none whitespace-nowrap",
+            ),
+            span(f"{rng.uniform(21, 35):.1f}", "leading-none whitespace-nowrap"),
+        ]
+    )
+
+    metrics_card = "\n".join(
+        [
+            span(
+                rng.choice([f"{rng.uniform(4.3, 5.0):.2f}s", "-"]),
+                "block font-light text-xs sm:text-sm leading-none",
+            )
+            for _ in range(5)
+        ]
+    )
+
+    key_card = "\n".join(
+        span(f"{rng.uniform(0, 100):.1f}%") + span(f"({rng.randint(1, 99)}th)")
+        for _ in range(4)
+    )
+
+    season_rows = []
+    for year in range(2022, 2022 - n_seasons, -1):
+        cells = [span(str(year), "text-xxs md:text-base")] + [
+            span(f"{rng.uniform(0, 300):.1f}", "text-xxs md:text-base")
+            for _ in range(8)
+        ]
+        season_rows.append(
+            '<tr class="border-t border-solid border-gray-700">'
+            + "".join(f"<td>{c}</td>" for c in cells)
+            + "</tr>"
+        )
+
+    return PROFILE_TEMPLATE.format(
+        name=f"Player {player_id}",
+        position=f"QB #{rng.randint(1, 99)}",
+        team=rng.choice(["Buffalo Bills", "Kansas City Chiefs", "Free Agent"]),
+        player_card=player_card,
+        metrics_card=metrics_card,
+        key_card=key_card,
+        season_rows="\n".join(season_rows),
+    )
+
+
+def make_position_page(base_url, pos, n_players):
+    """
+    Builds a synthetic position page, listing links to n_players fake profiles
+    """
+    links = [
+        LINK_TEMPLATE.format(
+            href=f"{base_url}/player/{pos}-{k}",
+            pop_index=k + 1 if k % 3 else "-",
+        )
+        for k in range(n_players)
+    ]
+    return "<html><body>\n" + "\n".join(links) + "\n</body></html>"
+
+
+class fixture_http_server(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer with a listen backlog larger than the default of 5, so bursts of concurrent
+    connections are not dropped (and retried a second later by the client)
+    """
+
+    request_queue_size = 128
+
+
+class fixture_server:
+    """
+    A threaded local HTTP server that serves fake position and profile pages.
+
+    Parameters
+    ----------
+    n_players (int): The number of players listed on each position page
+    latency (float): Seconds of artificial delay added to every response, to mimic network round trips
+    pages (dict): Optional mapping of url path -> html text. Paths found here are served
+                  instead of the synthetic pages, with links to RECORDED_HOST pointing to the
+                  fixture server (see load_fixtures)
+
+    Notes
+    -----
+    Use it as a context manager. The base url of the server is available as `base_url`.
+    Responses carry an `ETag`, and a matching If-None-Match request gets a 304.
+    """
+
+    def __init__(self, n_players=50, latency=0.05, pages=None):
+        self.n_players = n_players
+        self.latency = latency
+        self.pages = pages or {}
+        self.n_requests = 0
+
+        server = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.n_requests += 1
+                time.sleep(server.latency)
+                body = server.render(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = body.encode("utf-8")
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = fixture_http_server(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def render(self, path):
+        """
+        Returns the html text for a request path, or None for an unknown path
+        """
+        page = self.pages.get(path, self.pages.get(path.rstrip("/")))
+        if page is not None:
+            return page.replace(RECORDED_HOST, self.base_url)
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "position":
+            return make_position_page(self.base_url, parts[1], self.n_players)
+        if len(parts) == 2 and parts[0] == "player":
+            return make_profile(int(parts[1].rsplit("-", 1)[-1]))
+        return None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def fixture_name(path):
+    """
+    Returns the file name of a recorded page from its url path (/player/josh-allen/ -> player-josh-allen.html)
+    """
+    return path.strip("/").replace("/", "-") + ".html"
+
+
+def record_fixtures(crawler, path, n_players=20):
+    """
+    Records the position page of a crawler and the first n_players profiles it links to, so the
+    benchmarks can replay real pages offline. An index.json file lists the recorded url paths
+
+    Parameters
+    ----------
+    crawler (web_crawler): A crawler for the position to record (its getPage is used, so the rate
+                           limiter of config.yaml applies)
+    path (str): The directory of the recorded pages
+    n_players (int): The number of profiles to record
+
+    Returns
+    --------
+    dict: The content of index.json
+    """
+    os.makedirs(path, exist_ok=True)
+    links = list(crawler.getNameLinks(pop_index=False, save=False))[:n_players]
+
+    index = {
+        "position": crawler.pos_str,
+        "source": crawler.url,
+        "recorded": time.strftime("%Y-%m-%d"),
+        "pages": {},
+    }
+    # Pages are stored as if they came from the real website, whatever host they were recorded from
+    origin = "{0.scheme}://{0.netloc}".format(urlsplit(crawler.url))
+    for url in [crawler.url] + links:
+        html = crawler.getPage(url)
+        if html is None:
+            raise ValueError(f"Could not record {url}")
+        html = html.replace(origin, RECORDED_HOST)
+        url_path = urlsplit(url).path.rstrip("/")
+        with open(os.path.join(path, fixture_name(url_path)), "w") as f:
+            f.write(html)
+        index["pages"][url_path] = fixture_name(url_path)
+
+    # The position page is served at /position/POSITION, like the synthetic pages
+    index["position_path"] = urlsplit(crawler.url).path.rstrip("/")
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def load_fixtures(path):
+    """
+    Loads the pages saved by record_fixtures
+
+    Returns
+    --------
+    index (dict): The content of index.json (position, source, recorded date, position_path)
+    pages (dict): url path -> html text, for fixture_server(pages=...)
+    """
+    with open(os.path.join(path, "index.json"), "r") as f:
+        index = json.load(f)
+    pages = {}
+    for url_path, name in index["pages"].items():
+        with open(os.path.join(path, name), "r") as f:
+            pages[url_path] = f.read()
+    return index, pages
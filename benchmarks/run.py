@@ -0,0 +1,168 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+parser = argparse.ArgumentParser(
+    description="Run the scraping and preprocessing benchmarks, store the results of this commit, "
+    "and compare them with another commit",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+
+parser.add_argument(
+    "--quick",
+    "-q",
+    action="store_true",
+    default=False,
+    help="Smaller sizes, for a fast check",
+)
+
+parser.add_argument(
+    "--fixtures",
+    "-f",
+    type=str,
+    default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "fixtures", "quarterback"
+    ),
+    help="Directory of recorded pages for the scraping benchmarks (see scraping/benchmark.py --record)",
+)
+
+parser.add_argument(
+    "--synthetic",
+    action="store_true",
+    default=False,
+    help="Use synthetic pages for the scraping benchmarks instead of --fixtures",
+)
+
+parser.add_argument(
+    "--compare",
+    "-c",
+    type=str,
+    default=None,
+    help="A commit (or a results .json file) to compare with",
+)
+
+parser.add_argument(
+    "--threshold",
+    "-t",
+    type=float,
+    default=0.10,
+    help="A benchmark slower than the compared commit by more than this fraction is a regression",
+)
+
+parser.add_argument(
+    "--no-save",
+    action="store_true",
+    default=False,
+    help="Do not store the results in benchmarks/results/",
+)
+
+args = parser.parse_args()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results")
+
+
+def git(*cmd):
+    """
+    Returns the output of a git command run in the repository
+    """
+    return subprocess.run(
+        ["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def run_script(folder, script_args):
+    """
+    Runs folder/benchmark.py from its own folder (like the other scripts), and returns its results
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "results.json")
+        subprocess.run(
+            [sys.executable, "benchmark.py", *script_args, "--json", out_path],
+            cwd=os.path.join(ROOT, folder),
+            check=True,
+        )
+        with open(out_path, "r") as f:
+            return json.load(f)
+
+
+def load_results(ref):
+    """
+    Loads stored results from a .json file, or from the results of a commit
+    """
+    if ref.endswith(".json"):
+        path = ref
+    else:
+        path = os.path.join(RESULTS_PATH, git("rev-parse", "--short=10", ref) + ".json")
+    if not os.path.isfile(path):
+        raise ValueError(f"No stored results for {ref} ({path})")
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def compare(old, new):
+    """
+    Prints every benchmark of new next to old, and returns the names of the regressions
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {old['commit']:>12} {new['commit']:>12}   change")
+    for name, seconds in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>12} {seconds:12.6f}")
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  <- slower"
+            regressions.append(name)
+        print(f"{name:<40} {before:12.6f} {seconds:12.6f}  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+
+    scraping_args = ["-n", "20", "-l", "0.01", "-r", "2"] if args.quick else []
+    if not args.synthetic:
+        scraping_args += ["-f", os.path.abspath(args.fixtures)]
+    preprocessing_args = ["-n", "10000", "100000"] if args.quick else []
+
+    results = {}
+    results.update(run_script("scraping", scraping_args))
+    results.update(run_script("preprocessing", preprocessing_args))
+
+    new = {
+        "commit": git("rev-parse", "--short=10", "HEAD"),
+        # Uncommitted changes are part of the measured code
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "quick": args.quick,
+        "fixtures": None if args.synthetic else args.fixtures,
+        "results": results,
+    }
+
+    if not args.no_save:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        out_path = os.path.join(RESULTS_PATH, new["commit"] + ".json")
+        with open(out_path, "w") as f:
+            json.dump(new, f, indent=2)
+        print(f"\nSaved results in {out_path}")
+
+    if args.compare:
+        regressions = compare(load_results(args.compare), new)
+        if regressions:
+            print(
+                f"\n{len(regressions)} benchmarks are more than {args.threshold:.0%} slower"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+pytest-benchmark entry point of the scraping benchmarks, on the recorded pages of
+benchmarks/fixtures/. Run with `python -m pytest benchmarks --benchmark-only` (pip install
+pytest-benchmark). benchmarks/run.py runs the full suite and compares commits.
+"""
+from urllib.parse import urlsplit
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from fixture_utils import FIXTURES_PATH, fixture_server, load_fixtures
+from utils.extract_utils import extract_cards_lxml
+from utils.links_utils import parse_links
+from utils.scrape_utils import extract_cards, parse_profile, pos_dict, web_crawler
+
+
+@pytest.fixture(scope="module")
+def fixtures():
+    """
+    The recorded index and pages
+    """
+    return load_fixtures(FIXTURES_PATH)
+
+
+@pytest.fixture(scope="module")
+def profiles(fixtures):
+    """
+    The html text of every recorded profile
+    """
+    index, pages = fixtures
+    return [html for path, html in pages.items() if path != index["position_path"]]
+
+
+@pytest.fixture(scope="module")
+def server(fixtures):
+    """
+    A fixture server replaying the recorded pages, without added latency
+    """
+    index, pages = fixtures
+    with fixture_server(latency=0, pages=pages) as server:
+        yield server
+
+
+def test_links(benchmark, fixtures):
+    index, pages = fixtures
+    links = benchmark(parse_links, pages[index["position_path"]], False)
+    assert len(links) == len(pages) - 1
+
+
+@pytest.mark.parametrize("extract", [extract_cards, extract_cards_lxml])
+def test_extract_cards(benchmark, profiles, extract):
+    cards = benchmark(lambda: [extract(html) for html in profiles])
+    assert len(cards) == len(profiles)
+
+
+@pytest.mark.parametrize("backend", ["bs4", "lxml"])
+def test_parse_profile(benchmark, fixtures, profiles, backend):
+    att_list = pos_dict(fixtures[0]["position"])
+    rows = benchmark(
+        lambda: [parse_profile(html, att_list, backend=backend) for html in profiles]
+    )
+    assert all(len(row) == sum(len(card) for card in att_list) for row in rows)
+
+
+@pytest.mark.parametrize("fetch_mode", ["serial", "thread", "asyncio"])
+def test_scrape(benchmark, fixtures, server, fetch_mode):
+    index, pages = fixtures
+    crawler = web_crawler(
+        url=server.base_url + index["position_path"],
+        headers=None,
+        cookies=None,
+        fetch_mode=fetch_mode,
+        parse_backend="lxml",
+    )
+    page_list = [
+        url
+        for url in crawler.getNameLinks(pop_index=False, save=False)
+        if urlsplit(url).path.rstrip("/") in pages
+    ]
+    df = benchmark(crawler.scrapePage, page_list=page_list, save=False)
+    assert len(df) == len(page_list)
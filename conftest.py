@@ -0,0 +1,12 @@
+"""
+pytest configuration. The scraping modules import each other as `utils.*`, since the scripts are
+run from the scraping folder, so that folder is put on the path of the tests, along with the
+fixture server of benchmarks/.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+for folder in ("benchmarks", "scraping"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
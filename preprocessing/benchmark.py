@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.preprocess_utils import preprocess_data, read_data
+from utils.dtype_utils import downcast
+from utils.loader_utils import column_dtypes, scan_file
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the preprocessing pipeline on a synthetic dataset",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+
+parser.add_argument(
+    "--rows",
+    "-n",
+    type=int,
+    nargs="+",
+    default=[10_000, 100_000, 1_000_000],
+    help="Number of rows in the synthetic dataset. Several sizes are run one after the other",
+)
+
+parser.add_argument(
+    "--seed",
+    "-s",
+    type=int,
+    default=0,
+    help="Random seed for the synthetic dataset",
+)
+
+parser.add_argument(
+    "--json",
+    type=str,
+    default=None,
+    help="Also write the results (seconds, lower is better) to this .json file",
+)
+
+args = parser.parse_args()
+
+COLUMNS = [
+    ["name", "position", "team"],
+    ["height", "weight", "draft", "college", "age"],
+    ["40-yard", "speed", "burst", "agility", "bench"],
+    ["col-qbr", "col-ypa", "col-breakout", "col-sparq"],
+    [
+        "games-played",
+        "pass-attempts",
+        "pass-yards",
+        "comp-percentage",
+        "ypa",
+        "rush-yards",
+        "tds",
+        "fantasy-ppg",
+    ],
+]
+
+
+def make_raw_data(n_rows, seed=0):
+    """
+    Builds a synthetic raw dataset that looks like a scraped quarterback .csv file once loaded:
+    dashes and NaNs in every column group, drafts written as picks, years or `Undrafted`
+    """
+    rng = np.random.default_rng(seed)
+    columns = [col for card in COLUMNS for col in card]
+
+    def with_gaps(values, dash=0.05, nan=0.05):
+        values = pd.Series(values, dtype=object)
+        draw = rng.random(n_rows)
+        values[draw < dash] = "-"
+        values[(draw >= dash) & (draw < dash + nan)] = np.nan
+        return values
+
+    df = pd.DataFrame(
+        {
+            "name": [f"Player {k}" for k in range(n_rows)],
+            "position": with_gaps(
+                np.char.add("QB #", rng.integers(1, 99, n_rows).astype(str))
+            ),
+            "team": with_gaps(
+                rng.choice(
+                    ["Buffalo Bills", "Kansas City Chiefs", "Free Agent"], n_rows
+                )
+            ),
+            "draft": with_gaps(
+                rng.choice(
+                    ["1.02", "2.15", "7.30", "Undrafted", "2019", "2021"], n_rows
+                )
+            ),
+            "college": with_gaps(rng.choice(["Alabama", "Ohio State", "LSU"], n_rows)),
+        }
+    )
+    for col in columns:
+        if col in df:
+            continue
+        values = np.round(rng.uniform(0, 300, n_rows), 1)
+        values[rng.random(n_rows) < 0.1] = np.nan
+        df[col] = values
+    # Metrics cards have dashes on the website, so they load as text columns
+    for col in ["40-yard", "speed", "burst"]:
+        df[col] = with_gaps(df[col].astype(str))
+
+    return df[columns]
+
+
+def digest(df):
+    """
+    Returns the sha256 of a dataframe written as a .csv file
+    """
+    return hashlib.sha256(df.to_csv(index=False).encode("utf-8")).hexdigest()
+
+
+def bench_preprocess(n_rows):
+    """
+    Times the per-row and vectorized preprocessing on the same synthetic dataset, and checks that
+    both write the same .csv file
+    """
+    raw = make_raw_data(n_rows, args.seed)
+
+    results = {}
+    digests = {}
+    for vectorized in (False, True):
+        df = raw.copy()
+        start = time.perf_counter()
+        preprocess_data(df, "quarterback", vectorized=vectorized)
+        results[vectorized] = time.perf_counter() - start
+        digests[vectorized] = digest(df)
+
+    if digests[True] != digests[False]:
+        raise ValueError("Vectorized output does not match the per-row output")
+
+    return results
+
+
+def bench_downcast(n_rows):
+    """
+    Downcasts a preprocessed synthetic dataset, and checks that it round-trips through every output
+    format: .parquet and .feather files read back the downcast frame, and a .csv file reads back
+    the same values as the .csv file of the frame before downcasting. Returns the seconds taken,
+    and the memory before and after
+    """
+    df = make_raw_data(n_rows, args.seed)
+    preprocess_data(df, "quarterback")
+    small = df.copy()
+
+    start = time.perf_counter()
+    report = downcast(small)
+    seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "frame")
+        small.to_parquet(path + ".parquet", index=False)
+        small.to_feather(path + ".feather")
+        small.to_csv(path + ".csv", index=False)
+        df.to_csv(path + "-full.csv", index=False)
+
+        for fmt in ("parquet", "feather"):
+            if not read_data(f"{path}.{fmt}").equals(small):
+                raise ValueError(
+                    f"The downcast frame does not round-trip through .{fmt}"
+                )
+        if not read_data(path + ".csv").equals(read_data(path + "-full.csv")):
+            raise ValueError("The downcast frame does not write the same .csv values")
+
+    return seconds, report
+
+
+def bench_loader(n_rows, columns=("name", "team", "games-played", "fantasy-ppg")):
+    """
+    Reads a few columns and rows of a synthetic scraped .csv file, with a full read then a filter,
+    and with the lazy loader (in one chunk and in chunks of 10k rows). Checks that every read gives
+    the same frame, and returns the seconds taken by each
+    """
+    df = make_raw_data(n_rows, args.seed)
+    team = df["team"].dropna().iloc[0]
+    filters = [("team", "==", team), ("games-played", ">", 8)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "raw.csv")
+        df.to_csv(path, index=False)
+
+        timings = {}
+        start = time.perf_counter()
+        full = read_data(path)
+        full = full.replace("-", np.nan).astype(column_dtypes(full.columns))
+        full = full[(full["team"] == team) & (full["games-played"] > 8)]
+        expected = full[list(columns)].reset_index(drop=True)
+        timings["full"] = time.perf_counter() - start
+
+        for chunksize in (None, 10_000):
+            start = time.perf_counter()
+            chunks = list(scan_file(path, list(columns), filters, chunksize))
+            lazy = pd.concat(chunks, ignore_index=True)
+            timings[chunksize or "lazy"] = time.perf_counter() - start
+            if not lazy.equals(expected):
+                raise ValueError(
+                    f"The lazy loader (chunksize={chunksize}) does not read the same frame"
+                )
+
+    return timings
+
+
+def main():
+
+    results = {}
+    for n_rows in args.rows:
+        timings = bench_preprocess(n_rows)
+        results[f"preprocess.{n_rows}.per_row.seconds"] = timings[False]
+        results[f"preprocess.{n_rows}.vectorized.seconds"] = timings[True]
+
+        print(f"{n_rows} rows (identical .csv output)")
+        print(f"  per-row: {timings[False]:7.3f}s")
+        print(
+            f"vectorized: {timings[True]:7.3f}s  ({timings[False] / timings[True]:5.1f}x faster)"
+        )
+
+        seconds, report = bench_downcast(n_rows)
+        results[f"downcast.{n_rows}.seconds"] = seconds
+        print(
+            f"  downcast: {seconds:7.3f}s  {report['bytes_before'] / 2**20:8.2f} MB -> "
+            f"{report['bytes_after'] / 2**20:8.2f} MB (round-trips through csv, parquet, feather)"
+        )
+
+        timings = bench_loader(n_rows)
+        results[f"loader.{n_rows}.full.seconds"] = timings["full"]
+        results[f"loader.{n_rows}.lazy.seconds"] = timings["lazy"]
+        results[f"loader.{n_rows}.chunked.seconds"] = timings[10_000]
+        print("  loader, 4 of 25 columns and a team filter (identical frames)")
+        print(f"      full: {timings['full']:7.3f}s")
+        print(
+            f"      lazy: {timings['lazy']:7.3f}s  ({timings['full'] / timings['lazy']:5.1f}x faster)"
+        )
+        print(f"   chunked: {timings[10_000]:7.3f}s  (chunks of 10k rows)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,10 @@ parser.add_argument(
     "--position",
     "-p",
     type=str,
+    nargs="+",
     required=True,
-    help="Enter the position you want data from",
+    help="Enter the position you want data from. Several positions, or 'all', are preprocessed "
+    "in parallel",
 )
 
 parser.add_argument(
@@ -22,17 +24,76 @@ parser.add_argument(
     help="Whether you want to convert string columns into integers. If true, then will factorize",
 )
 
+parser.add_argument(
+    "--format",
+    "-o",
+    type=str,
+    default="csv",
+    choices=["csv", "parquet", "feather"],
+    help="File format of the preprocessed dataset",
+)
+
+parser.add_argument(
+    "--downcast",
+    action="store_true",
+    default=False,
+    help="Store every column in its smallest safe dtype (int8 / int16 / float32 / category) before saving",
+)
+
+parser.add_argument(
+    "--as-of",
+    "-d",
+    type=str,
+    nargs="+",
+    default=None,
+    help="Load the most recent scraped file on or before this date (YYYY-MM-DD). Default is the newest. "
+    "With several dates, each snapshot is saved as preprocessed_POSITION-YYYY-MM-DD",
+)
+
+parser.add_argument(
+    "--all-snapshots",
+    "-a",
+    action="store_true",
+    default=False,
+    help="Preprocess every scraped file of the positions, each saved as preprocessed_POSITION-YYYY-MM-DD",
+)
+
+parser.add_argument(
+    "--workers",
+    "-w",
+    type=int,
+    default=None,
+    help="Number of processes for several files. Default is one per file, up to the number of cores",
+)
+
 args = parser.parse_args()
 
 
 def main():
 
-    # Load Data
-    df = load_csv(args.position)
-    # Preprocess Data
-    preprocess_data(df, args.position, factorize=args.factorize)
-    # Save
-    save_csv(args.position, df)
+    # Scraped files to preprocess, one per position and snapshot date
+    jobs, missing = batch_jobs(
+        args.position, as_of=args.as_of, all_snapshots=args.all_snapshots
+    )
+    # Outputs of several snapshots of a position are told apart by their date
+    dated = args.all_snapshots or len(args.as_of or []) > 1
+
+    # Load, preprocess and save each file, across a pool of processes
+    saved = preprocess_batch(
+        jobs,
+        factorize=args.factorize,
+        fmt=args.format,
+        dated=dated,
+        downcast=args.downcast,
+        workers=args.workers,
+    )
+    logging.info(f"Preprocessed {len(saved)} files")
+    if missing:
+        skipped = ", ".join(
+            position + (f" (as of {date})" if date else "")
+            for position, date in missing
+        )
+        logging.warning(f"Skipped {len(missing)} without a scraped file: {skipped}")
 
 
 if __name__ == "__main__":
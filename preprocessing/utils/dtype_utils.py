@@ -0,0 +1,149 @@
+"""
+nfl-web-scraping.preprocessing.utils.dtype_utils
+~~~~~~~~~~~~~~
+This module provides the optional downcasting stage of the preprocessing pipeline. Every column of
+a preprocessed frame is stored in the smallest dtype that holds its values exactly, following the
+range of each stat, so frames of many snapshots take less memory and smaller files.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_object_dtype
+
+from utils.headings_utils import ALL_COLUMNS, TEXT_COLUMNS
+
+# The dtype of the columns whose range is known. Missing values are filled with -1 by
+# preprocess_data, so integer stats are signed
+STAT_DTYPES = {
+    # Counts within a season: at most 17 games, and a few dozen touchdowns
+    "games-played": "int8",
+    "tds": "int8",
+    # Position rank, weight (lbs), attempts, targets, receptions and yards of a season
+    "position": "int16",
+    "weight": "int16",
+    "pass-attempts": "int16",
+    "rush-attempts": "int16",
+    "targets": "int16",
+    "rec": "int16",
+    "pass-yards": "int16",
+    "rush-yards": "int16",
+    "rec-yards": "int16",
+    "air-yards": "int16",
+    # The draft pick, scraped as text and converted to a number by preprocess_data
+    "draft": "float32",
+}
+
+
+def column_dtypes(columns=ALL_COLUMNS, text_columns=TEXT_COLUMNS):
+    """
+    Returns the dtype of every scraped column (see utils/headings_utils.py): its dtype in
+    STAT_DTYPES, category for the other text columns, and float32 for the other stats
+    (measurements, times, rates and per-game averages, with one or two decimals)
+    """
+    unknown = [col for col in STAT_DTYPES if col not in columns]
+    if unknown:
+        raise ValueError(f"Columns {unknown} of STAT_DTYPES are not scraped columns")
+    return {
+        col: STAT_DTYPES.get(col, "category" if col in text_columns else "float32")
+        for col in columns
+    }
+
+
+COLUMN_DTYPES = column_dtypes()
+
+# Integer dtypes tried in turn, when a column does not fit its dtype in COLUMN_DTYPES
+INT_DTYPES = ("int8", "int16", "int32")
+
+# A text column becomes a category only if it has fewer unique values than this share of its rows
+CATEGORY_MAX_UNIQUE = 0.5
+
+
+def downcast(df, dtypes=COLUMN_DTYPES):
+    """
+    Converts the columns of a preprocessed frame to smaller dtypes, in place. A column is only
+    converted if none of its values change:
+        int8 / int16: every value is a whole number within the range of the dtype. Otherwise a
+                      wider integer is tried, then float32, then the column is kept as it is
+        float32: every value prints as the same number in float32 (so it survives a .csv file)
+        category: text columns whose values repeat (see CATEGORY_MAX_UNIQUE)
+
+    Parameters
+    ----------
+    df (dataframe): A preprocessed dataframe, from preprocess_data
+    dtypes (dict): The target dtype of each column. Columns that are not listed are kept
+
+    Returns
+    --------
+    dict: Memory of the frame before and after, in bytes, and the new dtype of each converted column
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    converted = {}
+
+    for col, target in dtypes.items():
+        if col not in df:
+            continue
+        values = df[col]
+        if target == "category":
+            new_dtype = category_dtype(values)
+        elif is_numeric_dtype(values) and values.dtype.kind in "iuf":
+            new_dtype = numeric_dtype(values.to_numpy(), target)
+        else:
+            new_dtype = None
+        if new_dtype is not None and new_dtype != values.dtype:
+            df[col] = values.astype(new_dtype)
+            converted[col] = str(new_dtype)
+
+    after = int(df.memory_usage(deep=True).sum())
+    logging.info(
+        f"Downcast {len(converted)} columns: {before / 2**20:.2f} MB -> {after / 2**20:.2f} MB"
+    )
+    return {"bytes_before": before, "bytes_after": after, "dtypes": converted}
+
+
+def numeric_dtype(values, target):
+    """
+    Returns the smallest dtype a numeric column can take without changing any value: target, a wider
+    integer if an integer target does not fit, float32 for a column that is not whole, or None
+    """
+    if target.startswith("int"):
+        if np.isfinite(values).all() and (values == np.round(values)).all():
+            low, high = values.min(initial=0), values.max(initial=0)
+            for dtype in INT_DTYPES[INT_DTYPES.index(target) :]:
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                    return np.dtype(dtype)
+        target = "float32"
+
+    if target == "float32" and float32_safe(values):
+        return np.dtype("float32")
+    return None
+
+
+def float32_safe(values):
+    """
+    Returns True if every value prints as the same number once stored as a float32. Only the unique
+    values are checked
+    """
+    uniques = (
+        pd.unique(values[~np.isnan(values)])
+        if values.dtype.kind == "f"
+        else pd.unique(values)
+    )
+    if len(uniques) == 0:
+        return True
+    if np.abs(uniques).max() >= 2**24:
+        # Whole numbers past 2 ** 24 are not all representable
+        return False
+    return all(float(str(v)) == u for v, u in zip(uniques.astype(np.float32), uniques))
+
+
+def category_dtype(values):
+    """
+    Returns 'category' for a text column whose values repeat, None otherwise (a category of unique
+    values takes more memory than the strings)
+    """
+    if not is_object_dtype(values):
+        return None
+    if values.nunique(dropna=True) >= CATEGORY_MAX_UNIQUE * len(values):
+        return None
+    return "category"
@@ -0,0 +1,184 @@
+"""
+nfl-web-scraping.preprocessing.utils.encoding_utils
+~~~~~~~~~~~~~~
+This module provides the category store used to factorize the team and college columns. Every
+category gets an integer code the first time it is seen, and keeps it in every later run and in
+every position, so preprocessed files can be joined without recomputing their encodings.
+"""
+import json
+import logging
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows: run batch preprocessing with --workers 1 there
+    fcntl = None
+
+CATEGORY_PATH = "preprocessed_data/dicts/categories/"
+
+# Codes are stored as int16, so a column holds at most 32767 categories
+CODE_DTYPE = np.int16
+
+
+class category_store:
+    """
+    category_store keeps an append-only dictionary of categories for each column. Codes are
+    never changed or reused: a new category is added at the end of its column.
+
+    Each column is stored in two files, which can be memory mapped:
+        COLUMN.bytes: every category, as utf-8 text, one after the other
+        COLUMN.offsets.npy: the start of every category in COLUMN.bytes, plus the end of the last one
+
+    Parameters
+    ----------
+    path (str): The directory of the store (default = preprocessed_data/dicts/categories/)
+
+    Notes
+    -----
+    Lookups are O(1) both ways: a dictionary maps categories to codes, and a code is decoded by
+    slicing COLUMN.bytes between two offsets. Several processes can add categories at once (batch
+    preprocessing), since appends are done under a lock of the column.
+    """
+
+    def __init__(self, path=CATEGORY_PATH):
+        self.path = path
+        # column -> (list of categories, {category: code})
+        self.columns = {}
+
+    def __repr__(self):
+        return f"category_store({self.path})"
+
+    def files(self, col):
+        """
+        Returns the bytes, offsets and lock file paths of a column
+        """
+        base = os.path.join(self.path, col)
+        return base + ".bytes", base + ".offsets.npy", base + ".lock"
+
+    def load(self, col):
+        """
+        Reads the categories of a column from disk, and returns them as a list
+        """
+        bytes_path, offsets_path, _ = self.files(col)
+        if not os.path.isfile(offsets_path):
+            categories = []
+        else:
+            offsets = np.load(offsets_path, mmap_mode="r")
+            with open(bytes_path, "rb") as f:
+                # An empty file cannot be mapped (a column of empty strings only)
+                if offsets[-1] == 0:
+                    blob = b""
+                else:
+                    blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                categories = [
+                    blob[start:end].decode("utf-8")
+                    for start, end in zip(offsets[:-1], offsets[1:])
+                ]
+                if isinstance(blob, mmap.mmap):
+                    blob.close()
+        self.columns[col] = (categories, {c: k for k, c in enumerate(categories)})
+        return categories
+
+    def categories(self, col):
+        """
+        Returns the categories of a column, in code order
+        """
+        if col not in self.columns:
+            self.load(col)
+        return self.columns[col][0]
+
+    def encode(self, col, values):
+        """
+        Returns the codes of a column of values, adding the categories that are not stored yet
+
+        Parameters
+        ----------
+        col (str): The column name (e.g. 'college')
+        values (pd.Series): The values to encode. NaN values get the code -1
+
+        Returns
+        --------
+        np.ndarray: The int16 code of every value
+        """
+        # The lookups run on the unique values only, then spread back over the rows
+        codes, uniques = pd.factorize(values)
+        uniques = [str(u) for u in uniques]
+
+        self.categories(col)
+        if any(u not in self.columns[col][1] for u in uniques):
+            self.append(col, uniques)
+        index = self.columns[col][1]
+
+        unique_codes = np.array([index[u] for u in uniques] + [-1], dtype=CODE_DTYPE)
+        return unique_codes[codes]
+
+    def append(self, col, values):
+        """
+        Adds the values of a column that are not stored yet, at the end of the column
+        """
+        os.makedirs(self.path, exist_ok=True)
+        bytes_path, offsets_path, lock_path = self.files(col)
+
+        with open(lock_path, "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have added categories since they were read
+            categories = self.load(col)
+            new = [v for v in dict.fromkeys(values) if v not in self.columns[col][1]]
+            if not new:
+                return
+            if len(categories) + len(new) > np.iinfo(CODE_DTYPE).max:
+                raise ValueError(
+                    f"The {col} column would have more than {np.iinfo(CODE_DTYPE).max} categories"
+                )
+
+            encoded = [v.encode("utf-8") for v in new]
+            if categories:
+                offsets = np.load(offsets_path)
+            else:
+                offsets = np.zeros(1, dtype=np.int64)
+            new_offsets = offsets[-1] + np.cumsum([len(v) for v in encoded])
+
+            # Bytes past the last offset are left over from an interrupted append
+            with open(bytes_path, "ab") as f:
+                f.truncate(offsets[-1])
+                f.write(b"".join(encoded))
+            # The offsets are replaced in one step, so readers see all the new categories or none
+            tmp_path = offsets_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.concatenate([offsets, new_offsets]))
+            os.replace(tmp_path, offsets_path)
+
+            categories += new
+            self.columns[col] = (
+                categories,
+                {c: k for k, c in enumerate(categories)},
+            )
+        logging.info(f"Added {len(new)} categories to the {col} column")
+
+    def decode(self, col, codes):
+        """
+        Returns the categories of an array of codes (NaN for -1)
+        """
+        categories = np.array(self.categories(col) + [np.nan], dtype=object)
+        return pd.Series(categories[np.asarray(codes)], name=col)
+
+    def categorical(self, col, codes):
+        """
+        Returns an array of codes as a pandas Categorical, with every stored category of the column
+        """
+        return pd.Categorical.from_codes(codes, categories=self.categories(col))
+
+    def export(self, col, path):
+        """
+        Writes the code -> category dictionary of a column as a readable .json text file
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(dict(enumerate(self.categories(col)))))
+        os.replace(tmp_path, path)
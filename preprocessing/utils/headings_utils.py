@@ -0,0 +1,50 @@
+"""
+nfl-web-scraping.preprocessing.utils.headings_utils
+~~~~~~~~~~~~~~
+This module loads the column headings of the scraper (scraping/utils/att_list_headings.py), so the
+preprocessing tables follow the scraped columns instead of keeping a copy of them. The file is
+loaded by its path, as the scraping and preprocessing folders both have a `utils` package.
+"""
+from itertools import chain
+import importlib.util
+import os
+
+HEADINGS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "scraping",
+    "utils",
+    "att_list_headings.py",
+)
+
+
+def load_headings(path=HEADINGS_PATH):
+    """
+    Loads att_list_headings.py from its file path, and returns it as a module
+    """
+    spec = importlib.util.spec_from_file_location("att_list_headings", path)
+    headings = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(headings)
+    return headings
+
+
+HEADINGS = load_headings()
+
+# The attribute lists of every position, as in scrape_utils
+ATT_LISTS = {
+    "quarterback": HEADINGS.att_list_qb,
+    "running-back": HEADINGS.att_list_rb,
+    "wide-receiver": HEADINGS.att_list_wr,
+    "tight-end": HEADINGS.att_list_te,
+}
+
+# Every scraped column, over all positions, in the order of the attribute lists
+ALL_COLUMNS = list(
+    dict.fromkeys(
+        col for att_list in ATT_LISTS.values() for col in chain.from_iterable(att_list)
+    )
+)
+
+# Columns that are scraped as text. All other columns are numeric
+TEXT_COLUMNS = list(HEADINGS.att_text_columns)
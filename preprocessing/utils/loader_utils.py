@@ -0,0 +1,181 @@
+"""
+nfl-web-scraping.preprocessing.utils.loader_utils
+~~~~~~~~~~~~~~
+This module provides a lazy loader for scraped files. Only the requested columns are parsed, with
+explicit dtypes, rows are filtered chunk by chunk, and the chunks are yielded one at a time, so a
+job that needs a few columns of many files never holds a whole file in memory.
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+
+from utils.headings_utils import TEXT_COLUMNS
+from utils.preprocess_utils import IN_PATH, find_data, scraped_files
+
+# Row filter operators, as (column, op, value)
+FILTER_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda col, value: col.isin(value),
+    "not in": lambda col, value: ~col.isin(value),
+}
+
+
+def scan_data(
+    position,
+    columns=None,
+    filters=None,
+    chunksize=None,
+    as_of=None,
+    all_snapshots=False,
+):
+    """
+    Lazily reads the scraped files of a position, parsing only the requested columns
+
+    Parameters
+    ----------
+    position (str): The NFL position [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    columns (list): The columns to return. default = None (every column)
+    filters (list): Row filters, as (column, op, value) tuples, all of which must hold. op is one of
+                    ['==', '!=', '<', '<=', '>', '>=', 'in', 'not in'] (e.g. [("team", "==",
+                    "Buffalo Bills"), ("games-played", ">", 10)]). Filter columns do not need to
+                    be in columns
+    chunksize (int): Number of rows parsed at a time. default = None (each file in one chunk)
+    as_of (str): Read the most recent file scraped on or before this date (YYYY-MM-DD).
+                 default = None (the newest file)
+    all_snapshots (bool): Read every scraped file of the position, oldest first, with a
+                          `scraped_on` column holding the date of each file
+
+    Returns
+    --------
+    generator: Yields a dataframe for each chunk, with the requested columns. Nothing is read until
+               the generator is iterated
+
+    Notes
+    -----
+    Text columns are read as strings and every other column as float64, with "-" read as NaN.
+    .csv files are parsed with usecols, and .parquet / .feather files only read the needed columns.
+    """
+    if all_snapshots:
+        files = sorted(scraped_files(position).items(), key=lambda x: (x[1], x[0]))
+    else:
+        file = find_data(position, as_of=as_of)
+        files = [(file, None)]
+
+    for file, date in files:
+        for chunk in scan_file(IN_PATH + file, columns, filters, chunksize):
+            if date is not None:
+                chunk["scraped_on"] = pd.Timestamp(date)
+            yield chunk
+
+
+def scan_file(path, columns=None, filters=None, chunksize=None):
+    """
+    Lazily reads the requested columns and rows of one scraped file (see scan_data)
+    """
+    filters = list(filters or [])
+    for col, op, value in filters:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Filter op must be one of {list(FILTER_OPS)}, not {op}")
+
+    header = read_columns(path)
+    wanted = header if columns is None else list(columns)
+    needed = list(dict.fromkeys(wanted + [col for col, op, value in filters]))
+    missing = [col for col in needed if col not in header]
+    if missing:
+        raise ValueError(f"Columns {missing} are not in {path}")
+
+    for chunk in read_chunks(path, needed, chunksize):
+        for col, op, value in filters:
+            chunk = chunk[FILTER_OPS[op](chunk[col], value)]
+        yield chunk[wanted].reset_index(drop=True)
+
+
+def load_columns(position, columns=None, filters=None, **kwargs):
+    """
+    Reads the requested columns and rows of scraped files into one dataframe (see scan_data)
+    """
+    chunks = list(scan_data(position, columns, filters, **kwargs))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def column_dtypes(columns):
+    """
+    Returns the dtype of each column of a scraped file
+    """
+    return {col: object if col in TEXT_COLUMNS else "float64" for col in columns}
+
+
+def read_columns(path):
+    """
+    Returns the column names of a scraped file, without reading its rows
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    elif path.endswith(".feather"):
+        import pyarrow.ipc as ipc
+
+        with ipc.open_file(path) as reader:
+            return reader.schema.names
+    else:
+        return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def read_chunks(path, columns, chunksize=None):
+    """
+    Yields the given columns of a scraped file, chunksize rows at a time
+    """
+    dtypes = column_dtypes(columns)
+
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        if chunksize is None:
+            batches = [parquet.read(columns=columns)]
+        else:
+            batches = parquet.iter_batches(batch_size=chunksize, columns=columns)
+        for batch in batches:
+            yield typed(batch.to_pandas(), dtypes)
+
+    elif path.endswith(".feather"):
+        import pyarrow.feather as feather
+
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        if chunksize is None:
+            yield typed(table.to_pandas(), dtypes)
+        else:
+            for batch in table.to_batches(max_chunksize=chunksize):
+                yield typed(batch.to_pandas(), dtypes)
+
+    else:
+        reader = pd.read_csv(
+            path,
+            usecols=columns,
+            dtype=dtypes,
+            na_values={col: ["-"] for col in columns if col not in TEXT_COLUMNS},
+            chunksize=chunksize,
+        )
+        if chunksize is None:
+            yield reader
+        else:
+            with reader:
+                yield from reader
+
+
+def typed(df, dtypes):
+    """
+    Converts the columns of a frame read with pyarrow to the dtypes of column_dtypes, reading "-"
+    in numeric columns as NaN (as read_csv does)
+    """
+    for col, dtype in dtypes.items():
+        if dtype != object and df[col].dtype == object:
+            df[col] = df[col].replace("-", np.nan)
+    return df.astype(dtypes)
@@ -6,12 +6,28 @@ import glob
 import re
 import math
 import json
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pandas.api.types import is_numeric_dtype
 
+from utils.encoding_utils import category_store
+from utils.dtype_utils import downcast as downcast_dtypes
+
 logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO)
 
+# File formats written by the scraper, and by save_data
+DATA_FORMATS = (".csv", ".parquet", ".feather")
+
+POSITIONS = ("quarterback", "running-back", "wide-receiver", "tight-end")
+
+IN_PATH = "../scraping/scraped_data/"
+
+DICT_PATH = "preprocessed_data/dicts/"
 
-def preprocess_data(df=None, position=None, factorize=False):
+
+def preprocess_data(
+    df=None, position=None, factorize=False, vectorized=True, store=None
+):
     """
     Main preprocessing head function. This will sequentially alter all columns. Will convert
     NaN values, change data types, factorize strings, and prepare the dataframe for data analysis
@@ -23,6 +39,15 @@ def preprocess_data(df=None, position=None, factorize=False):
 
     position (str): The NFL position that is being generated [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
 
+    factorize (bool): Whether to convert the team and college columns into integers. The codes are
+                      int16, and shared by every position and run (see utils/encoding_utils.py)
+
+    vectorized (bool): Clean the columns with whole-column pandas operations instead of per-row
+                       `.apply` calls and per-column `fillna` loops. Both give identical output
+
+    store (category_store): The store of the team and college codes. default = None (the store in
+                            preprocessed_data/dicts/categories/)
+
     Returns
     --------
     pd.dataframe: A preprocessed version of the dataset
@@ -36,35 +61,94 @@ def preprocess_data(df=None, position=None, factorize=False):
     # Sometimes dashes exist in the scraping portion of the website
     df.replace("-", np.nan, inplace=True)
 
-    # Position
-    convert_nan("position", df)
-    df["position"] = df["position"].apply(lambda x: remove_str(x))
+    if vectorized:
+        # Position
+        df["position"] = clean_position(df["position"])
 
-    # Draft
-    df["draft"] = (
-        df["draft"]
-        .str.lower()
-        .replace("undrafted", "0")
-        .apply(lambda x: decimal_check(x))
-    )
-    convert_nan("draft", df)
-    df["draft"] = df["draft"].astype(float)
+        # Draft
+        df["draft"] = clean_draft(df["draft"])
+
+    else:
+        # Position
+        convert_nan("position", df)
+        df["position"] = df["position"].apply(lambda x: remove_str(x))
+
+        # Draft
+        df["draft"] = (
+            df["draft"]
+            .str.lower()
+            .replace("undrafted", "0")
+            .apply(lambda x: decimal_check(x))
+        )
+        convert_nan("draft", df)
+        df["draft"] = df["draft"].astype(float)
 
     if factorize:
+        if store is None:
+            store = category_store()
+
         # Team
         df["team"], team_idx = factorize_col(
-            "team", df, sorting=False, save=True, pos=position
+            "team", df, sorting=False, save=True, pos=position, store=store
         )
 
         # College
         convert_nan("college", df)
         df["college"], col_idx = factorize_col(
-            "college", df, sorting=False, save=True, pos=position
+            "college", df, sorting=False, save=True, pos=position, store=store
         )
 
     # Others (different header column names for each )
     rest_of = df.select_dtypes(include=["float64", "int64"]).columns.tolist()
-    convert_nan(rest_of, df, multi_flag=True)
+    if vectorized:
+        # One fillna over the whole group of numeric columns
+        df.fillna({col: -1 for col in rest_of}, inplace=True)
+    else:
+        convert_nan(rest_of, df, multi_flag=True)
+
+
+def clean_position(col):
+    """
+    Vectorized version of `remove_str` on the position column. Fills NaN with "0", then keeps
+    only the digits of each entry and converts them to integers (e.g. "QB #12" -> 12).
+
+    The column is factorized first, so the string work only runs on its unique entries, and the
+    results are spread back over the rows with one NumPy take.
+    """
+    codes, uniques = pd.factorize(col.fillna("0"))
+    digits = (
+        pd.Series(uniques, dtype=object)
+        .str.replace("[^0-9]", "", regex=True)
+        .astype(int)
+        .to_numpy()
+    )
+    return pd.Series(digits[codes], index=col.index, name=col.name)
+
+
+def clean_draft(col):
+    """
+    Vectorized version of the draft cleaning: lowercases entries, maps `undrafted` to 0, applies
+    `decimal_check`, fills NaN with 0 and converts the column to floats.
+
+    Like clean_position, the work runs on the unique entries of the column. They are parsed as numbers
+    in one `pd.to_numeric` pass: whole numbers (draft years) become 0 and the rest keep their value.
+    Only entries that pd.to_numeric cannot parse fall back to `decimal_check`.
+    """
+    codes, uniques = pd.factorize(col)
+
+    draft = pd.Series(uniques, dtype=object).str.lower().replace("undrafted", "0")
+    numeric = pd.to_numeric(draft, errors="coerce")
+    unresolved = numeric.isna() & draft.notna()
+
+    draft = draft.mask(numeric % 1 == 0, "0")
+    if unresolved.any():
+        draft[unresolved] = draft[unresolved].map(decimal_check)
+    draft = draft.fillna("0").astype(float).to_numpy()
+
+    # NaN entries have code -1, which takes the 0 appended at the end, like a NaN passed
+    # through decimal_check and convert_nan
+    values = np.append(draft, 0.0)[codes]
+    return pd.Series(values, index=col.index, name=col.name)
 
 
 def load_csv(position):
@@ -79,27 +163,87 @@ def load_csv(position):
     --------
     pd.dataframe: A raw dataset based on position.
     """
+    return load_data(position)
 
-    if position not in ("quarterback", "wide-receiver", "running-back", "tight-end"):
-        return ValueError("position does not exist. Must be one of the four positions")
 
-    in_path = "../scraping/scraped_data/"
+def load_data(position, as_of=None):
+    """
+    Loads the most recent scraped file of a position into the preprocessing pipeline. The file can be
+    a .csv file, or a typed .parquet / .feather file (see `output: format` in scraping/utils/config.yaml)
 
-    if not os.path.isdir(in_path):
-        raise ValueError("scraped data path does not exist in scraping folder")
+    Parameters
+    ----------
+    position (str): The NFL position that is being generated [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    as_of (str): Optional. Load the most recent file scraped on or before this date (YYYY-MM-DD)
 
-    # Takes the most recent file based on the date in the file name
-    file = sorted(
-        [f for f in os.listdir(in_path) if f.startswith("nfl_stats-" + position)],
-        reverse=True,
-    )[0]
+    Returns
+    --------
+    pd.dataframe: A raw dataset based on position.
+    """
 
-    df = pd.read_csv(in_path + file, index_col=False)
+    df = read_data(IN_PATH + find_data(position, as_of=as_of))
     df.reset_index(drop=True, inplace=True)
 
     return df
 
 
+def find_data(position, as_of=None):
+    """
+    Returns the name of the most recent scraped file of a position, in ../scraping/scraped_data/
+
+    Parameters
+    ----------
+    position (str): The NFL position [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    as_of (str): Optional. The most recent file scraped on or before this date (YYYY-MM-DD)
+    """
+    files = scraped_files(position)
+    if as_of is not None:
+        as_of = datetime.date.fromisoformat(as_of)
+        files = {f: date for f, date in files.items() if date <= as_of}
+    if not files:
+        raise ValueError(f"No scraped file found for the {position} position")
+    # Takes the most recent file based on the date in the file name
+    return max(files, key=lambda f: (files[f], f))
+
+
+def scraped_files(position):
+    """
+    Returns every scraped file of a position, mapped to its scrape date
+    """
+    if position not in POSITIONS:
+        raise ValueError("position does not exist. Must be one of the four positions")
+
+    if not os.path.isdir(IN_PATH):
+        raise ValueError("scraped data path does not exist in scraping folder")
+
+    return {
+        f: scrape_date(f)
+        for f in os.listdir(IN_PATH)
+        if f.startswith("nfl_stats-" + position) and f.endswith(DATA_FORMATS)
+    }
+
+
+def scrape_date(file):
+    """
+    Returns the date in the name of a scraped file (nfl_stats-POSITION-DD-MM-YYYY.csv). The name itself
+    does not sort by date, since it starts with the day
+    """
+    date = os.path.splitext(file)[0][-10:]
+    return datetime.datetime.strptime(date, "%d-%m-%Y").date()
+
+
+def read_data(path):
+    """
+    Reads a .csv, .parquet or .feather file into a dataframe, based on its extension
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    elif path.endswith(".feather"):
+        return pd.read_feather(path)
+    else:
+        return pd.read_csv(path, index_col=False)
+
+
 def remove_str(x):
     """
     Removes and converts a string entry into an integer
@@ -200,7 +344,7 @@ def get_column(col_name, dataframe):
 #             raise ValueError("Cannot convert NaN. Column not a float64 or object")
 
 
-def factorize_col(pd_col_str, df, sorting=False, save=False, pos=None):
+def factorize_col(pd_col_str, df, sorting=False, save=False, pos=None, store=None):
     """
     Factorizes column variables, converting them from recurring string to integers.
 
@@ -208,9 +352,13 @@ def factorize_col(pd_col_str, df, sorting=False, save=False, pos=None):
     ----------
     pd_col_str (str): The column name of the dataset
     df (dataframe): The current dataframe
-    sorting (bool): Turn sorting on for the pd.factorize() function
+    sorting (bool): Turn sorting on for the pd.factorize() function. Not used with a store, whose
+                    codes are in the order categories were first seen
     save (bool): Save the index of factorized names (saves inside `preprocessed_data` as a .txt file)
-    pos (str): The NFL position [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    pos (str): The NFL position [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]. Not
+               used with a store, whose dictionary is shared by every position (dicts/COLUMN.txt)
+    store (category_store): Optional. The shared, persistent codes of utils/encoding_utils.py. Without
+                            it, the column is factorized on its own
 
 
     Returns
@@ -219,11 +367,18 @@ def factorize_col(pd_col_str, df, sorting=False, save=False, pos=None):
 
     """
 
+    if store is not None:
+        pd_fac = store.encode(pd_col_str, get_column(pd_col_str, df))
+        pd_idx = pd.Index(store.categories(pd_col_str))
+        if save:
+            store.export(pd_col_str, DICT_PATH + pd_col_str + ".txt")
+        return pd_fac, pd_idx
+
     pd_fac, pd_idx = get_column(pd_col_str, df).factorize(sort=sorting)
 
     if save:
         fact_dict = dict(zip(range(len(pd_idx)), pd_idx))
-        dict_path = "preprocessed_data/dicts/" + pos + "-" + pd_col_str + ".txt"
+        dict_path = DICT_PATH + pos + "-" + pd_col_str + ".txt"
         with open(dict_path, "w") as file:
             file.write(json.dumps(fact_dict))
 
@@ -239,19 +394,201 @@ def save_csv(position, df):
     position (str): The NFL position that is being generated [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
     df (pd.Dataframe): The current dataframe being processed
     """
+    save_data(position, df, fmt="csv")
+
+
+def save_data(position, df, fmt="csv", suffix=""):
+    """
+    Saves the preprocessed dataframe into `preprocessed_data`, as a .csv file or a typed .parquet / .feather file.
 
-    if position not in ("quarterback", "wide-receiver", "running-back", "tight-end"):
-        return ValueError("position does not exist. Must be one of the four positions")
+    Parameters
+    ----------
+    position (str): The NFL position that is being generated [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    df (pd.Dataframe): The current dataframe being processed
+    fmt (str): The output format [`csv`, `parquet`, `feather`]
+    suffix (str): Added to the position in the file name (e.g. the scrape date of the file, in batch mode)
+
+    Returns
+    --------
+    str: The path of the saved file
+
+    Notes
+    -----
+    The file is written to a temporary file first and then renamed, so an interrupted run (or a run
+    of several processes) never leaves a partial file behind.
+    """
+
+    if position not in POSITIONS:
+        raise ValueError("position does not exist. Must be one of the four positions")
+
+    if "." + fmt not in DATA_FORMATS:
+        raise ValueError(f"Output format must be one of {DATA_FORMATS}")
 
     out_path = "../preprocessing/preprocessed_data/"
 
-    if not os.path.isdir(out_path):
-        os.mkdir(out_path)
-        raise Warning("preprocessed data path does not exist in preprocessing folder")
+    os.makedirs(out_path, exist_ok=True)
 
-    OUTPUT = out_path + "preprocessed_" + position + ".csv"
+    OUTPUT = out_path + "preprocessed_" + position + suffix + "." + fmt
+    # Unique per process, and keeps the extension so pandas writes the same format
+    tmp_path = f"{out_path}.tmp-{os.getpid()}-preprocessed_{position}{suffix}.{fmt}"
 
-    df.to_csv(OUTPUT, index=False)
+    try:
+        if fmt == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        elif fmt == "feather":
+            df.reset_index(drop=True).to_feather(tmp_path)
+        else:
+            df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, OUTPUT)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-    logging.info(f"Saving preprocessed csv file for the {position} position")
+    logging.info(f"Saving preprocessed {fmt} file for the {position} position")
     logging.info("Done")
+    return OUTPUT
+
+
+def preprocess_file(
+    position, file, factorize=False, fmt="csv", dated=False, downcast=False
+):
+    """
+    Loads, preprocesses and saves one scraped file. This is the job of a batch worker process
+
+    Parameters
+    ----------
+    position (str): The NFL position [`quarterback`, `running-back`, `wide-receiver`, `tight-end`]
+    file (str): The name of the scraped file, in ../scraping/scraped_data/
+    factorize (bool): Whether to convert the team and college columns into integers
+    fmt (str): The output format [`csv`, `parquet`, `feather`]
+    dated (bool): Add the scrape date of the file to the output names
+                  (preprocessed_POSITION-YYYY-MM-DD.csv), so several snapshots can be kept
+    downcast (bool): Store every column in its smallest safe dtype (see utils/dtype_utils.py)
+
+    Returns
+    --------
+    str: The path of the saved file
+    """
+    suffix = "-" + scrape_date(file).isoformat() if dated else ""
+    df = read_data(IN_PATH + file)
+    df.reset_index(drop=True, inplace=True)
+    preprocess_data(df, position, factorize=factorize)
+    if downcast:
+        downcast_dtypes(df)
+    return save_data(position, df, fmt=fmt, suffix=suffix)
+
+
+def batch_jobs(positions, as_of=None, all_snapshots=False):
+    """
+    Lists the scraped files to preprocess in batch mode
+
+    Parameters
+    ----------
+    positions (list): The NFL positions, or ['all']
+    as_of (list): Optional. Snapshot dates (YYYY-MM-DD). For each one, the most recent file scraped
+                  on or before it is used. default = None (the newest file)
+    all_snapshots (bool): Use every scraped file of each position
+
+    Returns
+    --------
+    list: (position, file) pairs, without duplicates
+    list: (position, as_of) pairs that have no scraped file, and were skipped (as_of is None for
+          the newest file, or with all_snapshots)
+
+    Notes
+    -----
+    A position or date without a scraped file is logged and skipped, so one missing position does
+    not stop the others. A ValueError is raised if no file is found at all.
+    """
+    if "all" in positions:
+        positions = POSITIONS
+
+    jobs = []
+    missing = []
+    for position in positions:
+        # Raises on an unknown position, or without a scraped data folder
+        scraped = scraped_files(position)
+        if all_snapshots:
+            files = [
+                f for f, date in sorted(scraped.items(), key=lambda x: (x[1], x[0]))
+            ]
+            if not files:
+                missing.append((position, None))
+        else:
+            files = []
+            for date in as_of or [None]:
+                try:
+                    files.append(find_data(position, as_of=date))
+                except ValueError:
+                    missing.append((position, date))
+        jobs += [(position, f) for f in dict.fromkeys(files)]
+
+    for position, date in missing:
+        logging.warning(
+            f"No scraped file found for the {position} position"
+            + (f" on or before {date}" if date else "")
+            + ", skipping it"
+        )
+    if not jobs:
+        raise ValueError(f"No scraped file found for the positions {list(positions)}")
+    return jobs, missing
+
+
+def preprocess_batch(
+    jobs, factorize=False, fmt="csv", dated=False, downcast=False, workers=None
+):
+    """
+    Preprocesses several scraped files across a pool of processes. Each file is independent, and
+    every output is written atomically (see save_data)
+
+    Parameters
+    ----------
+    jobs (list): (position, file) pairs, from batch_jobs()
+    factorize (bool): Whether to convert the team and college columns into integers
+    fmt (str): The output format [`csv`, `parquet`, `feather`]
+    dated (bool): Add the scrape date of each file to its output names (see preprocess_file)
+    downcast (bool): Store every column in its smallest safe dtype (see preprocess_file)
+    workers (int): Number of processes. default = None (one per job, up to the number of cores).
+                   With 1, the files are preprocessed in this process
+
+    Returns
+    --------
+    dict: The saved path of each (position, file) job
+
+    Notes
+    -----
+    A job that fails does not stop the others. The failures are logged and raised together at
+    the end, as a RuntimeError.
+    """
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+
+    options = dict(factorize=factorize, fmt=fmt, dated=dated, downcast=downcast)
+    saved = {}
+    failed = {}
+    if workers <= 1:
+        for job in jobs:
+            try:
+                saved[job] = preprocess_file(*job, **options)
+            except Exception as e:
+                failed[job] = e
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(preprocess_file, *job, **options): job for job in jobs
+            }
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    saved[job] = future.result()
+                except Exception as e:
+                    failed[job] = e
+
+    for (position, file), e in failed.items():
+        logging.error(f"Could not preprocess {file} ({position}): {e!r}")
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(jobs)} files could not be preprocessed"
+        )
+
+    return saved
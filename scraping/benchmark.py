@@ -0,0 +1,462 @@
+from urllib.parse import urlsplit
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import pandas as pd
+
+from utils.scrape_utils import (
+    web_crawler,
+    log_to_file,
+    pos_dict,
+    parse_profile,
+    extract_cards,
+    season_rows,
+)
+from utils.extract_utils import extract_cards_lxml
+from utils.convert_utils import convert_to_num, convert_inch_to_cm
+from utils.schedule_utils import POSITIONS
+
+# The fixture server is test code, kept in benchmarks/ rather than in the utils package
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+)
+from fixture_utils import fixture_server, make_profile, record_fixtures, load_fixtures
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the web crawler against a local HTTP fixture server",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+
+parser.add_argument(
+    "--players",
+    "-n",
+    type=int,
+    default=60,
+    help="Number of fake players listed on the position page (or profiles to record)",
+)
+
+parser.add_argument(
+    "--latency",
+    "-l",
+    type=float,
+    default=0.05,
+    help="Artificial delay (seconds) added to every fixture server response",
+)
+
+parser.add_argument(
+    "--max-in-flight",
+    "-m",
+    type=int,
+    default=8,
+    help="Maximum number of requests in flight for the concurrent fetch modes",
+)
+
+parser.add_argument(
+    "--repeat",
+    "-r",
+    type=int,
+    default=5,
+    help="Number of passes over the fixture pages for the parser microbenchmark",
+)
+
+parser.add_argument(
+    "--levels",
+    type=int,
+    nargs="+",
+    default=[1, 4, 8, 16],
+    help="Concurrency levels (max_in_flight) of the full-position scrape benchmark",
+)
+
+parser.add_argument(
+    "--fixtures",
+    "-f",
+    type=str,
+    default=None,
+    help="Serve the pages recorded in this directory (see --record) instead of synthetic pages",
+)
+
+parser.add_argument(
+    "--record",
+    type=str,
+    default=None,
+    help="Record the position page of config.yaml and --players profiles from the website "
+    "into this directory, then exit",
+)
+
+parser.add_argument(
+    "--json",
+    type=str,
+    default=None,
+    help="Also write the results (seconds, lower is better) to this .json file",
+)
+
+args = parser.parse_args()
+
+
+def bench_fetch_modes(server, position_path, page_list):
+    """
+    Times scrapePage for every fetch mode, and checks that all modes return the same rows
+    """
+    results = {}
+    frames = {}
+    for mode in ("serial", "thread", "asyncio"):
+        crawler = web_crawler(
+            url=server.base_url + position_path,
+            headers=None,
+            cookies=None,
+            fetch_mode=mode,
+            max_in_flight=args.max_in_flight,
+        )
+        start = time.perf_counter()
+        frames[mode] = crawler.scrapePage(page_list=page_list, save=False)
+        results[mode] = time.perf_counter() - start
+
+    for mode in ("thread", "asyncio"):
+        if not frames[mode].equals(frames["serial"]):
+            raise ValueError(f"Rows scraped in {mode} mode do not match serial mode")
+
+    return results
+
+
+def bench_links(server, position_path):
+    """
+    Times link discovery (download and parse of the position page)
+    """
+    crawler = web_crawler(
+        url=server.base_url + position_path, headers=None, cookies=None
+    )
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        crawler.getNameLinks(pop_index=False, save=False)
+    return (time.perf_counter() - start) / args.repeat
+
+
+def bench_concurrency(server, position_path, page_list):
+    """
+    Times a full-position scrape (fetch and parse, no output file) at every concurrency level
+    """
+    results = {}
+    for level in args.levels:
+        crawler = web_crawler(
+            url=server.base_url + position_path,
+            headers=None,
+            cookies=None,
+            fetch_mode="serial" if level == 1 else "thread",
+            max_in_flight=level,
+            parse_backend="lxml",
+        )
+        start = time.perf_counter()
+        crawler.scrapePage(page_list=page_list, save=False)
+        results[level] = time.perf_counter() - start
+    return results
+
+
+def bench_async(server, positions, page_list=None):
+    """
+    Times utils.async_utils.async_crawler scraping every position at once on one event loop, and
+    checks that its rows match web_crawler's. Returns the seconds of each
+    """
+    from utils.async_utils import async_crawler
+
+    frames = {}
+
+    async def scrape_all():
+        async with async_crawler(
+            base_url=server.base_url + "/position/",
+            max_in_flight=args.max_in_flight,
+        ) as crawler:
+            if page_list is not None:
+                frames[positions[0]] = await crawler.scrape(positions[0], page_list)
+            else:
+                frames.update(await crawler.scrape_positions(positions))
+
+    # The frames are not returned by the coroutine: on Python 3.11, asyncio.run formats the repr of
+    # its task (and so of the result) when it restores the SIGINT handler, which would be timed
+    start = time.perf_counter()
+    asyncio.run(scrape_all())
+    results = {"async_crawler": time.perf_counter() - start}
+
+    start = time.perf_counter()
+    for pos in positions:
+        crawler = web_crawler(
+            url=server.base_url + "/position/" + pos,
+            headers=None,
+            cookies=None,
+            fetch_mode="thread",
+            max_in_flight=args.max_in_flight,
+            parse_backend="lxml",
+        )
+        pos_links = page_list
+        if pos_links is None:
+            pos_links = crawler.getNameLinks(save=False)
+        df = crawler.scrapePage(page_list=pos_links, save=False)
+        if not df.equals(frames[pos]):
+            raise ValueError(f"Rows of async_crawler do not match web_crawler ({pos})")
+    results["web_crawler"] = time.perf_counter() - start
+
+    return results
+
+
+def bench_parse_backends(pages, pos="quarterback"):
+    """
+    Times the bs4 and lxml parser backends on the same pages, and checks that both
+    return exactly the same cards and rows
+    """
+    att_list = pos_dict(pos)
+    columns = [col for card in att_list for col in card]
+
+    for html in pages:
+        if extract_cards(html) != extract_cards_lxml(html):
+            raise ValueError("lxml backend cards do not match the bs4 backend")
+
+    results = {}
+    frames = {}
+    for backend in ("bs4", "lxml"):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            rows = [parse_profile(html, att_list, backend=backend) for html in pages]
+        results[backend] = (time.perf_counter() - start) / (args.repeat * len(pages))
+        frames[backend] = pd.DataFrame(rows, columns=columns)
+
+    if not frames["lxml"].equals(frames["bs4"]):
+        raise ValueError("lxml backend rows do not match the bs4 backend")
+
+    return results
+
+
+def legacy_convert_to_num(item, remove_chars=True):
+    """
+    convert_to_num before utils/convert_utils.py, kept as the reference of bench_converters
+    """
+    if remove_chars:
+        item = re.sub("[^\\d.]+", "", item)
+    if item.isdigit():
+        return int(item)
+    elif item.count(".") == 1:
+        return float(item)
+    else:
+        return np.nan
+
+
+def legacy_convert_inch_to_cm(item):
+    """
+    convert_inch_to_cm before utils/convert_utils.py, kept as the reference of bench_converters
+    """
+    item = re.sub("\\D", "", item)
+    try:
+        feet, inches = float(item[0]), float(item[1])
+    except:
+        return np.nan
+    return round((inches + feet * 12) * 2.54, 1)
+
+
+def bench_converters(pages):
+    """
+    Times the cached converters against the previous regex converters on every numeric card entry
+    of the pages, and checks that both return the same values. Returns the seconds per call of
+    each version
+    """
+    items = []
+    heights = []
+    for html in pages:
+        cards = extract_cards_lxml(html)
+        heights.append(cards["player"][0])
+        items += [cards["player"][1], cards["player"][5]]
+        items += cards["metrics"] + cards["key"] + cards["season"]
+
+    def same(a, b):
+        return a == b or (math.isnan(a) and math.isnan(b))
+
+    for item in items:
+        if not same(convert_to_num(item), legacy_convert_to_num(item)):
+            raise ValueError(
+                f"convert_to_num({item!r}) does not match the previous version"
+            )
+    for item in heights:
+        if not same(convert_inch_to_cm(item), legacy_convert_inch_to_cm(item)):
+            raise ValueError(
+                f"convert_inch_to_cm({item!r}) does not match the previous version"
+            )
+
+    results = {}
+    n_calls = args.repeat * (len(items) + len(heights))
+    for name, to_num, to_cm in (
+        ("regex", legacy_convert_to_num, legacy_convert_inch_to_cm),
+        ("cached", convert_to_num, convert_inch_to_cm),
+    ):
+        convert_to_num.cache_clear()
+        convert_inch_to_cm.cache_clear()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for item in items:
+                to_num(item)
+            for item in heights:
+                to_cm(item)
+        results[name] = (time.perf_counter() - start) / n_calls
+    return results
+
+
+def bench_season_rows(career_lengths=(5, 50, 500)):
+    """
+    Times parse_profile(seasons=True), the parse used by scrapePage with all_seasons, on profiles
+    with longer and longer careers, with each backend. Checks that the first season matches the
+    season card of the stats row, and that the seasons match season_rows (used for reused pages).
+    Returns, for each backend and career length, the time per season and the peak memory of the
+    parse
+    """
+    att_list = pos_dict("quarterback")
+    results = {}
+    for n_seasons in career_lengths:
+        html = make_profile(0, n_seasons=n_seasons)
+        expected = list(season_rows(html, "Player 0"))
+        if len(expected) != n_seasons:
+            raise ValueError(f"Read {len(expected)} season rows, expected {n_seasons}")
+
+        for backend in ("bs4", "lxml"):
+            tracemalloc.start()
+            start = time.perf_counter()
+            row, seasons = parse_profile(html, att_list, backend=backend, seasons=True)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            if list(seasons[0][2:]) != list(row[-8:]):
+                raise ValueError("First season row does not match the season card")
+            if seasons != expected:
+                raise ValueError(f"parse_profile({backend}) reads different seasons")
+            results[backend, n_seasons] = (seconds / n_seasons, peak / len(html))
+
+    return results
+
+
+def record():
+    """
+    Records real pages for --fixtures, using the headers and rate limit of config.yaml
+    """
+    import yaml
+
+    with open("utils/config.yaml", "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    pos = config["profile_options"]["pos"]
+    if not isinstance(pos, str) or pos == "all":
+        raise ValueError('Set "pos" in config.yaml to the one position to record')
+
+    crawler = web_crawler(
+        url="https://www.playerprofiler.com/position/" + pos,
+        headers=config["urlParams"]["headers"],
+        cookies=None,
+        rate_limit_options=config["rate_limit"],
+    )
+    index = record_fixtures(crawler, args.record, n_players=args.players)
+    print(f"Recorded {len(index['pages'])} pages in {args.record}")
+
+
+def main():
+
+    if args.record:
+        record()
+        return
+
+    if args.fixtures:
+        index, pages = load_fixtures(args.fixtures)
+        pos, position_path = index["position"], index["position_path"]
+        print(f"Recorded pages from {index['source']} ({index['recorded']})")
+    else:
+        pages = {}
+        pos, position_path = "quarterback", "/position/quarterback"
+
+    results = {}
+
+    with fixture_server(
+        n_players=args.players, latency=args.latency, pages=pages
+    ) as server:
+        crawler = web_crawler(
+            url=server.base_url + position_path, headers=None, cookies=None
+        )
+        page_list = crawler.getNameLinks(pop_index=False, save=False)
+        if pages:
+            # Only the recorded profiles can be served
+            page_list = [
+                url for url in page_list if urlsplit(url).path.rstrip("/") in pages
+            ]
+        profiles = [server.render(urlsplit(url).path) for url in page_list]
+
+        seconds = bench_links(server, position_path)
+        results["links.seconds"] = seconds
+        print(f"Link discovery: {seconds * 1000:7.3f}ms per position page")
+
+        fetch = bench_fetch_modes(server, position_path, page_list)
+        print(f"\n{len(page_list)} profiles, {args.latency}s latency per request")
+        for mode, seconds in fetch.items():
+            results[f"fetch.{mode}.seconds"] = seconds
+            print(
+                f"{mode:>8}: {seconds:7.3f}s  ({fetch['serial'] / seconds:5.1f}x vs serial)"
+            )
+
+        scrape = bench_concurrency(server, position_path, page_list)
+        print("\nFull-position scrape (lxml backend) by max_in_flight")
+        for level, seconds in scrape.items():
+            results[f"scrape.in_flight_{level}.seconds"] = seconds
+            print(
+                f"{level:>8}: {seconds:7.3f}s  ({scrape[args.levels[0]] / seconds:5.1f}x vs {args.levels[0]})"
+            )
+
+        # Only the recorded position is served
+        async_positions = [pos] if pages else POSITIONS
+        scraped = bench_async(server, async_positions, page_list if pages else None)
+        print(
+            f"\n{len(async_positions)} positions, "
+            "async_crawler on one event loop vs web_crawler one position at a time (rows match)"
+        )
+        for name, seconds in scraped.items():
+            results[f"async.{name}.seconds"] = seconds
+            print(
+                f"{name:>14}: {seconds:7.3f}s  ({scraped['web_crawler'] / seconds:5.1f}x vs web_crawler)"
+            )
+
+    parse = bench_parse_backends(profiles, pos)
+
+    print(
+        f"\nParsing {len(profiles)} profiles x {args.repeat} (rows match across backends)"
+    )
+    for backend, seconds in parse.items():
+        results[f"parse.{backend}.seconds_per_page"] = seconds
+        print(
+            f"{backend:>8}: {seconds * 1000:7.3f}ms/page  ({parse['bs4'] / seconds:5.1f}x vs bs4)"
+        )
+
+    converters = bench_converters(profiles)
+
+    print(f"\nConverters x {args.repeat} (values match the previous version)")
+    for name, seconds in converters.items():
+        results[f"convert.{name}.seconds_per_call"] = seconds
+        print(
+            f"{name:>8}: {seconds * 1e6:7.3f}us/call  ({converters['regex'] / seconds:5.1f}x vs regex)"
+        )
+
+    seasons = bench_season_rows()
+
+    print("\nparse_profile with every season (first row matches the season card)")
+    for (backend, n_seasons), (seconds, memory) in seasons.items():
+        results[f"seasons.{backend}.{n_seasons}.seconds_per_season"] = seconds
+        print(
+            f"{backend:>8} {n_seasons:>4} seasons: {seconds * 1e6:7.1f}us/season  peak memory {memory:5.2f}x page size"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    log_to_file("scraping.log")
+    main()
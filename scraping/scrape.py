@@ -1,6 +1,24 @@
-from utils.scrape_utils import web_crawler
+from utils.scrape_utils import web_crawler, log_to_file
+from utils.schedule_utils import resolve_positions, make_crawlers, scrape_positions
+from utils.metrics_utils import profiled
+import argparse
 import yaml
 
+parser = argparse.ArgumentParser(
+    description="Scrape player profiles from www.playerprofiler.com",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+
+parser.add_argument(
+    "--resume",
+    "-r",
+    action="store_true",
+    default=False,
+    help="Continue an interrupted run, skipping the players recorded in its checkpoint file",
+)
+
+args = parser.parse_args()
+
 ## Call items from configuration yaml file
 with open("utils/config.yaml", "r") as f:
     try:
@@ -10,8 +28,8 @@ with open("utils/config.yaml", "r") as f:
 
 
 # Setting config parameters
-# Position setting
-pos = config["profile_options"]["pos"]
+# Position setting (one position, a list of positions, or 'all')
+positions = resolve_positions(config["profile_options"]["pos"])
 
 # Headers and cookies setting
 headers = config["urlParams"]["headers"]
@@ -20,29 +38,134 @@ cookies = config["urlParams"]["cookies"]
 # Popularity Index flag
 pop_index = config["profile_options"]["pop_index"]
 
+# Order of the player links: 'page', or 'priority' (new players, then by popularity index)
+link_order = config["profile_options"]["link_order"]
+
+# Long-format file of every season
+all_seasons = config["profile_options"]["all_seasons"]
+
+
+# Fetch mode for player profiles
+fetch_mode = config["fetch"]["mode"]
+max_in_flight = config["fetch"]["max_in_flight"]
+
+# Html extraction backend
+parse_backend = config["parse"]["backend"]
+parse_workers = config["parse"]["workers"]
+queue_depth = config["parse"]["queue_depth"]
+
+# HTTP transport options (pool size, timeouts, retries)
+transport_options = config["transport"]
+
+# Token-bucket rate limiter options
+rate_limit_options = config["rate_limit"]
+
+# On-disk response cache options
+cache_options = config["cache"]
+
+# Rows buffered before they are appended to the output file
+batch_size = config["output"]["batch_size"]
+output_format = config["output"]["format"]
+
+# SQLite store of every scrape
+snapshot_options = config["snapshots"]
+
+# Priority queue and budget
+queue_options = config["queue"]
+
+# Structural check of the profile pages
+fingerprint_options = config["fingerprint"]
+
+# Per-stage metrics, and the optional profiler of the whole run
+metrics_options = dict(config["metrics"])
+profiler = metrics_options.pop("profiler", None)
 
 # Scrape links again
 scrape_link_bool = config["scrape_links"]
 
+# Only parse players whose page changed
+incremental = config["incremental"]
 
-URL = f"https://www.playerprofiler.com/position/{pos}"
+
+BASE_URL = "https://www.playerprofiler.com/position/"
 
 
 def main():
 
+    if len(positions) > 1:
+        # Scrape every position in one run, through a shared scheduler
+        crawlers = make_crawlers(
+            positions,
+            BASE_URL,
+            headers=headers,
+            cookies=None,
+            fetch_mode=fetch_mode,
+            max_in_flight=max_in_flight,
+            transport_options=transport_options,
+            rate_limit_options=rate_limit_options,
+            cache_options=cache_options,
+            parse_backend=parse_backend,
+            parse_workers=parse_workers,
+            queue_depth=queue_depth,
+            batch_size=batch_size,
+            output_format=output_format,
+            all_seasons=all_seasons,
+            snapshot_options=snapshot_options,
+            metrics_options=metrics_options,
+            queue_options=queue_options,
+            fingerprint_options=fingerprint_options,
+        )
+        scrape_positions(
+            crawlers,
+            max_in_flight=max_in_flight,
+            pop_index=pop_index,
+            scrape_links=scrape_link_bool,
+            link_order=link_order,
+            incremental=incremental,
+            resume=args.resume,
+        )
+        print("Finished")
+        return
+
     # Initialize instance for web crawler
-    auto_web = web_crawler(url=URL, headers=headers, cookies=None)
+    auto_web = web_crawler(
+        url=BASE_URL + positions[0],
+        headers=headers,
+        cookies=None,
+        fetch_mode=fetch_mode,
+        max_in_flight=max_in_flight,
+        transport_options=transport_options,
+        rate_limit_options=rate_limit_options,
+        cache_options=cache_options,
+        parse_backend=parse_backend,
+        parse_workers=parse_workers,
+        queue_depth=queue_depth,
+        batch_size=batch_size,
+        output_format=output_format,
+        all_seasons=all_seasons,
+        snapshot_options=snapshot_options,
+        metrics_options=metrics_options,
+        queue_options=queue_options,
+        fingerprint_options=fingerprint_options,
+    )
 
     # Determine the links for all players on playerprofiler.com
     page_links = auto_web.getNameLinks(
-        pop_index=pop_index, save=True, scrape_links=scrape_link_bool
+        pop_index=pop_index,
+        save=True,
+        scrape_links=scrape_link_bool,
+        order=link_order,
     )
 
     # Retreive all the car links on a given page
-    auto_web.scrapePage(page_list=page_links)
+    auto_web.scrapePage(
+        page_list=page_links, incremental=incremental, resume=args.resume
+    )
 
     print("Finished")
 
 
 if __name__ == "__main__":
-    main()
+    log_to_file("scraping.log")
+    with profiled(profiler, "scraped_data/profile"):
+        main()
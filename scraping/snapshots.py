@@ -0,0 +1,89 @@
+from utils.att_list_headings import att_list_qb, att_list_rb, att_list_wr, att_list_te
+from utils.snapshot_utils import snapshot_store
+import argparse
+import pandas as pd
+
+parser = argparse.ArgumentParser(
+    description="Query the snapshot store of scraped stats files",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+
+parser.add_argument(
+    "--db",
+    type=str,
+    default="scraped_data/snapshots.db",
+    help="The snapshot database",
+)
+
+parser.add_argument(
+    "--out",
+    "-o",
+    type=str,
+    default=None,
+    help="Save the result to this .csv file instead of printing it",
+)
+
+commands = parser.add_subparsers(dest="command", required=True)
+
+ingest = commands.add_parser(
+    "ingest", help="Add the stats files of a directory that are not stored yet"
+)
+ingest.add_argument("--path", type=str, default="scraped_data/")
+
+commands.add_parser("list", help="List the stored snapshots")
+
+history = commands.add_parser("history", help="A player's stats over time")
+history.add_argument("--position", "-p", type=str, required=True)
+history.add_argument("--name", "-n", type=str, required=True)
+history.add_argument(
+    "--columns", "-c", type=str, nargs="+", default=None, help="e.g. fantasy-ppg"
+)
+history.add_argument("--start", type=str, default=None, help="YYYY-MM-DD")
+history.add_argument("--end", type=str, default=None, help="YYYY-MM-DD")
+
+as_of = commands.add_parser(
+    "as-of",
+    help="All players of a position, from the latest snapshot on or before a date",
+)
+as_of.add_argument("--position", "-p", type=str, required=True)
+as_of.add_argument(
+    "--date", "-d", type=str, default=None, help="YYYY-MM-DD (default = latest)"
+)
+as_of.add_argument("--columns", "-c", type=str, nargs="+", default=None)
+
+args = parser.parse_args()
+
+POS_LISTS = {
+    "quarterback": att_list_qb,
+    "running-back": att_list_rb,
+    "wide-receiver": att_list_wr,
+    "tight-end": att_list_te,
+}
+
+
+def main():
+
+    store = snapshot_store(args.db)
+
+    if args.command == "ingest":
+        files = store.ingest_dir(args.path, POS_LISTS)
+        print(f"Ingested {len(files)} files")
+        return
+    elif args.command == "list":
+        df = store.snapshots()
+    elif args.command == "history":
+        df = store.history(
+            args.position, args.name, args.columns, start=args.start, end=args.end
+        )
+    else:
+        df = store.as_of(args.position, args.date, args.columns)
+
+    if args.out:
+        df.to_csv(args.out, index=False)
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", None):
+            print(df)
+
+
+if __name__ == "__main__":
+    main()
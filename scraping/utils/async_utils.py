@@ -0,0 +1,352 @@
+"""
+nfl-web-scraping.utils.async_utils
+~~~~~~~~~~~~~~
+This module provides async_crawler, an asyncio sibling of web_crawler for services that run their
+own event loop. Pages are downloaded with aiohttp, every option is an argument (config.yaml is not
+read), and parsed rows are handed back through an async iterator, so several positions can be
+scraped at once on one event loop, without threads.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+import pandas as pd
+
+from utils.http_utils import RETRY_STATUS, backoff_delay, retry_after_delay
+from utils.links_utils import parse_links
+from utils.metrics_utils import stage_metrics
+from utils.ratelimit_utils import token_bucket
+from utils.schedule_utils import POSITIONS
+from utils.scrape_utils import pos_dict, pos_plan, parse_profile
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://www.playerprofiler.com/position/"
+
+
+class async_crawler:
+    """
+    async_crawler scrapes player profiles from https://www.playerprofiler.com on an asyncio event
+    loop. One aiohttp session, one cap on requests in flight and one rate limiter are shared by
+    every position scraped with the same crawler.
+
+    Parameters
+    ----------
+    headers (dict): The headers sent with every request (user agent). default = None
+    cookies (dict): The cookies sent with every request. default = None
+    base_url (str): The url of a position page, without the position (default = BASE_URL)
+    max_in_flight (int): The maximum number of requests running at once, across every position
+                         (default = 8)
+    parse_backend (str): 'lxml' (precompiled XPath) or 'bs4' (BeautifulSoup). default = 'lxml'
+    parse_workers (int): Number of processes parsing pages. 0 parses in one thread instead. Either
+                         way, parsing runs off the event loop, so it does not hold up the downloads.
+                         default = None (one process per core but one, or a thread on one core)
+    pool_size (int): The maximum number of connections kept open. default = 10
+    connect_timeout (float): Seconds to wait for a connection to the server
+    read_timeout (float): Seconds to wait for the server to send data
+    max_retries (int): How many times a request is retried on a connection error, timeout,
+                       429 or 5xx response
+    backoff_factor (float): Base delay (seconds) of the exponential backoff between retries
+    backoff_max (float): The longest delay (seconds) between two retries
+    rate_limit_options (dict): Options for the token-bucket rate limiter (enabled, rate, burst,
+                               adaptive...), as in config.yaml. default = None (no limit)
+    metrics (stage_metrics): Optional. Records request times, sizes, retries and parsed rows
+
+    Returns
+    --------
+    get_page: Returns the raw html text of a url, or None
+    get_links: Returns the player profile links of a position
+    rows: Async iterator of (url, row) for every player of a position
+    scrape: Returns a dataframe of every player of a position
+    scrape_positions: Scrapes several positions at once, returns a dataframe per position
+
+    Notes
+    -----
+    Use it as an async context manager, which opens and closes the aiohttp session:
+
+        async with async_crawler(headers=headers) as crawler:
+            links = await crawler.get_links("quarterback")
+            async for url, row in crawler.rows("quarterback", links):
+                ...
+
+    The response cache, the output files, the snapshot store and the priority queue are only used
+    by web_crawler.
+    """
+
+    def __init__(
+        self,
+        headers=None,
+        cookies=None,
+        base_url=BASE_URL,
+        max_in_flight=8,
+        parse_backend="lxml",
+        parse_workers=None,
+        pool_size=10,
+        connect_timeout=5,
+        read_timeout=30,
+        max_retries=3,
+        backoff_factor=0.5,
+        backoff_max=30,
+        rate_limit_options=None,
+        metrics=None,
+    ):
+        self.headers = headers
+        self.cookies = cookies
+        self.base_url = base_url.rstrip("/") + "/"
+        self.max_in_flight = max_in_flight
+        self.parse_backend = parse_backend
+        if parse_workers is None:
+            parse_workers = max((os.cpu_count() or 1) - 1, 0)
+        self.parse_workers = parse_workers
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.metrics = metrics or stage_metrics(enabled=False)
+
+        rate_limit_options = dict(rate_limit_options or {})
+        if rate_limit_options.pop("enabled", False):
+            self.rate_limiter = token_bucket(**rate_limit_options)
+        else:
+            self.rate_limiter = None
+
+        # Created on the running event loop, by __aenter__
+        self.session = None
+        self.semaphore = None
+        self.parse_executor = None
+
+    def __repr__(self):
+        return f"async_crawler({self.base_url}, max_in_flight={self.max_in_flight})"
+
+    async def __aenter__(self):
+        if self.parse_workers > 0:
+            self.parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+            # Start the workers now, before the session opens any thread (DNS lookups)
+            await asyncio.get_running_loop().run_in_executor(self.parse_executor, int)
+        else:
+            self.parse_executor = ThreadPoolExecutor(max_workers=1)
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            cookies=self.cookies,
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            timeout=self.timeout,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.session.close()
+        self.session = None
+        self.parse_executor.shutdown(cancel_futures=True)
+        self.parse_executor = None
+
+    async def throttle(self):
+        """
+        Waits for a token from the rate limiter, without blocking the event loop. Returns the
+        seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            delay = self.rate_limiter.reserve(waited)
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    async def get_page(self, url):
+        """
+        Downloads a page, retrying on connection errors, timeouts, 429 and 5xx responses
+
+        Parameters
+        ----------
+        url (str): The url to request
+
+        Returns
+        --------
+        text (str): The html text of the page, or None if the page could not be accessed
+        """
+        if self.session is None:
+            raise RuntimeError("Use async_crawler as 'async with async_crawler(...)'")
+
+        async with self.semaphore:
+            with self.metrics.timer("fetch.page_seconds"):
+                return await self._get_page(url)
+
+    async def _get_page(self, url):
+        """
+        Sends the requests of get_page, which caps and times them
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.metrics.observe("http.throttle_seconds", await self.throttle())
+            try:
+                start = time.perf_counter()
+                async with self.session.get(url) as resp:
+                    ttfb = time.perf_counter() - start
+                    body = await resp.read()
+                    download = time.perf_counter() - start - ttfb
+                    status = resp.status
+                    retry_after = resp.headers.get("Retry-After")
+                    text = await resp.text() if status == 200 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.inc("http.errors")
+                if attempt == self.max_retries:
+                    logger.error(f"Could not access page {url}: {e!r}")
+                    return None
+                delay = backoff_delay(attempt, self.backoff_factor, self.backoff_max)
+                logger.warning(f"{type(e).__name__} on {url}, retrying in {delay:.2f}s")
+            else:
+                self.metrics.inc("http.requests")
+                self.metrics.inc(f"http.status_{status}")
+                self.metrics.observe("http.ttfb_seconds", ttfb)
+                self.metrics.observe("http.download_seconds", download)
+                self.metrics.observe("http.response_bytes", len(body))
+                if self.rate_limiter is not None:
+                    self.rate_limiter.feedback(status, ttfb)
+                if status == 200:
+                    return text
+                if status not in RETRY_STATUS or attempt == self.max_retries:
+                    logger.error(
+                        f"Reqeust code is not [200] ({status}). Could not access page {url}"
+                    )
+                    return None
+                delay = retry_after_delay(retry_after, self.backoff_max)
+                if delay is None:
+                    delay = backoff_delay(
+                        attempt, self.backoff_factor, self.backoff_max
+                    )
+                logger.warning(
+                    f"Request code [{status}] on {url}, retrying in {delay:.2f}s"
+                )
+            self.metrics.inc("http.retries")
+            await asyncio.sleep(delay)
+
+    async def get_links(self, pos, pop_index=True):
+        """
+        Retrieves the links of every player of a position
+
+        Parameters
+        ----------
+        pos (str): One of ['quarterback', 'running-back', 'wide-receiver', 'tight-end']
+        pop_index (bool): Leave out the players without a popularity index
+
+        Returns
+        --------
+        name_links (list): The profile links, in the order of the position page
+        """
+        if pos not in POSITIONS:
+            raise ValueError(f"The position must be one of {POSITIONS}, not {pos}")
+
+        html = await self.get_page(self.base_url + pos)
+        if html is None:
+            raise ValueError(
+                f"Could not download the position page {self.base_url + pos}"
+            )
+        name_links = list(parse_links(html, pop_index=pop_index))
+        logger.info(f"Retrieved {len(name_links)} players from {pos} position")
+        return name_links
+
+    def columns(self, pos):
+        """
+        Returns the column names of the rows of a position
+        """
+        return list(pos_plan(pos).columns)
+
+    async def rows(self, pos, page_list=None, ordered=False):
+        """
+        Downloads and parses the profile of every player of a position
+
+        Parameters
+        ----------
+        pos (str): One of ['quarterback', 'running-back', 'wide-receiver', 'tight-end']
+        page_list (list): The profile links to scrape. default = None (every link from get_links)
+        ordered (bool): Yield the rows in page_list order, instead of as soon as they are parsed
+
+        Returns
+        --------
+        async generator: Yields (url, row) for each player, with row in the order of columns(pos).
+                         Pages that could not be downloaded are left out
+
+        Notes
+        -----
+        At most max_in_flight pages of a position are downloading or being parsed at once, so
+        memory stays bounded whatever the list size. Pages are parsed in parse_executor, so the
+        event loop keeps serving the other downloads meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        parse_fn = partial(
+            parse_profile,
+            att_list=pos_dict(pos),
+            backend=self.parse_backend,
+            plan=pos_plan(pos),
+        )
+        if page_list is None:
+            page_list = await self.get_links(pos)
+
+        async def scrape_page(url):
+            html = await self.get_page(url)
+            if html is None:
+                return None
+            with self.metrics.timer("parse.page_seconds"):
+                return await loop.run_in_executor(self.parse_executor, parse_fn, html)
+
+        pages = iter(page_list)
+        # Task -> url, in page_list order
+        tasks = {}
+
+        def refill():
+            for url in islice(pages, self.max_in_flight - len(tasks)):
+                tasks[asyncio.ensure_future(scrape_page(url))] = url
+
+        refill()
+        try:
+            while tasks:
+                if ordered:
+                    done = [next(iter(tasks))]
+                    await asyncio.wait(done)
+                else:
+                    finished, _ = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    done = [task for task in tasks if task in finished]
+
+                for task in done:
+                    url = tasks.pop(task)
+                    row = task.result()
+                    if row is None:
+                        logger.error(f"Skipping {url}, page could not be downloaded")
+                        self.metrics.inc("rows.skipped")
+                        continue
+                    self.metrics.inc("rows.parsed")
+                    yield url, row
+                refill()
+        finally:
+            # The caller stopped early (or a page failed to parse)
+            for task in tasks:
+                task.cancel()
+
+    async def scrape(self, pos, page_list=None):
+        """
+        Returns a dataframe of every player of a position, in page_list order (see rows)
+        """
+        rows = [row async for url, row in self.rows(pos, page_list, ordered=True)]
+        return pd.DataFrame(rows, columns=self.columns(pos))
+
+    async def scrape_positions(self, positions=POSITIONS):
+        """
+        Scrapes several positions at once on the event loop. Their requests share max_in_flight
+
+        Returns
+        --------
+        results (dict): The dataframe of each position
+        """
+        frames = await asyncio.gather(*[self.scrape(pos) for pos in positions])
+        return dict(zip(positions, frames))
@@ -68,4 +68,7 @@ att_list_te = [
     ],
 ]
 
+# Columns that are scraped as text, for every position. All other columns are numeric
+att_text_columns = ["name", "position", "team", "draft", "college"]
+
 ### Scraping commands ###
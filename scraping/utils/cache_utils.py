@@ -0,0 +1,255 @@
+"""
+nfl-web-scraping.utils.cache_utils
+~~~~~~~~~~~~~~
+This module provides an on-disk cache of raw html pages, used by web_crawler.getPage to avoid
+downloading player profiles that have not changed since the last run.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class response_cache:
+    """
+    response_cache stores page bodies on disk, keyed by url.
+
+    Bodies are gzip compressed and content-addressed (named by the sha256 of the html), so players
+    with identical pages share one file. An sqlite index maps every url to its body, along with
+    the `ETag` / `Last-Modified` validators sent by the server and the fetch/access times.
+
+    Parameters
+    ----------
+    path (str): The directory holding the cache. default = scraped_data/cache/
+    ttl (float): Seconds a cached page is used without asking the server. Once expired, the page
+                 is revalidated with If-None-Match / If-Modified-Since
+    max_size_mb (float): Size cap of the stored bodies. The least recently used pages are evicted
+                         once the cap is passed
+    offline (bool): Replay mode. Pages are only served from the cache, the server is never contacted
+
+    Notes
+    -----
+    The cache is safe to share between the threads of one crawler. The size of the stored bodies is
+    summed once when the cache is opened, then kept up to date as pages are stored and dropped, so
+    storing a page does not scan the index.
+    """
+
+    def __init__(
+        self, path="scraped_data/cache/", ttl=86400, max_size_mb=500, offline=False
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size_mb * 1024 * 1024
+        self.offline = offline
+
+        self.object_path = os.path.join(self.path, "objects")
+        os.makedirs(self.object_path, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(self.path, "index.sqlite"), check_same_thread=False
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_lru ON pages (accessed_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)")
+        self.db.commit()
+
+        # Bytes of the stored bodies, counting every shared body once
+        self.total = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)"
+        ).fetchone()[0]
+
+    def __repr__(self):
+        return f"response_cache({self.path}, ttl={self.ttl}, offline={self.offline})"
+
+    def get(self, url):
+        """
+        Returns the index entry of a url as a dictionary, or None if the url is not cached
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT digest, size, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["digest", "size", "etag", "last_modified", "fetched_at"], row))
+
+    def is_fresh(self, entry):
+        """
+        Checks whether a cached entry is younger than the ttl
+        """
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        """
+        Returns the If-None-Match / If-Modified-Since headers to revalidate a cached entry
+        """
+        headers = {}
+        if entry is None:
+            return headers
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, url, entry, revalidated=False):
+        """
+        Reads the cached html of a url, and marks it as recently used
+
+        Parameters
+        ----------
+        url (str): The url of the page
+        entry (dict): The index entry returned by get()
+        revalidated (bool): Whether the server just confirmed the page is unchanged (304),
+                            which restarts its ttl
+
+        Returns
+        --------
+        str: The html text, or None if the body file is missing
+        """
+        try:
+            with gzip.open(
+                self.body_path(entry["digest"]), "rt", encoding="utf-8"
+            ) as f:
+                text = f.read()
+        except OSError:
+            logger.warning(f"Cached body for {url} is missing, dropping entry")
+            with self.lock:
+                self.drop(url)
+                self.db.commit()
+            return None
+
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.db.execute(
+                    "UPDATE pages SET accessed_at = ?, fetched_at = ? WHERE url = ?",
+                    (now, now, url),
+                )
+            else:
+                self.db.execute(
+                    "UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+            self.db.commit()
+        return text
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """
+        Stores the html of a url, along with the validators sent by the server
+
+        Parameters
+        ----------
+        url (str): The url of the page
+        text (str): The html text of the page
+        etag (str): The `ETag` response header
+        last_modified (str): The `Last-Modified` response header
+        """
+        body = text.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.body_path(digest)
+
+        if not os.path.exists(path):
+            # Write to a temporary file first, so a crash never leaves a truncated body
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        now = time.time()
+        with self.lock:
+            previous = self.db.execute(
+                "SELECT digest FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if previous is None or previous[0] != digest:
+                if previous is not None:
+                    self.drop(url)
+                if not self.in_use(digest):
+                    self.total += size
+            self.db.execute(
+                "REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, size, etag, last_modified, now, now),
+            )
+            self.db.commit()
+        if self.total > self.max_size:
+            self.evict()
+
+    def evict(self, batch=64):
+        """
+        Removes the least recently used pages until the stored bodies fit within max_size_mb
+        """
+        with self.lock:
+            while self.total > self.max_size:
+                oldest = self.db.execute(
+                    "SELECT url FROM pages ORDER BY accessed_at LIMIT ?", (batch,)
+                ).fetchall()
+                if not oldest:
+                    break
+                for (url,) in oldest:
+                    if self.total <= self.max_size:
+                        break
+                    self.drop(url)
+            self.db.commit()
+            total = self.total
+        logger.info(f"Evicted cache down to {total / 1024 / 1024:.1f} MB")
+
+    def drop(self, url):
+        """
+        Removes the index entry of a url, and its body once no other url shares it. The caller holds
+        the lock and commits
+        """
+        row = self.db.execute(
+            "SELECT digest, size FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return
+        digest, size = row
+        self.db.execute("DELETE FROM pages WHERE url = ?", (url,))
+        # Bodies are shared between urls, only delete the file once nothing uses it
+        if not self.in_use(digest):
+            self.total -= size
+            try:
+                os.remove(self.body_path(digest))
+            except OSError:
+                pass
+
+    def in_use(self, digest):
+        """
+        Checks whether any url of the index points to a body
+        """
+        return (
+            self.db.execute(
+                "SELECT 1 FROM pages WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            is not None
+        )
+
+    def body_path(self, digest):
+        """
+        Returns the file path of a compressed body
+        """
+        return os.path.join(self.object_path, digest + ".gz")
+
+    def close(self):
+        """
+        Closes the sqlite index
+        """
+        with self.lock:
+            self.db.close()
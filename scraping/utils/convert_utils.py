@@ -0,0 +1,66 @@
+"""
+nfl-web-scraping.utils.convert_utils
+~~~~~~~~~~~~~~
+This module provides the value converters of the web crawler, which turn the raw text of a card
+(e.g. "215 lbs", "6' 2\"", "-") into numbers. Patterns are compiled once, clean numbers skip the
+regex entirely, and results are cached, since the same raw strings repeat across players.
+"""
+from functools import lru_cache
+import re
+
+import numpy as np
+
+# Everything that is not a digit or a dot
+NON_NUMERIC = re.compile(r"[^\d.]+")
+# Everything that is not a digit
+NON_DIGIT = re.compile(r"\D")
+
+# Number of distinct raw strings remembered by each converter
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def convert_to_num(item, remove_chars=True):
+    """
+    A function to convert string entries to integers from the player profiler website
+
+    Parameters
+    ----------
+    item (str): The raw text (e.g. "215 lbs", "4.52s", "-")
+    remove_chars (bool): Remove every character that is not a digit or a dot first
+
+    Returns
+    --------
+    int, float or np.nan: An int for whole numbers, a float for decimals, NaN otherwise
+    """
+    # Clean ascii numbers ("215", "4.52") are left unchanged by the regex, so it is skipped
+    if remove_chars and not (
+        type(item) is str and item.isascii() and item.replace(".", "", 1).isdigit()
+    ):
+        item = NON_NUMERIC.sub("", item)
+
+    if item.isdigit():
+        return int(item)
+    elif item.count(".") == 1:
+        return float(item)
+    else:
+        return np.nan
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def convert_inch_to_cm(item):
+    """
+    A function to convert inches to centimeters for height on the website ("6' 2\"" -> 188.0)
+    """
+
+    item = NON_DIGIT.sub("", item)
+    try:
+        feet, inches = float(item[0]), float(item[1])
+    except:
+        return np.nan
+
+    inches += feet * 12
+
+    cm = round(inches * 2.54, 1)
+
+    return cm
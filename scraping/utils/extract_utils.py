@@ -0,0 +1,166 @@
+"""
+nfl-web-scraping.utils.extract_utils
+~~~~~~~~~~~~~~
+This module provides a fast html extraction backend for player profile pages. Instead of building a
+BeautifulSoup tree and searching it with find/find_all, it parses the page with lxml.etree and reads
+each card with a precompiled XPath expression.
+"""
+from contextlib import nullcontext
+from lxml import etree
+import io
+
+
+def class_xpath(tag, tag_class):
+    """
+    Returns an XPath step matching a tag whose class attribute is exactly tag_class.
+    This is how BeautifulSoup matches a multi-token class string such as "leading-none whitespace-nowrap"
+    """
+    return f'{tag}[normalize-space(@class)="{tag_class}"]'
+
+
+# Precompiled selectors, one per card
+TITLE_CARD = etree.XPath("(//" + class_xpath("div", "flex-1 md:space-y-1") + ")[1]")
+TITLE_NAME = etree.XPath("(.//h1)[1]")
+TITLE_POSITION = etree.XPath(
+    "(.//"
+    + class_xpath("div", "leading-none text-xl md:text-2xl -mb-px md:mb-0")
+    + ")[1]"
+)
+TITLE_TEAM = etree.XPath(
+    "(.//" + class_xpath("a", "text-blue-light hover:underline") + ")[1]"
+)
+PLAYER_CARD = etree.XPath("//" + class_xpath("span", "leading-none whitespace-nowrap"))
+METRICS_CARD = etree.XPath(
+    "//" + class_xpath("span", "block font-light text-xs sm:text-sm leading-none")
+)
+KEY_CARD = etree.XPath('(//section[@id="key-stats"])[1]//span')
+SEASON_ROW_CLASS = "border-t border-solid border-gray-700"
+SEASON_ROW = etree.XPath("(//" + class_xpath("tr", SEASON_ROW_CLASS) + ")[1]")
+SEASON_ROWS = etree.XPath("//" + class_xpath("tr", SEASON_ROW_CLASS))
+SEASON_CARD = etree.XPath(".//" + class_xpath("span", "text-xxs md:text-base"))
+TEXT = etree.XPath("string()")
+
+HTML_PARSER = etree.HTMLParser()
+
+
+def first_text(node, xpath):
+    """
+    Returns the text of the first match of an XPath under node, or "NaN" if there is no match.
+    Same behaviour as scrape_utils.get_text_exist
+    """
+    item = xpath(node)
+    if item:
+        return TEXT(item[0])
+    return "NaN"
+
+
+def all_text(node, xpath):
+    """
+    Returns the text of every match of an XPath under node, in document order.
+    Same behaviour as scrape_utils.get_card
+    """
+    return [TEXT(item) for item in xpath(node)]
+
+
+def extract_cards_lxml(html, metrics=None, seasons=False):
+    """
+    Finds the raw text of the five cards on a player profile page, using lxml.etree
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+    metrics (stage_metrics): Optional. Records the time spent building the tree and reading each card
+    seasons (bool): Also read every row of the season stats table, as 'seasons'
+
+    Returns
+    --------
+    cards (dict): The text entries of the 'title', 'player', 'metrics', 'key' and 'season' cards,
+                  and with seasons, the cells of every season row ('seasons'). Identical to
+                  scrape_utils.extract_cards
+    """
+    timer = metrics.timer if metrics is not None else lambda name: nullcontext()
+
+    with timer("parse.tree_seconds"):
+        try:
+            root = etree.fromstring(html, HTML_PARSER)
+        except ValueError:
+            # lxml refuses str input that carries an encoding declaration
+            root = etree.fromstring(html.encode("utf-8"), HTML_PARSER)
+
+    # Title card (top part of the card): Name, position, team.
+    with timer("parse.title_seconds"):
+        card = TITLE_CARD(root)
+        if not card:
+            raise AttributeError("Title card is missing from the profile page")
+        card = card[0]
+        title_card = [
+            first_text(card, TITLE_NAME),
+            first_text(card, TITLE_POSITION),
+            first_text(card, TITLE_TEAM),
+        ]
+
+    # Player card (top left hand side): Height, weight, draft, college, age
+    with timer("parse.player_seconds"):
+        player_card = all_text(root, PLAYER_CARD)
+
+    # Metrics card: 40, speed, burst, agility, bench
+    with timer("parse.metrics_seconds"):
+        metrics_card = all_text(root, METRICS_CARD)
+
+    # College stats card, without the (rank) entries
+    with timer("parse.college_seconds"):
+        key_card = [x for x in all_text(root, KEY_CARD) if "(" not in x]
+
+    # Season stats card: latest season only
+    with timer("parse.season_seconds"):
+        szn_row = SEASON_ROW(root)
+        if szn_row:
+            szn_card = all_text(szn_row[0], SEASON_CARD)
+        else:
+            # If there is no 2022 stats, fill szn_card with nan
+            szn_card = ["NaN"] * 9
+
+    cards = {
+        "title": title_card,
+        "player": player_card,
+        "metrics": metrics_card,
+        "key": key_card,
+        "season": szn_card,
+    }
+
+    # Every season, from the same tree
+    if seasons:
+        with timer("parse.seasons_seconds"):
+            cards["seasons"] = [all_text(row, SEASON_CARD) for row in SEASON_ROWS(root)]
+    return cards
+
+
+def iter_season_cards(html):
+    """
+    Yields the raw text of every row of the season stats table on a player profile page, one
+    season at a time, most recent first. Used for pages that are not parsed (see
+    scrape_utils.season_rows); parsed pages read their seasons with extract_cards_lxml
+
+    The page is read with lxml.etree.iterparse, stopping at each table row. A row is read as soon
+    as it is complete, then cleared from the tree, so memory does not grow with the number of seasons.
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+
+    Returns
+    --------
+    generator: For each season row, the text of its season cells ([year, stat, stat, ...]), like
+               the 'season' entry of extract_cards_lxml
+    """
+    rows = etree.iterparse(
+        io.BytesIO(html.encode("utf-8")), events=("end",), tag="tr", html=True
+    )
+    for _, row in rows:
+        if " ".join(row.get("class", "").split()) == SEASON_ROW_CLASS:
+            yield all_text(row, SEASON_CARD)
+
+        # Drop the row, and the rows before it, from the tree
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
@@ -0,0 +1,245 @@
+"""
+nfl-web-scraping.utils.fingerprint_utils
+~~~~~~~~~~~~~~
+This module provides a structural check of player profile pages. The fingerprint of a page is the
+number of matches of every card selector. It is compared with the card layout and with the pages of
+earlier runs, on the first pages of a run and on a sample of the rest, so a change of the website
+layout stops a run early with a diff, instead of failing at the end or writing misaligned columns.
+"""
+from collections import Counter, deque
+import json
+import logging
+import os
+
+from lxml import etree
+
+from utils.extract_utils import (
+    HTML_PARSER,
+    KEY_CARD,
+    METRICS_CARD,
+    PLAYER_CARD,
+    SEASON_CARD,
+    SEASON_ROW,
+    TEXT,
+    TITLE_CARD,
+    TITLE_NAME,
+    TITLE_POSITION,
+    TITLE_TEAM,
+)
+from utils.plan_utils import CARD_LAYOUT
+
+logger = logging.getLogger(__name__)
+
+# Number of entries each card needs for the indices read by CARD_LAYOUT
+MIN_ENTRIES = {
+    card: max(idx for idx, name in layout) + 1 for card, layout in CARD_LAYOUT
+}
+
+# The fewest matches of each selector a page can be parsed with. The title entries can be missing
+# (they are read as "NaN"), and so can the season row (a player without a season)
+REQUIRED = {
+    "title": 1,
+    "player": MIN_ENTRIES["player"],
+    "metrics": MIN_ENTRIES["metrics"],
+    "key": MIN_ENTRIES["key"],
+    "season.cells": MIN_ENTRIES["season"],
+}
+
+
+def page_fingerprint(html):
+    """
+    Returns the number of matches of every card selector on a profile page
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+
+    Returns
+    --------
+    dict: selector -> number of matches. 'title', 'title.name', 'title.position', 'title.team' and
+          'season' are 0 or 1. 'key' leaves out the (rank) entries, as the parsers do. 'season.cells'
+          is only there if the page has a season row
+    """
+    try:
+        root = etree.fromstring(html, HTML_PARSER)
+    except ValueError:
+        # lxml refuses str input that carries an encoding declaration
+        root = etree.fromstring(html.encode("utf-8"), HTML_PARSER)
+
+    title = TITLE_CARD(root)
+    fingerprint = {"title": len(title)}
+    for name, xpath in (
+        ("title.name", TITLE_NAME),
+        ("title.position", TITLE_POSITION),
+        ("title.team", TITLE_TEAM),
+    ):
+        fingerprint[name] = len(xpath(title[0])) if title else 0
+
+    fingerprint["player"] = len(PLAYER_CARD(root))
+    fingerprint["metrics"] = len(METRICS_CARD(root))
+    fingerprint["key"] = len([x for x in KEY_CARD(root) if "(" not in TEXT(x)])
+
+    season = SEASON_ROW(root)
+    fingerprint["season"] = len(season)
+    if season:
+        fingerprint["season.cells"] = len(SEASON_CARD(season[0]))
+    return fingerprint
+
+
+class layout_check:
+    """
+    layout_check compares the fingerprint of profile pages with the card layout and with the
+    fingerprints seen in earlier runs, and stops scraping when the layout has drifted
+
+    Parameters
+    ----------
+    path (str): The json file of fingerprints seen in earlier runs
+                (e.g. scraped_data/fingerprint-quarterback.json)
+    check_pages (int): Number of pages checked at the start of a run. default = 10
+    sample_every (int): After that, one page in sample_every is checked. default = 50
+    max_mismatch (float): The largest share of the last check_pages checked pages that can differ
+                          from earlier runs. default = 0.2
+    metrics (stage_metrics): Optional. Counts the checked and mismatched pages
+
+    Notes
+    -----
+    A page is a mismatch if a selector matches fewer times than the card layout reads
+    (see REQUIRED), or a number of times never seen in earlier runs. The first kind stops the run
+    at once, since the page cannot be parsed. The second stops it once more than max_mismatch of
+    the recent checks are mismatches, so a single odd profile does not. Either way a RuntimeError
+    lists the expected and found counts of every selector that changed.
+
+    Call save() once scraping is done, to add the fingerprints of this run to the file. Only the
+    pages that matched are added. On the first run there is nothing to compare with, and only the
+    card layout is checked.
+    """
+
+    def __init__(
+        self, path, check_pages=10, sample_every=50, max_mismatch=0.2, metrics=None
+    ):
+        self.path = path
+        self.check_pages = check_pages
+        self.sample_every = sample_every
+        self.max_mismatch = max_mismatch
+        self.metrics = metrics
+        # Pages handed to check(), and whether each recent checked page was a mismatch
+        self.seen = 0
+        self.recent = deque(maxlen=check_pages)
+        # selector -> Counter of match counts, from earlier runs and from this run
+        self.baseline = {}
+        self.counts = {}
+
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                self.baseline = {
+                    selector: Counter({int(n): pages for n, pages in counts.items()})
+                    for selector, counts in json.load(f).items()
+                }
+
+    def __repr__(self):
+        return f"layout_check({self.path}, selectors={len(self.baseline)})"
+
+    def due(self):
+        """
+        Returns True if the next page should be checked
+        """
+        self.seen += 1
+        return self.seen <= self.check_pages or self.seen % self.sample_every == 0
+
+    def diff(self, fingerprint):
+        """
+        Returns the selectors of a fingerprint that do not match, as
+        {selector: {'expected': ..., 'found': ...}}
+        """
+        diff = {}
+        for selector, found in fingerprint.items():
+            if found < REQUIRED.get(selector, 0):
+                diff[selector] = {
+                    "expected": f">= {REQUIRED[selector]}",
+                    "found": found,
+                }
+            elif selector in self.baseline and found not in self.baseline[selector]:
+                diff[selector] = {
+                    "expected": sorted(self.baseline[selector]),
+                    "found": found,
+                }
+        return diff
+
+    def check(self, url, html):
+        """
+        Checks a downloaded page if it is one of the first check_pages pages, or a sampled page
+
+        Parameters
+        ----------
+        url (str): The url of the page
+        html (str): The html text of the page
+
+        Returns
+        --------
+        dict: The diff of the page, empty if it matches (or if it was not checked)
+
+        Notes
+        -----
+        Raises a RuntimeError, with the diff, if the page cannot be parsed or if the layout drifted
+        """
+        if not self.due():
+            return {}
+
+        fingerprint = page_fingerprint(html)
+        diff = self.diff(fingerprint)
+        self.recent.append(bool(diff))
+        if self.metrics is not None:
+            self.metrics.inc("fingerprint.checked")
+            self.metrics.inc("fingerprint.mismatched", int(bool(diff)))
+
+        if any(found < REQUIRED.get(s, 0) for s, found in fingerprint.items()):
+            raise RuntimeError(
+                f"The layout of {url} cannot be parsed, stopping: {json.dumps(diff)}"
+            )
+        if sum(self.recent) > self.max_mismatch * self.check_pages:
+            raise RuntimeError(
+                f"The page layout changed on {sum(self.recent)} of the last {len(self.recent)} "
+                f"checked pages, stopping at {url}: {json.dumps(diff)}"
+            )
+        if diff:
+            # Kept out of the baseline, so a slow drift of the layout is not learned page by page
+            logger.warning(f"Unusual page layout on {url}: {json.dumps(diff)}")
+            return diff
+
+        for selector, found in fingerprint.items():
+            self.counts.setdefault(selector, Counter())[found] += 1
+        return diff
+
+    def guard(self, reuse_fn=None):
+        """
+        Returns a reuse_fn for scrapePage that checks every page before it is parsed, then calls
+        reuse_fn (if given). The first check_pages pages after this call are all checked
+        """
+        self.seen = 0
+        self.recent.clear()
+
+        def check_then_reuse(url, html):
+            self.check(url, html)
+            return reuse_fn(url, html) if reuse_fn else None
+
+        return check_then_reuse
+
+    def save(self):
+        """
+        Adds the fingerprints of the checked pages to the file, through a temporary file
+        """
+        for selector, counts in self.counts.items():
+            self.baseline[selector] = self.baseline.get(selector, Counter()) + counts
+        self.counts = {}
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    selector: {str(n): pages for n, pages in sorted(counts.items())}
+                    for selector, counts in self.baseline.items()
+                },
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
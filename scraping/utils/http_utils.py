@@ -0,0 +1,190 @@
+"""
+nfl-web-scraping.utils.http_utils
+~~~~~~~~~~~~~~
+This module provides the HTTP transport used by the web crawler: a pooled requests.Session with
+timeouts and retries on transient errors.
+"""
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Status codes that are worth retrying: rate limited, or a temporary server error
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class http_transport:
+    """
+    http_transport wraps a shared requests.Session, so that every request from the crawler
+    reuses pooled keep-alive connections instead of opening a new one.
+
+    Parameters
+    ----------
+    headers (dict): The headers sent with every request (user agent)
+    cookies (dict): The cookies sent with every request. default = None
+    pool_size (int): The maximum number of connections kept open per host
+    connect_timeout (float): Seconds to wait for a connection to the server
+    read_timeout (float): Seconds to wait for the server to send data
+    max_retries (int): How many times a request is retried on a connection error, timeout,
+                       429 or 5xx response
+    backoff_factor (float): Base delay (seconds) of the exponential backoff between retries
+    backoff_max (float): The longest delay (seconds) between two retries
+    rate_limiter (token_bucket): Optional. Every request, retries included, waits for a token from
+                                 this limiter, and reports its status code and latency back to it
+    metrics (stage_metrics): Optional. Records the time to first byte (connect + server time), the
+                             download time and the size of every response, and the throttle waits
+
+    Notes
+    -----
+    Delays follow "full jitter" backoff: a random time between 0 and backoff_factor * 2 ** attempt.
+    If the server sends a `Retry-After` header, that delay is used instead.
+    """
+
+    def __init__(
+        self,
+        headers=None,
+        cookies=None,
+        pool_size=10,
+        connect_timeout=5,
+        read_timeout=30,
+        max_retries=3,
+        backoff_factor=0.5,
+        backoff_max=30,
+        rate_limiter=None,
+        metrics=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        if cookies:
+            self.session.cookies.update(cookies)
+
+    def __repr__(self):
+        return f"http_transport(timeout={self.timeout}, max_retries={self.max_retries})"
+
+    def get(self, url, headers=None):
+        """
+        Sends a GET request, retrying on connection errors, timeouts, 429 and 5xx responses
+
+        Parameters
+        ----------
+        url (str): The url to request
+        headers (dict): Extra headers for this request only
+
+        Returns
+        --------
+        requests.Response: The final response. If every retry failed on a status code, the last
+                           response is returned. If every retry failed on a connection error,
+                           the last exception is raised.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                waited = self.rate_limiter.acquire()
+                if self.metrics is not None:
+                    self.metrics.observe("http.throttle_seconds", waited)
+            try:
+                # The body is streamed, so the headers and the body can be timed apart
+                start = time.perf_counter()
+                resp = self.session.get(
+                    url, headers=headers, timeout=self.timeout, stream=True
+                )
+                ttfb = time.perf_counter() - start
+                resp.content
+                download = time.perf_counter() - start - ttfb
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                if self.metrics is not None:
+                    self.metrics.inc("http.errors")
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"{type(e).__name__} on {url}, retrying in {delay:.2f}s")
+                if self.metrics is not None:
+                    self.metrics.inc("http.retries")
+            else:
+                if self.metrics is not None:
+                    self.metrics.inc("http.requests")
+                    self.metrics.inc(f"http.status_{resp.status_code}")
+                    self.metrics.observe("http.ttfb_seconds", ttfb)
+                    self.metrics.observe("http.download_seconds", download)
+                    self.metrics.observe("http.response_bytes", len(resp.content))
+                if self.rate_limiter is not None:
+                    self.rate_limiter.feedback(
+                        resp.status_code, resp.elapsed.total_seconds()
+                    )
+                if resp.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    return resp
+                delay = self.retry_after(resp)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                logger.warning(
+                    f"Request code [{resp.status_code}] on {url}, retrying in {delay:.2f}s"
+                )
+                if self.metrics is not None:
+                    self.metrics.inc("http.retries")
+                resp.close()
+            time.sleep(delay)
+
+    def backoff(self, attempt):
+        """
+        Returns a random delay between 0 and the exponential backoff for a given attempt
+        """
+        return backoff_delay(attempt, self.backoff_factor, self.backoff_max)
+
+    def retry_after(self, resp):
+        """
+        Reads the `Retry-After` header of a response, in seconds or as an HTTP date.
+        Returns None if the header is missing or cannot be read.
+        """
+        return retry_after_delay(resp.headers.get("Retry-After"), self.backoff_max)
+
+    def close(self):
+        """
+        Closes all pooled connections
+        """
+        self.session.close()
+
+
+def backoff_delay(attempt, backoff_factor, backoff_max):
+    """
+    Returns a random delay between 0 and backoff_factor * 2 ** attempt, capped at backoff_max
+    ("full jitter" backoff)
+    """
+    return random.uniform(0, min(backoff_max, backoff_factor * 2**attempt))
+
+
+def retry_after_delay(value, backoff_max):
+    """
+    Returns the delay in seconds of a `Retry-After` header value (seconds or an HTTP date), capped
+    at backoff_max, or None if the value is missing or cannot be read
+    """
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = (
+                parsedate_to_datetime(value) - datetime.now(timezone.utc)
+            ).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(backoff_max, max(0.0, delay))
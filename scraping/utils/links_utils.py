@@ -0,0 +1,169 @@
+"""
+nfl-web-scraping.utils.links_utils
+~~~~~~~~~~~~~~
+This module provides the change detection of link discovery. The links found on a position page are
+compared with the stored links of the last run, so added and removed players are reported, and the
+popularity index of every player is kept with its link.
+"""
+import json
+import logging
+import math
+import os
+import time
+
+from bs4 import BeautifulSoup
+import pandas as pd
+
+from utils.convert_utils import convert_to_num
+
+logger = logging.getLogger(__name__)
+
+# Columns of the stored links file (scraped_data/POSITION.csv)
+LINK_COLUMNS = ["saved_links", "pop_index", "first_seen"]
+
+# Class of the player links on a position page
+LINK_CLASS = "flex items-center justify-between space-x-3 px-4 md:px-8 pt-2"
+
+
+def pop_index_value(text):
+    """
+    Returns the popularity index of a player as a number, from the span next to its link. Players
+    without an index ("-") get NaN
+    """
+    return float(convert_to_num(text.strip()))
+
+
+def parse_links(html, pop_index=True):
+    """
+    Finds the player links of a position page
+
+    Parameters
+    ----------
+    html (str or bs4 instance): The position page, as html text or parsed by BeautifulSoup
+    pop_index (bool): Leave out the players without a popularity index
+
+    Returns
+    --------
+    links (dict): Every link, in page order, mapped to its popularity index (a player listed twice
+                  is kept once)
+    """
+    soup = BeautifulSoup(html, "lxml") if isinstance(html, str) else html
+    links = {}
+    for name in soup.find_all("a", {"class": LINK_CLASS}, href=True):
+        pop_text = name.find("span").get_text()
+        if pop_index is True and pop_text == "-":
+            continue
+        links.setdefault(name["href"], pop_index_value(pop_text))
+    return links
+
+
+def load_links(path):
+    """
+    Loads a stored links file
+
+    Returns
+    --------
+    links (dict): Every url, in page order, mapped to {"pop_index": float, "first_seen": str}.
+                  Files saved before the popularity index was stored only have urls, so their
+                  pop_index is NaN and their first_seen is None
+    """
+    df = pd.read_csv(path)
+    pop = df["pop_index"] if "pop_index" in df else [math.nan] * len(df)
+    seen = df["first_seen"] if "first_seen" in df else [None] * len(df)
+    return {
+        url: {"pop_index": float(p), "first_seen": s if isinstance(s, str) else None}
+        for url, p, s in zip(df["saved_links"], pop, seen)
+    }
+
+
+def save_links(path, links):
+    """
+    Saves links returned by load_links() or link_diff.links to a .csv file
+    """
+    df = pd.DataFrame(
+        [
+            (url, entry["pop_index"], entry["first_seen"])
+            for url, entry in links.items()
+        ],
+        columns=LINK_COLUMNS,
+    )
+    df.to_csv(path, index=False)
+
+
+class link_diff:
+    """
+    link_diff compares the links found on a position page with the links stored by the last run
+
+    Parameters
+    ----------
+    previous (dict): The stored links, from load_links(). Empty on the first run
+    current (dict): Every url found on the position page, in page order, mapped to its popularity index
+
+    Notes
+    -----
+    A lower popularity index is a more viewed profile. With pop_index set in config.yaml, a player
+    whose index drops to "-" is no longer listed, so it shows up as removed.
+    """
+
+    def __init__(self, previous, current):
+        today = time.strftime("%Y-%m-%d")
+        self.added = [url for url in current if url not in previous]
+        self.removed = [url for url in previous if url not in current]
+        self.kept = [url for url in current if url in previous]
+        self.links = {
+            url: {
+                "pop_index": pop,
+                "first_seen": (previous.get(url) or {}).get("first_seen") or today,
+            }
+            for url, pop in current.items()
+        }
+
+    def __repr__(self):
+        return f"link_diff(added={len(self.added)}, removed={len(self.removed)}, kept={len(self.kept)})"
+
+    def priority(self):
+        """
+        Returns the current urls in scraping order: added players first, then the other players by
+        popularity index (most popular first), then the players without an index
+        """
+        added = set(self.added)
+
+        def key(url):
+            pop = self.links[url]["pop_index"]
+            return url not in added, math.isnan(pop), 0 if math.isnan(pop) else pop
+
+        # sorted() is stable, so ties keep the page order
+        return sorted(self.links, key=key)
+
+    def report(self):
+        """
+        Returns the diff as a dictionary: counts, and the added and removed urls
+        """
+        return {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "n_current": len(self.links),
+            "n_added": len(self.added),
+            "n_removed": len(self.removed),
+            "n_kept": len(self.kept),
+            "added": [
+                {"url": url, "pop_index": none_if_nan(self.links[url]["pop_index"])}
+                for url in self.added
+            ],
+            "removed": self.removed,
+        }
+
+    def save(self, path):
+        """
+        Writes report() to a .json file, through a temporary file
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def none_if_nan(value):
+    """
+    Returns None for NaN, since NaN is not valid json
+    """
+    return None if math.isnan(value) else value
@@ -0,0 +1,111 @@
+"""
+nfl-web-scraping.utils.manifest_utils
+~~~~~~~~~~~~~~
+This module provides the per-player manifest used by incremental scraping. The manifest remembers
+the content hash and the parsed row of every profile, so unchanged pages are not parsed again. Runs
+cut short by a request or time budget also take the rows of the players they did not reach from it.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class scrape_manifest:
+    """
+    scrape_manifest maps every player url to the hash of its last scraped page, the time it was
+    scraped, and the row (and, with all_seasons, the season rows) that was parsed from it.
+
+    Parameters
+    ----------
+    path (str): The json file holding the manifest (e.g. scraped_data/manifest-quarterback.json)
+    columns (list): The column names of a row. If the stored manifest was written with different
+                    columns, it is discarded, since its rows no longer line up
+
+    Notes
+    -----
+    Call save() once scraping is done to write the manifest back to disk.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.players = {}
+        self.n_reused = 0
+        self.n_parsed = 0
+
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+            if stored.get("columns") == self.columns:
+                self.players = stored["players"]
+            else:
+                logger.warning(
+                    f"Columns in {self.path} do not match, rebuilding the manifest"
+                )
+
+    def __repr__(self):
+        return f"scrape_manifest({self.path}, players={len(self.players)})"
+
+    @staticmethod
+    def digest(html):
+        """
+        Returns the sha256 hash of a page
+        """
+        return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+    def lookup(self, url, digest):
+        """
+        Returns the stored row of a url if its page hash is unchanged, otherwise None
+        """
+        entry = self.players.get(url)
+        if entry is None or entry["hash"] != digest:
+            return None
+        self.n_reused += 1
+        return tuple(entry["row"])
+
+    def last_row(self, url):
+        """
+        Returns the last row parsed for a url, whatever its hash, or None if it was never scraped
+        """
+        entry = self.players.get(url)
+        if entry is None:
+            return None
+        return tuple(entry["row"])
+
+    def last_seasons(self, url):
+        """
+        Returns the last season rows parsed for a url, or None if they were never stored
+        """
+        entry = self.players.get(url)
+        if entry is None or "seasons" not in entry:
+            return None
+        return [tuple(season) for season in entry["seasons"]]
+
+    def update(self, url, digest, row, seasons=None):
+        """
+        Records a freshly parsed row for a url, and its season rows if given
+        """
+        self.n_parsed += 1
+        self.players[url] = {
+            "hash": digest,
+            "scraped_at": time.time(),
+            "row": list(row),
+        }
+        if seasons is not None:
+            self.players[url]["seasons"] = [list(season) for season in seasons]
+
+    def save(self):
+        """
+        Writes the manifest to disk, through a temporary file so a crash never leaves half a manifest
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"columns": self.columns, "players": self.players}, f)
+        os.replace(tmp_path, self.path)
+        logger.info(
+            f"Manifest saved: {self.n_parsed} players parsed, {self.n_reused} unchanged"
+        )
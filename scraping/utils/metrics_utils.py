@@ -0,0 +1,264 @@
+"""
+nfl-web-scraping.utils.metrics_utils
+~~~~~~~~~~~~~~
+This module provides the per-stage metrics of the web crawler: counters and histograms of request
+timings, response sizes, parse time per card, and conversion and write times. A summary is written at
+the end of web_crawler.scrapePage as a .json file and/or a Prometheus textfile, so a slow run can be
+traced to the network or to the parser.
+"""
+from contextlib import contextmanager, nullcontext
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in seconds for timings and in bytes for sizes
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class histogram:
+    """
+    histogram counts observations in fixed buckets, and keeps their count, sum, min and max
+
+    Parameters
+    ----------
+    buckets (tuple): The upper bound of every bucket, in increasing order. Larger values go in a
+                     last "+Inf" bucket
+    """
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __repr__(self):
+        return f"histogram(count={self.count}, sum={self.sum:.3f})"
+
+    def observe(self, value):
+        """
+        Adds one observation
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def summary(self):
+        """
+        Returns the histogram as a dictionary, with the upper bound of each bucket and the number of
+        observations at or below it (cumulative, like Prometheus)
+        """
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "min": round(self.min, 6) if self.count else None,
+            "max": round(self.max, 6) if self.count else None,
+            "buckets": cumulative,
+        }
+
+
+class stage_metrics:
+    """
+    stage_metrics collects the counters and histograms of a scrape. It is shared by every part of
+    a crawler (transport, cache, parser, writer), and is safe to use from several threads.
+
+    Metric names are dotted (e.g. "http.ttfb_seconds"). Names ending in "_bytes" use byte-sized
+    buckets, every other histogram uses buckets in seconds.
+
+    Parameters
+    ----------
+    enabled (bool): If False, every call is a no-op, so the crawler can always call it
+    labels (dict): Labels added to every metric in the Prometheus textfile (e.g. {"position": "quarterback"})
+    """
+
+    def __init__(self, enabled=True, labels=None):
+        self.enabled = enabled
+        self.labels = dict(labels or {})
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"stage_metrics(counters={len(self.counters)}, histograms={len(self.histograms)})"
+
+    def inc(self, name, value=1):
+        """
+        Adds value to a counter
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Adds one observation to a histogram
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = histogram(
+                    BYTES_BUCKETS if name.endswith("_bytes") else SECONDS_BUCKETS
+                )
+                self.histograms[name] = hist
+            hist.observe(value)
+
+    def timer(self, name):
+        """
+        Returns a context manager that observes the seconds spent in its block
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Returns every counter and histogram as a dictionary
+        """
+        with self.lock:
+            return {
+                "labels": self.labels,
+                "started": self.started,
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {
+                    name: hist.summary()
+                    for name, hist in sorted(self.histograms.items())
+                },
+            }
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format, for the node_exporter
+        textfile collector
+        """
+        summary = self.summary()
+        labels = ",".join(f'{k}="{v}"' for k, v in sorted(self.labels.items()))
+
+        def label_str(extra=""):
+            both = ",".join(x for x in (labels, extra) if x)
+            return "{" + both + "}" if both else ""
+
+        lines = []
+        for name, value in summary["counters"].items():
+            metric = prometheus_name(name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{label_str()} {value}")
+        for name, hist in summary["histograms"].items():
+            metric = prometheus_name(name)
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in hist["buckets"]:
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{metric}_bucket{label_str(le)} {count}")
+            lines.append(f"{metric}_sum{label_str()} {hist['sum']}")
+            lines.append(f"{metric}_count{label_str()} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path, formats=("json", "prometheus")):
+        """
+        Writes the summary next to path: path.json and/or path.prom. Files are written to a temporary
+        file first, so a textfile collector never reads a partial file
+
+        Returns
+        --------
+        list: The written files
+        """
+        written = []
+        for fmt in formats:
+            if fmt == "json":
+                out_path, text = path + ".json", json.dumps(self.summary(), indent=2)
+            elif fmt == "prometheus":
+                out_path, text = path + ".prom", self.to_prometheus()
+            else:
+                raise ValueError(
+                    f"Metrics format must be one of ['json', 'prometheus'], not {fmt}"
+                )
+            # The temporary name is unique per thread, since crawlers sharing metrics may save at once
+            tmp_path = f"{out_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, out_path)
+            written.append(out_path)
+
+        logger.info(f"Saved scrape metrics in {', '.join(written)}")
+        return written
+
+
+def prometheus_name(name):
+    """
+    Returns a Prometheus metric name for a dotted metric name (http.ttfb_seconds -> nfl_scrape_http_ttfb_seconds)
+    """
+    return "nfl_scrape_" + name.replace(".", "_").replace("-", "_")
+
+
+@contextmanager
+def profiled(profiler, path):
+    """
+    Runs the block under a profiler, and saves its report
+
+    Parameters
+    ----------
+    profiler (str): None (no profiling), 'cprofile' (report saved as path.prof, read it with pstats
+                    or snakeviz) or 'pyinstrument' (report saved as path.html, requires pyinstrument)
+    path (str): The report path, without its extension
+    """
+    if profiler is None:
+        yield
+        return
+
+    if profiler == "cprofile":
+        import cProfile
+
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(path + ".prof")
+            logger.info(f"Saved cProfile report in {path}.prof")
+
+    elif profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            with open(path + ".html", "w") as f:
+                f.write(prof.output_html())
+            logger.info(f"Saved pyinstrument report in {path}.html")
+
+    else:
+        raise ValueError(
+            f"Profiler must be one of [None, 'cprofile', 'pyinstrument'], not {profiler}"
+        )
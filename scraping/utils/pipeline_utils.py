@@ -0,0 +1,143 @@
+"""
+nfl-web-scraping.utils.pipeline_utils
+~~~~~~~~~~~~~~
+This module provides the producer/consumer pipeline used by web_crawler.scrapePage when parsing is
+spread over several processes. Fetcher threads download pages onto a bounded queue, a pool of parser
+processes turns each page into a row, and the collector hands the rows back in page order.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait
+from contextlib import nullcontext
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def parse_pipeline(
+    page_list,
+    fetch_fn,
+    parse_fn,
+    reuse_fn=None,
+    fetch_executor=None,
+    fetch_workers=8,
+    parse_executor=None,
+    parse_workers=2,
+    queue_depth=32,
+):
+    """
+    Downloads and parses every page in page_list, overlapping the network and the parsing
+
+    Parameters
+    ----------
+    page_list (list): A list of player links retrieved from 'getNameLinks'
+    fetch_fn (function): Downloads a url, returns its html text or None
+    parse_fn (function): Turns an html text into a row. Runs in the parser processes, so it must
+                         be picklable (a module level function or a functools.partial of one)
+    reuse_fn (function): Optional. Called as reuse_fn(url, html) in the main process before parsing.
+                         If it returns a row, that row is used and the page is not parsed
+    fetch_executor (ThreadPoolExecutor): Optional. A thread pool shared with other crawlers, used
+                                         for downloads instead of a private one
+    fetch_workers (int): Number of fetcher threads, if fetch_executor is not given
+    parse_executor (ProcessPoolExecutor): Optional. A process pool shared with other crawlers, used
+                                          for parsing instead of a private one. It must be started
+                                          before any thread (see schedule_utils.make_crawlers)
+    parse_workers (int): Number of parser processes, if parse_executor is not given
+    queue_depth (int): The maximum number of pages held at once, from the start of their download
+                       until their row is handed back. This bounds memory whatever the list size
+
+    Returns
+    --------
+    generator: Yields (url, html, row, reused) for each page, in page_list order. html and row are
+               None if the page could not be downloaded. reused is True if the row came from reuse_fn
+
+    Notes
+    -----
+    An exception raised by parse_fn is raised again when its page is reached.
+    """
+    page_list = list(page_list)
+    fetched = queue.Queue(maxsize=queue_depth)
+    # A slot is taken before a page is downloaded, and given back once its row is yielded
+    slots = threading.Semaphore(queue_depth)
+    stop = threading.Event()
+
+    def fetch(idx, url):
+        try:
+            html = fetch_fn(url)
+        except Exception as e:
+            logger.error(f"Could not download {url}: {e}")
+            html = None
+        fetched.put((idx, html))
+
+    def produce():
+        executor = fetch_executor or ThreadPoolExecutor(max_workers=fetch_workers)
+        try:
+            for idx, url in enumerate(page_list):
+                slots.acquire()
+                if stop.is_set():
+                    break
+                executor.submit(fetch, idx, url)
+        finally:
+            if fetch_executor is None:
+                executor.shutdown()
+
+    # The parser processes are started before the fetcher threads, so they are not forked from a
+    # process with threads holding locks (logging, connection pools). With the 'fork' start method,
+    # the first task starts every worker at once
+    pool = parse_executor
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=parse_workers)
+        pool.submit(int).result()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    # Out of order results waiting for their turn: idx -> (html, row or Future, reused)
+    pending = {}
+    next_idx = 0
+
+    # A shared pool is shut down by its owner
+    with pool if parse_executor is None else nullcontext():
+        try:
+            while next_idx < len(page_list):
+                item = pending.get(next_idx)
+                if item is not None:
+                    html, row, reused = item
+                    if not isinstance(row, Future):
+                        del pending[next_idx]
+                        yield page_list[next_idx], html, row, reused
+                        slots.release()
+                        next_idx += 1
+                        continue
+                    if row.done():
+                        pending[next_idx] = (html, row.result(), reused)
+                        continue
+
+                # Take in the next downloaded page. If the next row is only waiting on its
+                # parser, wake up as soon as it is done
+                try:
+                    if item is None:
+                        idx, html = fetched.get()
+                    else:
+                        idx, html = fetched.get_nowait()
+                except queue.Empty:
+                    wait([item[1]], timeout=0.05)
+                    continue
+
+                if html is None:
+                    pending[idx] = (None, None, False)
+                    continue
+
+                row = reuse_fn(page_list[idx], html) if reuse_fn else None
+                if row is not None:
+                    pending[idx] = (html, row, True)
+                else:
+                    pending[idx] = (html, pool.submit(parse_fn, html), False)
+        finally:
+            # Unblock the producer if the collector stops early
+            stop.set()
+            for _ in range(queue_depth):
+                slots.release()
+            for html, row, reused in pending.values():
+                if isinstance(row, Future):
+                    row.cancel()
@@ -0,0 +1,110 @@
+"""
+nfl-web-scraping.utils.plan_utils
+~~~~~~~~~~~~~~
+This module provides the extraction plans of the web crawler. The attribute lists of
+att_list_headings.py are compiled once per position into a plan, which maps every output column to
+a card, an index in that card and a converter. A plan turns the raw cards of a profile page into a
+row with one pass, instead of rebuilding and filling a dictionary for every page.
+"""
+from functools import lru_cache
+from itertools import chain
+
+# Where each column of a card is read, as (index in the card, converter name). The cards are listed
+# in the order of the attribute lists. To add a column, add its heading to att_list_headings.py and
+# its (index, converter) here
+CARD_LAYOUT = (
+    # Title card: Name, position, team
+    ("title", ((0, "text"), (1, "text"), (2, "no_newlines"))),
+    # Player card: Height, weight, draft, college, age (index 2 is the draft year, not kept)
+    ("player", ((0, "height"), (1, "num"), (3, "text"), (4, "text"), (5, "num"))),
+    # Metrics card: 40, speed, burst, agility, bench
+    ("metrics", tuple((k, "num") for k in range(0, 5))),
+    # College stats card
+    ("key", tuple((k, "num") for k in range(0, 4))),
+    # Season stats card, latest season (index 0 is the year)
+    ("season", tuple((k, "num") for k in range(1, 9))),
+)
+
+
+def remove_newlines(item):
+    """
+    Removes the line breaks around the team name of the title card
+    """
+    return item.replace("\n", "")
+
+
+class extraction_plan:
+    """
+    extraction_plan holds the compiled layout of one position: the output columns, and for each
+    one, the card it is read from, its index in the card, and its converter.
+
+    Parameters
+    ----------
+    att_list (list): A list of positional headings, from pos_dict()
+    converters (dict): The converter of every converter name in CARD_LAYOUT. A converter of None
+                       keeps the raw text
+
+    Notes
+    -----
+    The layout is checked when the plan is built: a card with more or fewer headings than
+    CARD_LAYOUT, or an unknown converter name, raises a ValueError before any page is parsed.
+    Plans only hold strings, ints and module level functions, so they can be sent to parser processes.
+    """
+
+    __slots__ = ("columns", "steps")
+
+    def __init__(self, att_list, converters):
+        if len(att_list) != len(CARD_LAYOUT):
+            raise ValueError(
+                f"The attribute list has {len(att_list)} cards, the card layout has {len(CARD_LAYOUT)}"
+            )
+
+        steps = []
+        for headings, (card, layout) in zip(att_list, CARD_LAYOUT):
+            if len(headings) != len(layout):
+                raise ValueError(
+                    f"The {card} card has {len(headings)} headings ({headings}), "
+                    f"but the card layout reads {len(layout)} entries"
+                )
+            for idx, name in layout:
+                if name not in converters:
+                    raise ValueError(f"Unknown converter '{name}' in the {card} card")
+                steps.append((card, idx, converters[name]))
+
+        self.columns = tuple(chain.from_iterable(att_list))
+        self.steps = tuple(steps)
+
+    def __repr__(self):
+        return f"extraction_plan(columns={len(self.columns)})"
+
+    def __getstate__(self):
+        return self.columns, self.steps
+
+    def __setstate__(self, state):
+        self.columns, self.steps = state
+
+    def apply(self, cards):
+        """
+        Returns the row of a profile page from its raw cards (see scrape_utils.extract_cards)
+        """
+        return tuple(
+            [
+                cards[card][idx] if convert is None else convert(cards[card][idx])
+                for card, idx, convert in self.steps
+            ]
+        )
+
+
+@lru_cache(maxsize=None)
+def _compile(layout, converters):
+    return extraction_plan([list(card) for card in layout], dict(converters))
+
+
+def compile_plan(att_list, converters):
+    """
+    Returns the extraction plan of an attribute list. Plans are built once and reused, so this
+    can be called for every page
+    """
+    return _compile(
+        tuple(tuple(card) for card in att_list), tuple(sorted(converters.items()))
+    )
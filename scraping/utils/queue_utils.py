@@ -0,0 +1,125 @@
+"""
+nfl-web-scraping.utils.queue_utils
+~~~~~~~~~~~~~~
+This module provides the priority queue of web_crawler.scrapePage. Profiles are ordered by
+popularity index and by the time since they were last scraped, and a run can be capped by a number
+of requests or a number of seconds, so a short run refreshes the most viewed players first and
+leaves the long tail for later runs.
+"""
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class scrape_queue:
+    """
+    scrape_queue orders the profiles of a position and keeps the time every profile was last scraped
+
+    Parameters
+    ----------
+    path (str): The json file of last scrape times (e.g. scraped_data/queue-quarterback.json)
+    max_age_hours (float): A profile not scraped for this long (or never scraped) is as stale as it
+                           gets. default = 168 (one week)
+    max_requests (int): Scrape at most this many profiles per run. default = None (no cap)
+    max_seconds (float): Stop starting new profiles after this many seconds. default = None (no cap)
+
+    Notes
+    -----
+    The priority of a profile is its staleness divided by its popularity index (1 is the most
+    viewed player), with staleness in hours capped at max_age_hours. Among players scraped equally
+    long ago, the most viewed comes first; a less viewed player comes first once it is stale enough
+    (e.g. index 10 scraped a day ago before index 1 scraped two hours ago). Players without an
+    index rank after the last indexed player.
+
+    Call save() once scraping is done to write the scrape times back to disk.
+    """
+
+    def __init__(self, path, max_age_hours=168, max_requests=None, max_seconds=None):
+        self.path = path
+        self.max_age_hours = max_age_hours
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.deadline = None
+        self.scraped_at = {}
+
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                self.scraped_at = json.load(f)
+
+    def __repr__(self):
+        return f"scrape_queue({self.path}, players={len(self.scraped_at)})"
+
+    def staleness(self, url, now):
+        """
+        Returns the hours since a url was last scraped, capped at max_age_hours
+        """
+        last = self.scraped_at.get(url)
+        if last is None:
+            return self.max_age_hours
+        return min(max(now - last, 0) / 3600, self.max_age_hours)
+
+    def plan(self, page_list, pop_index, now=None):
+        """
+        Orders page_list by priority, cuts it to max_requests, and starts the max_seconds clock
+
+        Parameters
+        ----------
+        page_list (list): A list of player links retrieved from 'getNameLinks'
+        pop_index (dict): The popularity index of each url (NaN or missing for players without one)
+        now (float): The current time, as from time.time(). default = None (now)
+
+        Returns
+        --------
+        list: The urls to scrape, highest priority first
+        """
+        now = time.time() if now is None else now
+        ranks = [
+            pop_index.get(url, math.nan)
+            for url in page_list
+            if not math.isnan(pop_index.get(url, math.nan))
+        ]
+        unranked = max(ranks, default=0) + 1
+
+        def priority(url):
+            rank = pop_index.get(url, math.nan)
+            if math.isnan(rank):
+                rank = unranked
+            return self.staleness(url, now) / max(rank, 1)
+
+        # sorted() is stable, so ties keep the order of page_list
+        ordered = sorted(page_list, key=priority, reverse=True)
+        if self.max_requests is not None and len(ordered) > self.max_requests:
+            logger.info(
+                f"Request budget: scraping {self.max_requests} of {len(ordered)} players, "
+                f"{len(ordered) - self.max_requests} left for a later run"
+            )
+            ordered = ordered[: self.max_requests]
+
+        if self.max_seconds is not None:
+            self.deadline = time.monotonic() + self.max_seconds
+        return ordered
+
+    def expired(self):
+        """
+        Returns True once the max_seconds budget of the last plan() is spent
+        """
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def mark(self, url, when=None):
+        """
+        Records that a url was scraped
+        """
+        self.scraped_at[url] = time.time() if when is None else when
+
+    def save(self):
+        """
+        Writes the scrape times to disk, through a temporary file
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.scraped_at, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,170 @@
+"""
+nfl-web-scraping.utils.ratelimit_utils
+~~~~~~~~~~~~~~
+This module provides the token-bucket rate limiter shared by every request the web crawler sends,
+so parallel fetching stays within the limits of www.playerprofiler.com.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class token_bucket:
+    """
+    token_bucket lets requests through at a steady rate, with short bursts allowed.
+
+    Tokens are added at `rate` per second, up to `burst` tokens. Each request takes one token, and
+    waits if the bucket is empty. If adaptive, the rate is cut when the server answers 429/503 or
+    when response times spike, and grows back slowly while responses are healthy.
+
+    Parameters
+    ----------
+    rate (float): Requests per second
+    burst (int): The largest number of requests that can be sent back-to-back
+    adaptive (bool): Whether to adjust the rate from the server's responses
+    min_rate (float): The rate is never cut below this value
+    decrease_factor (float): The rate is multiplied by this value on a 429/503 or latency spike
+    increase_step (float): Requests per second added back after every healthy response
+    latency_spike (float): A response slower than latency_spike times the average latency
+                           counts as a spike
+    cooldown (float): Seconds after a slowdown during which further slowdowns are ignored, so one
+                      burst of bad responses only cuts the rate once
+
+    Notes
+    -----
+    Throttle metrics (number of waits, total and longest wait, slowdowns) are returned by stats().
+    """
+
+    def __init__(
+        self,
+        rate=4.0,
+        burst=8,
+        adaptive=True,
+        min_rate=0.2,
+        decrease_factor=0.5,
+        increase_step=0.05,
+        latency_spike=3.0,
+        cooldown=5.0,
+    ):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.latency_spike = latency_spike
+        self.cooldown = cooldown
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.last_slowdown = 0.0
+        self.latency_avg = None
+        self.n_latency = 0
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.n_acquired = 0
+        self.n_throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.n_slowdowns = 0
+
+    def __repr__(self):
+        return f"token_bucket(rate={self.rate:.2f}, burst={self.burst})"
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until one is available. Returns the seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            delay = self.reserve(waited)
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def reserve(self, waited=0.0):
+        """
+        Takes one token if one is available, without waiting. Used by acquire(), and by the asyncio
+        crawler, which awaits the delay instead of sleeping
+
+        Parameters
+        ----------
+        waited (float): Seconds already spent waiting for this token, for the throttle metrics
+
+        Returns
+        --------
+        None if a token was taken, otherwise the seconds until the next token
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.n_acquired += 1
+                if waited > 0:
+                    self.n_throttled += 1
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+                return None
+            return (1 - self.tokens) / self.rate
+
+    def feedback(self, status_code, latency):
+        """
+        Adjusts the rate from a server response
+
+        Parameters
+        ----------
+        status_code (int): The status code of the response
+        latency (float): Seconds the server took to answer
+        """
+        if not self.adaptive:
+            return
+
+        with self.lock:
+            spike = (
+                self.n_latency >= 5 and latency > self.latency_spike * self.latency_avg
+            )
+            # Keep a moving average of the latency, without letting spikes inflate it
+            if not spike:
+                self.n_latency += 1
+                if self.latency_avg is None:
+                    self.latency_avg = latency
+                else:
+                    self.latency_avg = 0.8 * self.latency_avg + 0.2 * latency
+
+            if status_code in (429, 503) or spike:
+                now = time.monotonic()
+                if now - self.last_slowdown < self.cooldown:
+                    return
+                self.last_slowdown = now
+                self.n_slowdowns += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                reason = f"[{status_code}]" if not spike else f"{latency:.2f}s response"
+                logger.warning(
+                    f"Slowing down to {self.rate:.2f} requests/s after a {reason}"
+                )
+            elif status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def stats(self):
+        """
+        Returns the throttle metrics as a dictionary
+        """
+        with self.lock:
+            return {
+                "rate": round(self.rate, 3),
+                "requests": self.n_acquired,
+                "throttled": self.n_throttled,
+                "wait_total": round(self.wait_total, 3),
+                "wait_max": round(self.wait_max, 3),
+                "wait_avg": round(self.wait_total / max(1, self.n_throttled), 3),
+                "slowdowns": self.n_slowdowns,
+            }
@@ -0,0 +1,158 @@
+"""
+nfl-web-scraping.utils.schedule_utils
+~~~~~~~~~~~~~~
+This module provides the multi-position mode of scrape.py. Several positions are scraped in one run,
+with every profile request going through one shared connection pool and one shared thread pool.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import logging
+
+from utils.scrape_utils import web_crawler
+
+logger = logging.getLogger(__name__)
+
+POSITIONS = ["quarterback", "running-back", "wide-receiver", "tight-end"]
+
+
+def resolve_positions(pos):
+    """
+    Returns the list of positions to scrape from the "pos" parameter of config.yaml, which is
+    either one position, a list of positions, or 'all'
+    """
+    if pos == "all":
+        return list(POSITIONS)
+    if isinstance(pos, str):
+        return [pos]
+    return list(pos)
+
+
+def make_crawlers(positions, base_url, **crawler_options):
+    """
+    Builds one web_crawler per position. All crawlers share the http transport (connection pool),
+    the response cache, the snapshot store and the metrics of the first one. The shared metrics
+    are saved as scraped_data/metrics-POS1+POS2...
+
+    If parse_workers > 0, one pool of parser processes is started here, before any thread, and
+    shared by every crawler. scrape_positions shuts it down
+
+    Parameters
+    ----------
+    positions (list): The positions to scrape
+    base_url (str): The url of a position page, without the position (https://www.playerprofiler.com/position/)
+    crawler_options: Keyword arguments passed on to every web_crawler
+
+    Returns
+    --------
+    crawlers (list): A web_crawler for each position, in the order of positions
+    """
+    # Started before the fetcher threads of scrape_positions, so the workers are not forked from
+    # a process with threads holding locks. The first task starts every worker at once
+    parse_executor = None
+    if crawler_options.get("parse_workers", 0) > 0:
+        parse_executor = ProcessPoolExecutor(
+            max_workers=crawler_options["parse_workers"]
+        )
+        parse_executor.submit(int).result()
+
+    crawlers = []
+    for pos in positions:
+        crawler = web_crawler(url=base_url + pos, **crawler_options)
+        if crawlers:
+            crawler.transport.close()
+            crawler.transport = crawlers[0].transport
+            if crawler.cache is not None:
+                crawler.cache.close()
+            crawler.cache = crawlers[0].cache
+            crawler.snapshots = crawlers[0].snapshots
+            crawler.metrics = crawlers[0].metrics
+            if crawler.fingerprint is not None:
+                crawler.fingerprint.metrics = crawler.metrics
+        crawler.parse_executor = parse_executor
+        crawlers.append(crawler)
+
+    # Every request goes through the first transport, so its metrics cover all positions
+    crawlers[0].metrics.labels["position"] = "+".join(positions)
+    for crawler in crawlers:
+        crawler.metrics_path = crawler.LINKS_OUTPATH + "metrics-" + "+".join(positions)
+    return crawlers
+
+
+def scrape_positions(
+    crawlers,
+    max_in_flight=8,
+    pop_index=True,
+    scrape_links=True,
+    link_order="page",
+    incremental=False,
+    resume=False,
+):
+    """
+    Scrapes several positions at once. The link lists of every position are gathered together,
+    then every profile is fed into one shared thread pool of max_in_flight fetchers. Each position
+    writes its .csv file as soon as its own players are done.
+
+    Parameters
+    ----------
+    crawlers (list): The crawlers returned by make_crawlers()
+    max_in_flight (int): The maximum number of profile requests running at once, across all positions
+    pop_index (bool): Passed on to web_crawler.getNameLinks
+    scrape_links (bool): Passed on to web_crawler.getNameLinks
+    link_order (str): Passed on to web_crawler.getNameLinks as order
+    incremental (bool): Passed on to web_crawler.scrapePage
+    resume (bool): Passed on to web_crawler.scrapePage
+
+    Returns
+    --------
+    results (dict): The scraped dataframe of each position
+    """
+    results = {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as fetch_pool:
+            for crawler in crawlers:
+                # The shared pool is the scheduler, so every crawler fetches through it
+                crawler.executor = fetch_pool
+                if crawler.fetch_mode != "thread":
+                    logger.info(
+                        f"{crawler.pos_str}: fetch mode set to 'thread' for a shared run"
+                    )
+                    crawler.fetch_mode = "thread"
+
+            # One coordinating thread per position: each one submits its requests to the
+            # shared pool, then parses and saves its own players
+            with ThreadPoolExecutor(max_workers=len(crawlers)) as position_pool:
+                link_lists = list(
+                    position_pool.map(
+                        lambda crawler: crawler.getNameLinks(
+                            pop_index=pop_index,
+                            save=True,
+                            scrape_links=scrape_links,
+                            order=link_order,
+                        ),
+                        crawlers,
+                    )
+                )
+
+                futures = {
+                    position_pool.submit(
+                        crawler.scrapePage,
+                        page_list=page_links,
+                        incremental=incremental,
+                        resume=resume,
+                    ): crawler
+                    for crawler, page_links in zip(crawlers, link_lists)
+                }
+                for future in as_completed(futures):
+                    crawler = futures[future]
+                    results[crawler.pos_str] = future.result()
+                    logger.info(f"Finished scraping the {crawler.pos_str} position")
+    finally:
+        for crawler in crawlers:
+            crawler.executor = None
+        # The parser pool of make_crawlers is shared by every crawler
+        if crawlers[0].parse_executor is not None:
+            crawlers[0].parse_executor.shutdown()
+        for crawler in crawlers:
+            crawler.parse_executor = None
+
+    return results
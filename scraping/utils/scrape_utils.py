@@ -4,12 +4,29 @@ nfl-web-scraping.utils
 This module provides utility functions that are used within scrape.py to collect data from www.playerprofiler.com.
 """
 from utils.att_list_headings import *
+from utils.http_utils import http_transport
+from utils.ratelimit_utils import token_bucket
+from utils.cache_utils import response_cache
+from utils.manifest_utils import scrape_manifest
+from utils.extract_utils import (
+    SEASON_ROW_CLASS,
+    extract_cards_lxml,
+    iter_season_cards,
+)
+from utils.pipeline_utils import parse_pipeline
+from utils.writer_utils import checkpoint_writer, convert_output, read_output
+from utils.snapshot_utils import snapshot_store
+from utils.metrics_utils import stage_metrics
+from utils.plan_utils import compile_plan, remove_newlines
+from utils.convert_utils import convert_to_num, convert_inch_to_cm
+from utils.links_utils import link_diff, load_links, save_links, parse_links
+from utils.queue_utils import scrape_queue
+from utils.fingerprint_utils import layout_check
 
 from bs4 import BeautifulSoup
 import requests
 import re
 
-import numpy as np
 import pandas as pd
 from itertools import chain
 import os
@@ -19,15 +36,27 @@ from tqdm import tqdm
 import time
 import lxml
 import cchardet
-import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from contextlib import nullcontext
 
 # logger info
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(message)s")
-file_handler = logging.FileHandler("scraping.log")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+
+def log_to_file(path="scraping.log"):
+    """
+    Sends the logs of every utils module to a file. Called by the scripts (scrape.py,
+    benchmark.py), not on import, so importing the crawler as a library creates no file
+    """
+    package_logger = logging.getLogger("utils")
+    package_logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    package_logger.addHandler(file_handler)
 
 
 class web_crawler:
@@ -47,12 +76,51 @@ class web_crawler:
                    please visit https://www.whatismybrowser.com/detect/what-is-my-user-agent/ ,
                    and copy and paste your user agent in the /profile_config.yaml file under headers.
     cookies (str): These are cookies that are saved on your web browser. default = None
+    fetch_mode (str): How player profiles are downloaded in scrapePage. One of
+                      ['serial', 'thread', 'asyncio'] (default = 'serial')
+    max_in_flight (int): The maximum number of profile requests running at once when
+                         fetch_mode is 'thread' or 'asyncio' (default = 8)
+    transport_options (dict): Keyword arguments for the http_transport (pool size, timeouts, retries).
+                              See utils/http_utils.py. default = None
+    rate_limit_options (dict): Options for the token-bucket rate limiter (enabled, rate, burst, adaptive...).
+                               See utils/ratelimit_utils.py. default = None (no limit)
+    cache_options (dict): Options for the on-disk response cache (enabled, path, ttl, max_size_mb,
+                          offline). See utils/cache_utils.py. default = None (no cache)
+    parse_backend (str): How profile pages are parsed, 'bs4' (BeautifulSoup) or 'lxml'
+                         (precompiled XPath, faster). default = 'bs4'
+    parse_workers (int): Number of processes parsing pages in scrapePage. 0 parses in the main
+                         process. default = 0
+    queue_depth (int): When parse_workers > 0, the maximum number of pages held between download
+                       and output. default = 32
+    batch_size (int): Number of scraped rows buffered before they are appended to the output .csv
+                      file. default = 25
+    output_format (str): The format of the saved stats file, 'csv', or 'parquet' / 'feather' for a
+                         typed columnar file (requires pyarrow). default = 'csv'
+    all_seasons (bool): Also save every season of every player in a long-format file
+                        (nfl_seasons-POSITION-DATE.csv, one row per player and season). default = False
+    snapshot_options (dict): Options for the snapshot store (enabled, path), which keeps every saved
+                             stats file in a SQLite database. See utils/snapshot_utils.py. default = None
+    metrics_options (dict): Options for the per-stage metrics (enabled, formats). A summary of request,
+                            parse, write and conversion times is saved at the end of scrapePage as
+                            scraped_data/metrics-POSITION.json / .prom. See utils/metrics_utils.py.
+                            default = None (no metrics)
+    queue_options (dict): Options for the priority queue (enabled, max_age_hours, max_requests,
+                          max_seconds). Profiles are scraped by popularity index and staleness, within
+                          a request or time budget. See utils/queue_utils.py. default = None (page order)
+    fingerprint_options (dict): Options for the page layout check (enabled, check_pages, sample_every,
+                                max_mismatch). The card selectors of the first pages, and of a sample
+                                of the rest, are compared with earlier runs, and scrapePage stops early
+                                if the layout changed. See utils/fingerprint_utils.py. default = None
 
     Returns
     --------
+    getPage: Returns the raw html text based on the given url
     getPagebs4: Returns html parsed content based on the given url
+    fetchPages: Yields the raw html text for a list of urls, in the same order as the list
+    iterRows: Yields the parsed row of every url in a list, in the same order as the list
     getNameLinks: Returns a list of player profile links for a given position.
-                  Option to save list as a .csv file.
+                  Option to save list as a .csv file, and report the players added and
+                  removed since the last saved list.
     scrapePage: Returns a csv file of different football statistics and attributes for all players
                 that were provided by the getNameLinks function. This function saves a .csv file in
                 ../scraped_data/, which can later be used to for analysis
@@ -63,14 +131,117 @@ class web_crawler:
     which position you want to scrape data for (running back, quarterback etc...)
     """
 
-    def __init__(self, url, headers, cookies):
+    def __init__(
+        self,
+        url,
+        headers,
+        cookies,
+        fetch_mode="serial",
+        max_in_flight=8,
+        transport_options=None,
+        rate_limit_options=None,
+        cache_options=None,
+        parse_backend="bs4",
+        parse_workers=0,
+        queue_depth=32,
+        batch_size=25,
+        output_format="csv",
+        all_seasons=False,
+        snapshot_options=None,
+        metrics_options=None,
+        queue_options=None,
+        fingerprint_options=None,
+    ):
         self.url = url
         self.headers = headers
         self.cookies = cookies
+        self.fetch_mode = fetch_mode
+        self.max_in_flight = max_in_flight
+        self.parse_backend = parse_backend
+        self.parse_workers = parse_workers
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size
+        self.output_format = output_format
+        self.all_seasons = all_seasons
+        # Thread pool shared with other crawlers, set by utils.schedule_utils.scrape_positions
+        self.executor = None
+        # Parser process pool shared with other crawlers, set by utils.schedule_utils.make_crawlers
+        self.parse_executor = None
+
+        # Per-stage counters and histograms, a no-op unless enabled in config.yaml
+        metrics_options = dict(metrics_options or {})
+        self.metrics = stage_metrics(
+            enabled=metrics_options.pop("enabled", False),
+            labels={"position": self.url.split("/")[-1]},
+        )
+        self.metrics_formats = metrics_options.pop("formats", ["json", "prometheus"])
+
+        # Token bucket shared by every request, only used if enabled in config.yaml
+        rate_limit_options = dict(rate_limit_options or {})
+        if rate_limit_options.pop("enabled", False):
+            rate_limiter = token_bucket(**rate_limit_options)
+        else:
+            rate_limiter = None
+
+        # One pooled session for every request this crawler sends
+        self.transport = http_transport(
+            headers=self.headers,
+            cookies=self.cookies,
+            rate_limiter=rate_limiter,
+            metrics=self.metrics,
+            **(transport_options or {}),
+        )
+
+        # On-disk cache of raw html, only used if enabled in config.yaml
+        cache_options = dict(cache_options or {})
+        if cache_options.pop("enabled", False):
+            self.cache = response_cache(**cache_options)
+        else:
+            self.cache = None
+
+        # SQLite store of every saved stats file, only used if enabled in config.yaml
+        snapshot_options = dict(snapshot_options or {})
+        if snapshot_options.pop("enabled", False):
+            self.snapshots = snapshot_store(**snapshot_options)
+        else:
+            self.snapshots = None
 
         self.LINKS_OUTPATH = "scraped_data/"
         self.pos_str = self.url.split("/")[-1]
         self.link_path = self.LINKS_OUTPATH + self.pos_str + ".csv"
+        self.manifest_path = self.LINKS_OUTPATH + "manifest-" + self.pos_str + ".json"
+        self.checkpoint_path = (
+            self.LINKS_OUTPATH + "checkpoint-" + self.pos_str + ".txt"
+        )
+        self.seasons_checkpoint_path = (
+            self.LINKS_OUTPATH + "checkpoint-seasons-" + self.pos_str + ".txt"
+        )
+        self.metrics_path = self.LINKS_OUTPATH + "metrics-" + self.pos_str
+        self.links_diff_path = (
+            self.LINKS_OUTPATH + "links-diff-" + self.pos_str + ".json"
+        )
+        # Added and removed players of the last getNameLinks call
+        self.link_diff = None
+
+        # Priority queue and budget of scrapePage, only used if enabled in config.yaml
+        queue_options = dict(queue_options or {})
+        if queue_options.pop("enabled", False):
+            self.queue = scrape_queue(
+                self.LINKS_OUTPATH + "queue-" + self.pos_str + ".json", **queue_options
+            )
+        else:
+            self.queue = None
+
+        # Structural check of the profile pages, only used if enabled in config.yaml
+        fingerprint_options = dict(fingerprint_options or {})
+        if fingerprint_options.pop("enabled", False):
+            self.fingerprint = layout_check(
+                self.LINKS_OUTPATH + "fingerprint-" + self.pos_str + ".json",
+                metrics=self.metrics,
+                **fingerprint_options,
+            )
+        else:
+            self.fingerprint = None
 
     def __repr__(self):
         """
@@ -89,6 +260,93 @@ class web_crawler:
                 f'The "pos" parameter in profile_config.yaml is not set to one of {pos_array}'
             )
 
+    def fetch_assert_check(self):
+        """
+        Asserts that the fetch_mode parameter from config.yaml is set to one of the 3 fetch options
+        """
+        mode_array = ["serial", "thread", "asyncio"]
+
+        if self.fetch_mode not in mode_array:
+            raise ValueError(
+                f'The "mode" parameter in config.yaml is not set to one of {mode_array}'
+            )
+        if int(self.max_in_flight) < 1:
+            raise ValueError(
+                'The "max_in_flight" parameter in config.yaml must be >= 1'
+            )
+
+    def getPage(self, url):
+        """
+        This gets the raw page html text for a given page on www.playerprofiler.com
+
+        Parameters
+        ----------
+        url (str): the url of the website (default = https://www.playerprofiler.com/position/POSITION})
+
+        Returns
+        --------
+        text (str): Returns the html text of the given url, or None if the page could not be accessed
+
+        Notes
+        -----
+        If the response cache is enabled, fresh pages are read from disk, and expired pages are
+        revalidated with a conditional request. In offline mode, only cached pages are returned.
+        """
+        with self.metrics.timer("fetch.page_seconds"):
+            return self._getPage(url)
+
+    def _getPage(self, url):
+        """
+        Downloads a page for getPage, which times it
+        """
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.get(url)
+            if entry is not None and (self.cache.offline or self.cache.is_fresh(entry)):
+                text = self.cache.read(url, entry)
+                if text is not None:
+                    self.metrics.inc("cache.hits")
+                    return text
+                entry = None
+            if self.cache.offline:
+                self.metrics.inc("cache.misses")
+                logger.error(f"Offline mode: no cached copy of {url}")
+                return None
+
+        try:
+            req = self.transport.get(
+                url,
+                headers=self.cache.conditional_headers(entry) if entry else None,
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Could not access page {url}: {e}")
+            return None
+
+        if req.status_code == 304 and entry is not None:
+            # Page has not changed since it was cached
+            text = self.cache.read(url, entry, revalidated=True)
+            if text is not None:
+                self.metrics.inc("cache.revalidated")
+                return text
+            req = self.transport.get(url)
+
+        if req.status_code != 200:
+            logger.error(
+                f"Reqeust code is not [200] ({req.status_code}). Could not access page {url}"
+            )
+            return None
+
+        if self.cache is not None:
+            # A 304 is counted in cache.revalidated, only downloaded bodies are misses
+            self.metrics.inc("cache.misses")
+            self.cache.put(
+                url,
+                req.text,
+                etag=req.headers.get("ETag"),
+                last_modified=req.headers.get("Last-Modified"),
+            )
+        return req.text
+
     def getPagebs4(self, url):
         """
         This gets the page html code for a given page on www.playerprofiler.com
@@ -101,14 +359,98 @@ class web_crawler:
         --------
         soup (bs4 instance): Returns html parsed content based on the given url
         """
-        req = requests.get(url=url, headers=self.headers, cookies=self.cookies)
-        if req.status_code != 200:
-            logger.error("Reqeust code is not [200]. Could not access page")
+        text = self.getPage(url)
+        if text is None:
             return None
-        soup = BeautifulSoup(req.text, "lxml")
+        soup = BeautifulSoup(text, "lxml")
         return soup
 
-    def getNameLinks(self, pop_index=True, save=True, scrape_links=True):
+    def fetchPages(self, page_list):
+        """
+        Downloads the html text for every link in page_list. Depending on fetch_mode, the pages are
+        downloaded one at a time ('serial'), or with up to max_in_flight requests overlapping
+        ('thread', 'asyncio').
+
+        Parameters
+        ----------
+        page_list (list): A list of player links retrieved from 'getNameLinks'
+
+        Returns
+        --------
+        generator: Yields the html text (or None on a failed request) for each link, in the
+                   same order as page_list
+        """
+        self.fetch_assert_check()
+
+        if self.fetch_mode == "serial":
+            for page in page_list:
+                yield self.getPage(page)
+
+        elif self.fetch_mode == "thread":
+            # Sliding window of futures, so results come out in page_list order
+            # and at most max_in_flight requests are waiting at any time.
+            # A shared executor (multi-position runs) is used instead of a private one if set
+            executor = self.executor or ThreadPoolExecutor(
+                max_workers=self.max_in_flight
+            )
+            try:
+                window = deque()
+                for page in page_list:
+                    if len(window) >= self.max_in_flight:
+                        yield window.popleft().result()
+                    window.append(executor.submit(self.getPage, page))
+                while window:
+                    yield window.popleft().result()
+            finally:
+                if self.executor is None:
+                    executor.shutdown()
+
+        else:
+            # The event loop runs in its own thread, so this also works when called from a
+            # running loop (a notebook or a service)
+            loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+            loop_thread.start()
+            executor = self.executor or ThreadPoolExecutor(
+                max_workers=self.max_in_flight
+            )
+            pages = self._fetch_async(page_list, executor)
+            try:
+                while True:
+                    try:
+                        yield asyncio.run_coroutine_threadsafe(
+                            pages.__anext__(), loop
+                        ).result()
+                    except StopAsyncIteration:
+                        break
+            finally:
+                asyncio.run_coroutine_threadsafe(pages.aclose(), loop).result()
+                loop.call_soon_threadsafe(loop.stop)
+                loop_thread.join()
+                loop.close()
+                if self.executor is None:
+                    executor.shutdown()
+
+    async def _fetch_async(self, page_list, executor):
+        """
+        Downloads the pages of page_list on the event loop, through executor. Yields the html texts
+        in page_list order, with at most max_in_flight requests waiting at any time
+        """
+        loop = asyncio.get_running_loop()
+        window = deque()
+        try:
+            for page in page_list:
+                if len(window) >= self.max_in_flight:
+                    yield await window.popleft()
+                window.append(loop.run_in_executor(executor, self.getPage, page))
+            while window:
+                yield await window.popleft()
+        finally:
+            # The caller stopped early: drop the requests that have not started
+            for future in window:
+                future.cancel()
+
+    def getNameLinks(self, pop_index=True, save=True, scrape_links=True, order="page"):
         """
         Retreives the links for all players at a given position. Will save all links in a .csv
         file that will be later called for scraping.
@@ -117,8 +459,12 @@ class web_crawler:
         ----------
         pop_index (bool): Determines whether to scrape players without a popularity index, a measure of how
                           often a player profile is viewed on the website
-        save (bool): save .csv file of player links, overwriting the last version
+        save (bool): save .csv file of player links (with their popularity index), overwriting the last
+                     version, and a report of the added and removed players in
+                     ../scraped_data/links-diff-POSITION.json
         scrape_links (bool): A boolean function to determine whether you should run this function or not
+        order (str): 'page' keeps the order of the position page. 'priority' returns the players that
+                     were not in the last saved list first, then the others by popularity index
 
         Returns
         --------
@@ -129,63 +475,110 @@ class web_crawler:
         If you have already ran and saved the .csv file, you can set scrape_links to 'False' in
         'profile_config.yaml', and it will bypass this
 
+        The links found are compared with the saved .csv file, and the result is kept in
+        self.link_diff (see utils/links_utils.py)
+
         """
         # Check if the position parameter is properly set
         self.pos_assert_check()
+        if order not in ["page", "priority"]:
+            raise ValueError(f"order must be one of ['page', 'priority'], not {order}")
 
         if scrape_links:
             soup = self.getPagebs4(url=self.url)
-            names = soup.find_all(
-                "a",
-                {
-                    "class": "flex items-center justify-between space-x-3 px-4 md:px-8 pt-2"
-                },
-                href=True,
-            )
+            if soup is None:
+                raise ValueError(f"Could not download the position page {self.url}")
+            # Every link with its popularity index, in page order
+            current = parse_links(soup, pop_index=pop_index)
 
-            if pop_index is True:
-                name_links = []
-                for name in names:
-                    if name.find("span").get_text() == "-":
-                        pass
-                    else:
-                        name_links.append(name["href"])
-            else:
-                name_links = [name["href"] for name in names]
+            previous = {}
+            if os.path.isfile(self.link_path):
+                previous = load_links(self.link_path)
+            self.link_diff = link_diff(previous, current)
 
             logger.info(
-                f"Retrieved {len(name_links)} players from {self.pos_str} position"
+                f"Retrieved {len(current)} players from {self.pos_str} position"
             )
             logger.info(f"Population_index set: {pop_index}")
+            logger.info(
+                f"{self.pos_str}: {len(self.link_diff.added)} players added, "
+                f"{len(self.link_diff.removed)} removed since the last saved list"
+            )
+            self.metrics.inc("links.added", len(self.link_diff.added))
+            self.metrics.inc("links.removed", len(self.link_diff.removed))
 
             if save:
-                df = pd.DataFrame()
-                df["saved_links"] = name_links
                 self.check_path_exist(self.LINKS_OUTPATH)
-                df.to_csv(self.link_path, index=False)
+                save_links(self.link_path, self.link_diff.links)
+                self.link_diff.save(self.links_diff_path)
                 logger.info(f"Saving page links in {self.LINKS_OUTPATH}")
 
-            return name_links
+            if order == "priority":
+                return self.link_diff.priority()
+            return list(current)
 
         else:
-            # load previous position link csv file, convert to numpy file
+            # load previous position link csv file
             try:
-                name_links = pd.read_csv(self.link_path).to_numpy().ravel()
+                links = load_links(self.link_path)
             except:
                 logger.warn("Links for position csv do not exist, scraping now.")
-                name_links = self.getNameLinks(
-                    pop_index=pop_index, save=True, scrape_links=True
+                return self.getNameLinks(
+                    pop_index=pop_index, save=True, scrape_links=True, order=order
                 )
-            return name_links
+            # Nothing changed since the saved list
+            self.link_diff = link_diff(
+                links, {url: entry["pop_index"] for url, entry in links.items()}
+            )
+            if order == "priority":
+                return self.link_diff.priority()
+            return list(links)
 
-    def scrapePage(self, page_list=None, save=True):
+    def iterRows(self, page_list, parse_fn, reuse_fn=None):
+        """
+        Downloads and parses every page in page_list, parsing in this process
+
+        Parameters
+        ----------
+        page_list (list): A list of player links retrieved from 'getNameLinks'
+        parse_fn (function): Turns an html text into a row
+        reuse_fn (function): Optional. Called as reuse_fn(url, html) before parsing. If it returns
+                             a row, that row is used and the page is not parsed
+
+        Returns
+        --------
+        generator: Yields (url, html, row, reused) for each page, in page_list order. Same as
+                   utils.pipeline_utils.parse_pipeline
+        """
+        for page, html in zip(page_list, self.fetchPages(page_list)):
+            if html is None:
+                yield page, None, None, False
+                continue
+
+            row = reuse_fn(page, html) if reuse_fn else None
+            if row is not None:
+                yield page, html, row, True
+            else:
+                yield page, html, parse_fn(html), False
+
+    def scrapePage(self, page_list=None, save=True, incremental=False, resume=False):
         """
         Scrapes all information on a given player profiler page, saves all data to a final .csv file
 
         Parameters
         ----------
         page_list (list): A list of player links retrieved from 'getNameLinks'
-        save (bool): Determines whether to save .csv file
+        save (bool): Determines whether to save .csv file. Rows are appended to the file in batches
+                     as they are scraped, and a checkpoint file records the players already written.
+                     If all_seasons is set, the season rows of every player are written the same way
+                     to nfl_seasons-POSITION-DATE.csv
+        incremental (bool): Only parse players whose page changed since the last run. Rows of
+                            unchanged players are taken from the manifest in ../scraped_data/
+        resume (bool): Continue the .csv file of an interrupted run, skipping the players recorded
+                       in its checkpoint file
+
+        If a queue budget leaves players out, their last rows (and season rows) are copied from the
+        manifest, so the day's file still lists every player scraped before
 
         Returns
         --------
@@ -193,96 +586,14 @@ class web_crawler:
         """
         # Retrieves an array of data headings based on the position
         att_list = pos_dict(self.pos_str)
-        # Makes empty dictionary from att_list
-        att_dict = {item: None for item in list(chain.from_iterable(att_list))}
-        # Setting empty array to append all scraped data
+        # Compiled once: maps every column to its card, index and converter
+        plan = pos_plan(self.pos_str)
+        # Setting empty array to append all scraped data (only used if save is False)
         stats = list()
+        # Long-format season table: name, season, then the season stats card
+        season_att_list = [["name"], ["season"], att_list[4]]
+        seasons_writer = None
 
-        # Iterate through each page_list
-        for page in tqdm(page_list):
-            # Retrieve soup instance
-            soup = self.getPagebs4(url=page)
-
-            # Title card (top part of the card): Name, position, team.
-            card = soup.find(
-                "div",
-                {"class": "flex-1 md:space-y-1"},
-            )
-            soup_cmd = [
-                get_text_exist(card, "h1"),
-                get_text_exist(
-                    card, "div", "leading-none text-xl md:text-2xl -mb-px md:mb-0"
-                ),
-                get_text_exist(card, "a", "text-blue-light hover:underline").replace(
-                    "\n", ""
-                ),
-            ]
-            # Write to dictionary
-            card_to_dict(att_list[0], soup_cmd, att_dict)
-
-            # Player card (top left hand side): Height, weight, draft, college, age
-            player_card = get_card(
-                soup,
-                tag="span",
-                tag_class="class",
-                html_str="leading-none whitespace-nowrap",
-            )
-
-            soup_cmd = [
-                convert_inch_to_cm(player_card[0]),
-                convert_to_num(player_card[1], remove_chars=True),
-                player_card[3],
-                player_card[4],
-                convert_to_num(player_card[5]),
-            ]
-            # Write to dictionary
-            card_to_dict(att_list[1], soup_cmd, att_dict)
-
-            # Metrics card: 40, speed, burst, agility, bench
-            metrics_card = get_card(
-                soup,
-                tag="span",
-                tag_class="class",
-                html_str="block font-light text-xs sm:text-sm leading-none",
-            )
-            soup_cmd = [convert_to_num(metrics_card[k]) for k in range(0, 5)]
-            # Write to dictionary
-            card_to_dict(att_list[2], soup_cmd, att_dict)
-
-            # College stats card: col-dom, col-ypc/ypr, col-tar/sparq, col-sparq
-            key_soup = soup.find("section", {"id": "key-stats"})
-            key_card = get_card(key_soup, tag="span")
-            key_card = [x for x in key_card if "(" not in x]
-            soup_cmd = [convert_to_num(key_card[k]) for k in range(0, 4)]
-            # Write to dictionary
-            card_to_dict(att_list[3], soup_cmd, att_dict)
-
-            # Season stats card: 'games-played', 'rush-attempts',
-            #                    'rush-yards', 'ypc-nfl', 'rec',
-            #                    'rec-yards', 'tds', 'fantasy-ppg'
-            # TODO: Only retrieves latest year, get all years later
-            szn_soup = soup.find(
-                "tr", {"class": "border-t border-solid border-gray-700"}
-            )
-            try:
-                # If there is no 2022 stats, fill szn_card with nan
-                szn_card = get_card(
-                    szn_soup,
-                    tag="span",
-                    tag_class="class",
-                    html_str="text-xxs md:text-base",
-                )
-            except:
-                szn_card = ["NaN"] * 9
-            soup_cmd = [convert_to_num(szn_card[k]) for k in range(1, 9)]
-            card_to_dict(att_list[4], soup_cmd, att_dict)
-
-            # appends all values in the dictionary to an array
-            stats.append(tuple(att_dict.values()))
-
-        # Writes the appended array of stats to a pandas dataframe
-        df_stats = pd.DataFrame(stats, columns=list(chain.from_iterable(att_list)))
-        # Saving df file
         if save:
             # Setting the output path for writing .csv
             todays_date = time.strftime("%d-%m-%Y")
@@ -294,11 +605,239 @@ class web_crawler:
                 + todays_date
                 + ".csv"
             )
-            logger.info(f"Saving csv... in {OUTPUT}")
-            df_stats.to_csv(OUTPUT, index=False)
+            self.check_path_exist(self.LINKS_OUTPATH)
+            writer = checkpoint_writer(
+                OUTPUT,
+                self.checkpoint_path,
+                columns=plan.columns,
+                batch_size=self.batch_size,
+                resume=resume,
+                metrics=self.metrics,
+            )
+            if self.all_seasons:
+                seasons_writer = checkpoint_writer(
+                    OUTPUT.replace("nfl_stats-", "nfl_seasons-"),
+                    self.seasons_checkpoint_path,
+                    columns=chain.from_iterable(season_att_list),
+                    batch_size=self.batch_size,
+                    resume=resume,
+                    metrics=self.metrics,
+                    metrics_stage="write_seasons",
+                )
+                # A player is only skipped once both files have it
+                done = writer.done & seasons_writer.done
+                page_list = [page for page in page_list if page not in done]
+            else:
+                page_list = writer.remaining(page_list)
+            logger.info(f"Saving csv... in {writer.path}")
+
+        # Most viewed and stalest players first, within the request budget. The players the run
+        # does not reach keep their previous rows (see carry_rows)
+        all_pages = page_list
+        if self.queue is not None:
+            page_list = self.queue.plan(page_list, self.pop_indexes())
+
+        # Manifest of page hashes and parsed rows from previous runs
+        manifest = None
+        reuse_fn = None
+        if incremental or self.queue is not None:
+            manifest = scrape_manifest(self.manifest_path, plan.columns)
+        if incremental:
+            reuse_fn = lambda page, html: manifest.lookup(page, manifest.digest(html))
+
+        # Pages are checked in this process, before they are parsed, so a layout change stops the
+        # run before the writers get misaligned rows
+        if self.fingerprint is not None:
+            reuse_fn = self.fingerprint.guard(reuse_fn)
+
+        # Season rows are read in the same pass as the stats row (in the parser processes, if any)
+        parse_seasons = seasons_writer is not None
+
+        # Iterate through each page_list, downloading pages according to fetch_mode
+        if self.parse_workers > 0:
+            # Parse in a pool of processes, fed by fetcher threads
+            rows = parse_pipeline(
+                page_list,
+                fetch_fn=self.getPage,
+                parse_fn=partial(
+                    parse_profile,
+                    att_list=att_list,
+                    backend=self.parse_backend,
+                    plan=plan,
+                    seasons=parse_seasons,
+                ),
+                reuse_fn=reuse_fn,
+                fetch_workers=1 if self.fetch_mode == "serial" else self.max_in_flight,
+                fetch_executor=self.executor,
+                parse_executor=self.parse_executor,
+                parse_workers=self.parse_workers,
+                queue_depth=self.queue_depth,
+            )
+        else:
+            rows = self.iterRows(
+                page_list,
+                parse_fn=partial(
+                    parse_profile,
+                    att_list=att_list,
+                    backend=self.parse_backend,
+                    metrics=self.metrics,
+                    plan=plan,
+                    seasons=parse_seasons,
+                ),
+                reuse_fn=reuse_fn,
+            )
+
+        # The writers keep their checkpoints if scraping stops with an error
+        written = set()
+        with writer if save else nullcontext(), seasons_writer or nullcontext():
+            for page, html, row, reused in tqdm(
+                rows, total=len(page_list), desc=self.pos_str
+            ):
+                if html is None:
+                    row = manifest.last_row(page) if manifest is not None else None
+                    if row is None:
+                        logger.error(f"Skipping {page}, page could not be downloaded")
+                        self.metrics.inc("rows.skipped")
+                        continue
+                    # Keep the previous snapshot of this player
+                    logger.warning(
+                        f"{page} could not be downloaded, keeping previous row"
+                    )
+                else:
+                    if parse_seasons and reused:
+                        # Unchanged page: the row comes from the manifest, the seasons from the page
+                        seasons = list(season_rows(html, row[0], len(att_list[4])))
+                    elif parse_seasons:
+                        row, seasons = row
+                    if manifest is not None and not reused:
+                        manifest.update(
+                            page,
+                            manifest.digest(html),
+                            row,
+                            seasons if parse_seasons else None,
+                        )
+                self.metrics.inc("rows.reused" if reused else "rows.parsed")
+                if self.queue is not None and html is not None:
+                    self.queue.mark(page)
+
+                # appends the row to the output file, or to an array
+                written.add(page)
+                if save:
+                    writer.write(page, row)
+                else:
+                    stats.append(row)
+
+                if parse_seasons and html is not None:
+                    for season in seasons:
+                        seasons_writer.write(page, season)
+
+                # Pages already downloading are dropped, the rest is left for a later run
+                if self.queue is not None and self.queue.expired():
+                    logger.info(
+                        f"{self.pos_str}: time budget of {self.queue.max_seconds}s spent, "
+                        f"stopping after {page}"
+                    )
+                    self.metrics.inc("queue.time_budget_stops")
+                    break
+
+            if self.queue is not None:
+                left_out = [page for page in all_pages if page not in written]
+                carried = self.carry_rows(
+                    left_out,
+                    manifest,
+                    writer.write if save else lambda page, row: stats.append(row),
+                    seasons_writer.write if parse_seasons else None,
+                )
+                logger.info(
+                    f"{self.pos_str}: kept the previous rows of {carried} of the "
+                    f"{len(left_out)} players left out of the budget"
+                )
+
+        if manifest is not None:
+            self.check_path_exist(self.LINKS_OUTPATH)
+            manifest.save()
+
+        if self.queue is not None:
+            self.check_path_exist(self.LINKS_OUTPATH)
+            self.queue.save()
+
+        if self.fingerprint is not None:
+            self.check_path_exist(self.LINKS_OUTPATH)
+            self.fingerprint.save()
+
+        if self.transport.rate_limiter is not None:
+            logger.info(
+                f"Rate limiter ({self.pos_str}): {self.transport.rate_limiter.stats()}"
+            )
+
+        if save:
+            OUTPUT = writer.path
+            if self.output_format != "csv":
+                with self.metrics.timer("convert.output_seconds"):
+                    OUTPUT = convert_output(OUTPUT, att_list, self.output_format)
+                    if seasons_writer is not None:
+                        convert_output(
+                            seasons_writer.path, season_att_list, self.output_format
+                        )
+            # Read back the complete file, including rows from a resumed run
+            with self.metrics.timer("read.output_seconds"):
+                df_stats = read_output(OUTPUT)
+            if self.snapshots is not None:
+                with self.metrics.timer("snapshot.ingest_seconds"):
+                    self.snapshots.ingest(OUTPUT, att_list, df=df_stats)
+        else:
+            # Writes the appended array of stats to a pandas dataframe
+            df_stats = pd.DataFrame(stats, columns=list(plan.columns))
+
+        if self.metrics.enabled:
+            self.check_path_exist(self.LINKS_OUTPATH)
+            self.metrics.save(self.metrics_path, self.metrics_formats)
 
         return df_stats
 
+    def carry_rows(self, page_list, manifest, write_fn, seasons_write_fn=None):
+        """
+        Writes the last rows stored in the manifest for players a budgeted run did not scrape, so
+        the day's stats file (and the snapshot taken from it) still lists every player
+
+        Parameters
+        ----------
+        page_list (list): The player links that were not scraped in this run
+        manifest (scrape_manifest): The manifest of the position
+        write_fn (function): Called as write_fn(url, row) for every stored row
+        seasons_write_fn (function): Optional. Called as seasons_write_fn(url, season) for every
+                                     stored season row
+
+        Returns
+        --------
+        int: The number of players whose row was written. Players never scraped have no row
+        """
+        carried = 0
+        for page in page_list:
+            row = manifest.last_row(page)
+            if row is None:
+                continue
+            write_fn(page, row)
+            if seasons_write_fn is not None:
+                for season in manifest.last_seasons(page) or []:
+                    seasons_write_fn(page, season)
+            carried += 1
+        self.metrics.inc("rows.carried", carried)
+        return carried
+
+    def pop_indexes(self):
+        """
+        Returns the popularity index of every player link, from the last getNameLinks call, or
+        from the saved links file
+        """
+        if self.link_diff is not None:
+            links = self.link_diff.links
+        elif os.path.isfile(self.link_path):
+            links = load_links(self.link_path)
+        else:
+            return {}
+        return {url: entry["pop_index"] for url, entry in links.items()}
+
     @classmethod
     def check_path_exist(self, path=None):
         """
@@ -308,12 +847,21 @@ class web_crawler:
             pass
         else:
             print("Path does not exist. Creating path now.")
-            os.mkdir(path)
+            # exist_ok, since crawlers of several positions may get here at the same time
+            os.makedirs(path, exist_ok=True)
 
 
 ##### FUNCTIONS ######
 
 
+def pos_plan(pos_str):
+    """
+    Returns the compiled extraction plan of a position (see utils/plan_utils.py). The plan is
+    built and checked against the card layout once, then reused for every page
+    """
+    return compile_plan(pos_dict(pos_str), CONVERTERS)
+
+
 def pos_dict(pos_str):
     """
     Returns a list of attributes based on the position.
@@ -340,6 +888,171 @@ def pos_dict(pos_str):
         raise ValueError("This must be one of 4 offensive football positions")
 
 
+def parse_profile(
+    html, att_list, backend="bs4", metrics=None, plan=None, seasons=False
+):
+    """
+    Parses a single player profile page into one row of scraped data
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+    att_list (list): A list of positional headings, from pos_dict()
+    backend (str): The html extraction backend, 'bs4' (BeautifulSoup) or 'lxml'
+                   (precompiled XPath, see utils/extract_utils.py)
+    metrics (stage_metrics): Optional. Records the parse time of each card. Only usable when parsing
+                             in this process, since it cannot be sent to parser processes
+    plan (extraction_plan): The compiled plan of att_list, from pos_plan(). Compiled from att_list
+                            if not given
+    seasons (bool): Also return every season of the page, read from the same parse
+
+    Returns
+    --------
+    tuple: The values of every attribute in att_list, in order. With seasons, (row, season rows),
+           with the season rows as from season_rows()
+    """
+    if plan is None:
+        plan = compile_plan(att_list, CONVERTERS)
+
+    if backend == "bs4":
+        cards = extract_cards(html, metrics=metrics, seasons=seasons)
+    elif backend == "lxml":
+        cards = extract_cards_lxml(html, metrics=metrics, seasons=seasons)
+    else:
+        raise ValueError(
+            f"Parser backend must be one of ['bs4', 'lxml'], not {backend}"
+        )
+
+    with metrics.timer("parse.row_seconds") if metrics else nullcontext():
+        row = plan.apply(cards)
+    if not seasons:
+        return row
+    n_stats = len(att_list[4])
+    return row, [season_row(row[0], cells, n_stats) for cells in cards["seasons"]]
+
+
+def extract_cards(html, metrics=None, seasons=False):
+    """
+    Finds the raw text of the five cards on a player profile page, using BeautifulSoup
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+    metrics (stage_metrics): Optional. Records the time spent building the tree and reading each card
+    seasons (bool): Also read every row of the season stats table, as 'seasons'
+
+    Returns
+    --------
+    cards (dict): The text entries of the 'title', 'player', 'metrics', 'key' and 'season' cards
+    """
+    timer = metrics.timer if metrics is not None else lambda name: nullcontext()
+
+    with timer("parse.tree_seconds"):
+        soup = BeautifulSoup(html, "lxml")
+
+    # Title card (top part of the card): Name, position, team.
+    with timer("parse.title_seconds"):
+        card = soup.find(
+            "div",
+            {"class": "flex-1 md:space-y-1"},
+        )
+        title_card = [
+            get_text_exist(card, "h1"),
+            get_text_exist(
+                card, "div", "leading-none text-xl md:text-2xl -mb-px md:mb-0"
+            ),
+            get_text_exist(card, "a", "text-blue-light hover:underline"),
+        ]
+
+    # Player card (top left hand side): Height, weight, draft, college, age
+    with timer("parse.player_seconds"):
+        player_card = get_card(
+            soup,
+            tag="span",
+            tag_class="class",
+            html_str="leading-none whitespace-nowrap",
+        )
+
+    # Metrics card: 40, speed, burst, agility, bench
+    with timer("parse.metrics_seconds"):
+        metrics_card = get_card(
+            soup,
+            tag="span",
+            tag_class="class",
+            html_str="block font-light text-xs sm:text-sm leading-none",
+        )
+
+    # College stats card: col-dom, col-ypc/ypr, col-tar/sparq, col-sparq
+    with timer("parse.college_seconds"):
+        key_soup = soup.find("section", {"id": "key-stats"})
+        key_card = get_card(key_soup, tag="span")
+        key_card = [x for x in key_card if "(" not in x]
+
+    # Season stats card: 'games-played', 'rush-attempts',
+    #                    'rush-yards', 'ypc-nfl', 'rec',
+    #                    'rec-yards', 'tds', 'fantasy-ppg'
+    # Latest season only, every season is read below
+    with timer("parse.season_seconds"):
+        szn_soup = soup.find("tr", {"class": "border-t border-solid border-gray-700"})
+        try:
+            # If there is no 2022 stats, fill szn_card with nan
+            szn_card = get_card(
+                szn_soup,
+                tag="span",
+                tag_class="class",
+                html_str="text-xxs md:text-base",
+            )
+        except:
+            szn_card = ["NaN"] * 9
+
+    cards = {
+        "title": title_card,
+        "player": player_card,
+        "metrics": metrics_card,
+        "key": key_card,
+        "season": szn_card,
+    }
+
+    # Every season, from the same tree
+    if seasons:
+        with timer("parse.seasons_seconds"):
+            cards["seasons"] = [
+                get_card(
+                    row, tag="span", tag_class="class", html_str="text-xxs md:text-base"
+                )
+                for row in soup.find_all("tr", {"class": SEASON_ROW_CLASS})
+            ]
+    return cards
+
+
+def season_rows(html, name, n_stats=8):
+    """
+    Yields every season of a player profile page as a row of the long-format season table,
+    one season at a time (see utils.extract_utils.iter_season_cards). Parsed pages get their
+    seasons from parse_profile(seasons=True) instead; this is for pages that are not parsed
+
+    Parameters
+    ----------
+    html (str): The html text of a player profile page
+    name (str): The player name, written in front of every row
+    n_stats (int): The number of stats in the season stats card of the position
+
+    Returns
+    --------
+    generator: Yields (name, season, stat, stat, ...) for each season, most recent first
+    """
+    for cells in iter_season_cards(html):
+        yield season_row(name, cells, n_stats)
+
+
+def season_row(name, cells, n_stats=8):
+    """
+    Converts the cells of a season row ([year, stat, stat, ...]) into a row of the season table
+    """
+    cells = list(cells) + ["NaN"] * (n_stats + 1 - len(cells))
+    return (name, *[convert_to_num(cells[k]) for k in range(0, n_stats + 1)])
+
+
 def get_text_exist(soup, tag, tag_class=None, return_text=True):
     """
     Beautifulsoup function that retrieves the text from a search function in bs4.
@@ -405,60 +1118,10 @@ def get_card(soup, tag, tag_class=None, html_str=None, return_text=True):
         return item
 
 
-def convert_to_num(item, remove_chars=True):
-    """
-    A function to convert string entries to integers from the player profiler website
-    """
-
-    if remove_chars:
-        item = re.sub("[^\d.]+", "", item)
-
-    if item.isdigit():
-        return int(item)
-    elif item.count(".") == 1:
-        return float(item)
-    else:
-        return np.nan
-
-
-def convert_inch_to_cm(item):
-    """
-    A function to convert inches to centimeters for height on the website
-    """
-
-    item = re.sub("\D", "", item)
-    try:
-        feet, inches = float(item[0]), float(item[1])
-    except:
-        return np.nan
-
-    inches += feet * 12
-
-    cm = round(inches * 2.54, 1)
-
-    return cm
-
-
-def card_to_dict(att_list, soup_cmd, att_dict):
-    """
-    A function to write the soup parsed data to the attribute dictionary. This dictionary will then be
-    written to a pandas dataframe.
-
-    Parameters
-    ----------
-    att_list (list): A list of statistical headers on the website.
-                     E.G: yards per carry, receptions, touchdowns etc...
-
-    soup_cmd (list): A list of beautiful soup commands to parse data from a given card
-
-    att_dict (dict): the dictionary that is storing all scraped data from a give player
-    """
-
-    assert len(att_list) == len(
-        soup_cmd
-    ), "The attribute dictionary list does not match the number of attributes"
-
-    zip_list = list(zip(att_list, soup_cmd))
-
-    for att in zip_list:
-        att_dict[att[0]] = att[1]
+# Converters of the card layout in utils/plan_utils.py. None keeps the raw text
+CONVERTERS = {
+    "text": None,
+    "no_newlines": remove_newlines,
+    "num": convert_to_num,
+    "height": convert_inch_to_cm,
+}
@@ -0,0 +1,294 @@
+"""
+nfl-web-scraping.utils.snapshot_utils
+~~~~~~~~~~~~~~
+This module provides the snapshot store, a SQLite database that keeps every scraped stats file instead
+of only the newest one. Each position has its own table of rows, indexed by player and by scrape date,
+so a player's history or a position as of a given date can be read without loading any .csv file.
+"""
+from contextlib import contextmanager
+from itertools import chain
+import datetime
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from utils.writer_utils import pos_dtypes, read_output
+
+logger = logging.getLogger(__name__)
+
+# nfl_stats-POSITION-DD-MM-YYYY.(csv|parquet|feather), as written by web_crawler.scrapePage
+SNAPSHOT_NAME = re.compile(
+    r"^nfl_stats-(?P<pos>[a-z-]+)-(?P<date>\d{2}-\d{2}-\d{4})\.(csv|parquet|feather)$"
+)
+
+
+def parse_snapshot_name(path):
+    """
+    Returns the position and the scrape date (YYYY-MM-DD) of a stats file from its name, or None if
+    the name does not follow the nfl_stats-POSITION-DD-MM-YYYY pattern
+    """
+    match = SNAPSHOT_NAME.match(os.path.basename(path))
+    if match is None:
+        return None
+    date = datetime.datetime.strptime(match["date"], "%d-%m-%Y").date()
+    return match["pos"], date.isoformat()
+
+
+def table_name(pos):
+    """
+    Returns the table holding the rows of a position (e.g. running-back -> stats_running_back)
+    """
+    return "stats_" + pos.replace("-", "_")
+
+
+def quote(col):
+    """
+    Quotes a column name for SQL, since some of them contain dashes (e.g. "40-yard")
+    """
+    return '"' + col.replace('"', '""') + '"'
+
+
+class snapshot_store:
+    """
+    snapshot_store ingests scraped stats files into a SQLite database.
+
+    Every ingested file is one snapshot (a position at a scrape date), recorded in the `snapshots`
+    table. Its rows go into the table of its position, with the columns of att_list_headings.py plus
+    the snapshot id and the scrape date. Rows are indexed on (name, scraped_on) and on scraped_on.
+
+    Parameters
+    ----------
+    path (str): The database file (default = scraped_data/snapshots.db)
+
+    Notes
+    -----
+    Ingesting a file again (e.g. after a resumed run rewrote it) replaces its rows. The database uses
+    one connection per call, so crawlers of several positions can ingest from their own threads.
+    """
+
+    def __init__(self, path="scraped_data/snapshots.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with self.connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    id INTEGER PRIMARY KEY,
+                    position TEXT NOT NULL,
+                    scraped_on TEXT NOT NULL,
+                    source TEXT NOT NULL UNIQUE,
+                    n_rows INTEGER NOT NULL,
+                    ingested_at TEXT NOT NULL
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS snapshots_position_date "
+                "ON snapshots (position, scraped_on)"
+            )
+
+    def __repr__(self):
+        return f"snapshot_store({self.path})"
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a connection to the database, commits if the block succeeds, and closes it
+        """
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def create_table(self, db, pos, att_list):
+        """
+        Creates the table and indexes of a position if they do not exist. Text columns are TEXT,
+        every other column is REAL (see writer_utils.pos_dtypes)
+        """
+        table = table_name(pos)
+        columns = ", ".join(
+            f"{quote(col)} {'TEXT' if dtype == 'string' else 'REAL'}"
+            for col, dtype in pos_dtypes(att_list).items()
+        )
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "snapshot_id INTEGER NOT NULL REFERENCES snapshots (id), "
+            f"scraped_on TEXT NOT NULL, {columns})"
+        )
+        db.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_name_date ON {table} (name, scraped_on)"
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS {table}_date ON {table} (scraped_on)")
+        db.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_snapshot ON {table} (snapshot_id)"
+        )
+
+    def ingest(self, path, att_list, df=None):
+        """
+        Adds a stats file to the store
+
+        Parameters
+        ----------
+        path (str): A stats file written by scrapePage (nfl_stats-POSITION-DD-MM-YYYY.csv/.parquet/.feather)
+        att_list (list): A list of positional headings, from pos_dict()
+        df (DataFrame): Optional. The content of path, if it is already loaded
+
+        Returns
+        --------
+        int: The id of the snapshot
+        """
+        parsed = parse_snapshot_name(path)
+        if parsed is None:
+            raise ValueError(f"{path} is not a nfl_stats-POSITION-DD-MM-YYYY file")
+        pos, scraped_on = parsed
+
+        if df is None:
+            df = read_output(path)
+        columns = list(chain.from_iterable(att_list))
+        # NaN is stored as NULL
+        rows = [
+            [None if isinstance(v, float) and math.isnan(v) else v for v in row]
+            for row in df[columns].itertuples(index=False, name=None)
+        ]
+
+        table = table_name(pos)
+        source = os.path.basename(path)
+        with self.lock, self.connect() as db:
+            self.create_table(db, pos, att_list)
+            old = db.execute(
+                "SELECT id FROM snapshots WHERE source = ?", (source,)
+            ).fetchone()
+            if old is not None:
+                db.execute(f"DELETE FROM {table} WHERE snapshot_id = ?", old)
+                db.execute("DELETE FROM snapshots WHERE id = ?", old)
+
+            snapshot_id = db.execute(
+                "INSERT INTO snapshots (position, scraped_on, source, n_rows, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    pos,
+                    scraped_on,
+                    source,
+                    len(rows),
+                    datetime.datetime.now().isoformat(timespec="seconds"),
+                ),
+            ).lastrowid
+            placeholders = ", ".join("?" * (len(columns) + 2))
+            db.executemany(
+                f"INSERT INTO {table} (snapshot_id, scraped_on, "
+                f"{', '.join(quote(col) for col in columns)}) VALUES ({placeholders})",
+                [(snapshot_id, scraped_on, *row) for row in rows],
+            )
+
+        logger.info(f"Stored {len(rows)} {pos} rows from {source} ({scraped_on})")
+        return snapshot_id
+
+    def ingest_dir(self, path, pos_lists):
+        """
+        Adds every stats file of a directory that is not in the store yet
+
+        Parameters
+        ----------
+        path (str): The directory of stats files (e.g. scraped_data/)
+        pos_lists (dict): The attribute list of every position, e.g. {"quarterback": att_list_qb}
+
+        Returns
+        --------
+        list: The names of the ingested files
+        """
+        with self.connect() as db:
+            known = {source for (source,) in db.execute("SELECT source FROM snapshots")}
+
+        ingested = []
+        for file in sorted(os.listdir(path)):
+            parsed = parse_snapshot_name(file)
+            if parsed is None or file in known or parsed[0] not in pos_lists:
+                continue
+            self.ingest(os.path.join(path, file), pos_lists[parsed[0]])
+            ingested.append(file)
+        return ingested
+
+    def snapshots(self, pos=None):
+        """
+        Returns the list of snapshots (id, position, scraped_on, source, n_rows, ingested_at),
+        oldest first, for one position or for all of them
+        """
+        query = "SELECT * FROM snapshots"
+        params = ()
+        if pos is not None:
+            query += " WHERE position = ?"
+            params = (pos,)
+        with self.connect() as db:
+            return pd.read_sql_query(
+                query + " ORDER BY scraped_on, id", db, params=params
+            )
+
+    def history(self, pos, name, columns=None, start=None, end=None):
+        """
+        Returns the rows of one player over time, oldest first
+
+        Parameters
+        ----------
+        pos (str): The position of the player
+        name (str): The player name, as scraped (e.g. "Josh Allen")
+        columns (list): Optional. The columns to return (e.g. ["fantasy-ppg"]). default = every column
+        start, end (str): Optional. Only keep snapshots scraped between these dates (YYYY-MM-DD, inclusive)
+
+        Returns
+        --------
+        DataFrame: One row per snapshot, with its scraped_on date
+        """
+        selected = "*"
+        if columns is not None:
+            selected = "scraped_on, " + ", ".join(map(quote, columns))
+        query = f"SELECT {selected} FROM {table_name(pos)} WHERE name = ?"
+        params = [name]
+        if start is not None:
+            query += " AND scraped_on >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND scraped_on <= ?"
+            params.append(end)
+
+        with self.connect() as db:
+            df = pd.read_sql_query(query + " ORDER BY scraped_on", db, params=params)
+        return df.drop(columns="snapshot_id", errors="ignore")
+
+    def as_of(self, pos, date=None, columns=None):
+        """
+        Returns the rows of a position from its latest snapshot scraped on or before a date
+
+        Parameters
+        ----------
+        pos (str): The position
+        date (str): A date (YYYY-MM-DD). default = the latest snapshot
+        columns (list): Optional. The columns to return. default = every column of the position
+
+        Returns
+        --------
+        DataFrame: The rows of that snapshot, in their scraped order (empty if there is none)
+        """
+        with self.connect() as db:
+            found = db.execute(
+                "SELECT id FROM snapshots WHERE position = ? AND scraped_on <= ? "
+                "ORDER BY scraped_on DESC, id DESC LIMIT 1",
+                (pos, date or "9999-12-31"),
+            ).fetchone()
+            if found is None:
+                return pd.DataFrame(columns=columns)
+            selected = "*" if columns is None else ", ".join(map(quote, columns))
+            df = pd.read_sql_query(
+                f"SELECT {selected} FROM {table_name(pos)} WHERE snapshot_id = ? ORDER BY rowid",
+                db,
+                params=found,
+            )
+        return df.drop(columns=["snapshot_id", "scraped_on"], errors="ignore")
@@ -0,0 +1,278 @@
+"""
+nfl-web-scraping.utils.writer_utils
+~~~~~~~~~~~~~~
+This module provides the streaming row writer used by web_crawler.scrapePage. Rows are appended to the
+output .csv file in batches as they are scraped, and a checkpoint file records which player urls are
+safely written, so an interrupted run can be resumed. Once complete, the .csv file can be converted
+to a typed Parquet or Feather file.
+"""
+from contextlib import nullcontext
+from itertools import chain
+import csv
+import logging
+import math
+import os
+
+import pandas as pd
+
+from utils.att_list_headings import att_text_columns
+
+logger = logging.getLogger(__name__)
+
+
+class checkpoint_writer:
+    """
+    checkpoint_writer appends scraped rows to a .csv file, and the url of every written row to a
+    checkpoint file.
+
+    The checkpoint file holds the output path on its first line, then one url per line. Urls are only
+    added once their rows are flushed to the .csv file, so the checkpoint never claims a row that
+    was lost.
+
+    Parameters
+    ----------
+    path (str): The output .csv file
+    checkpoint_path (str): The checkpoint file
+    columns (list): The column names, written as the header of a new file
+    batch_size (int): Number of rows buffered before they are flushed to disk
+    resume (bool): Append to the output file of an existing checkpoint instead of starting a new one
+    metrics (stage_metrics): Optional. Records the time of every flush and the number of rows written
+    metrics_stage (str): The name of the writer in the metrics (e.g. write.flush_seconds)
+
+    Notes
+    -----
+    Call close() once every row is written. It flushes the last batch and removes the checkpoint,
+    since a complete run has nothing to resume.
+    """
+
+    def __init__(
+        self,
+        path,
+        checkpoint_path,
+        columns,
+        batch_size=25,
+        resume=False,
+        metrics=None,
+        metrics_stage="write",
+    ):
+        self.checkpoint_path = checkpoint_path
+        self.metrics = metrics
+        self.metrics_stage = metrics_stage
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.buffer = []
+        self.done = set()
+
+        if resume and os.path.isfile(checkpoint_path):
+            with open(checkpoint_path, "r") as f:
+                lines = f.read().splitlines()
+            path = lines[0]
+            self.done = set(lines[1:])
+            logger.info(f"Resuming {path}, {len(self.done)} players already scraped")
+            mode = "a"
+        else:
+            with open(checkpoint_path, "w") as f:
+                f.write(path + "\n")
+            mode = "w"
+
+        self.path = path
+        self.file = open(self.path, mode, newline="")
+        # Same line endings as pandas.to_csv
+        self.writer = csv.writer(self.file, lineterminator="\n")
+        if mode == "w" or self.file.tell() == 0:
+            self.writer.writerow(self.columns)
+            self.file.flush()
+        self.checkpoint = open(self.checkpoint_path, "a")
+
+    def __repr__(self):
+        return f"checkpoint_writer({self.path}, {self.checkpoint_path})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the checkpoint, so the next run can resume from here
+            self.flush()
+            self.file.close()
+            self.checkpoint.close()
+
+    def remaining(self, page_list):
+        """
+        Returns the urls of page_list that are not in the checkpoint, in their original order
+        """
+        return [page for page in page_list if page not in self.done]
+
+    def write(self, url, row):
+        """
+        Buffers one row, flushing the buffer to disk once it holds batch_size rows. A url can have
+        several rows (e.g. one per season). They are always flushed together, and urls already in
+        the checkpoint are not written again
+        """
+        if url in self.done:
+            return
+        if len(self.buffer) >= self.batch_size and self.buffer[-1][0] != url:
+            self.flush()
+        self.buffer.append((url, row))
+
+    def flush(self):
+        """
+        Writes the buffered rows to the .csv file, then records their urls in the checkpoint
+        """
+        if not self.buffer:
+            return
+        if self.metrics is None:
+            timer = nullcontext()
+        else:
+            self.metrics.inc(self.metrics_stage + ".rows", len(self.buffer))
+            timer = self.metrics.timer(self.metrics_stage + ".flush_seconds")
+
+        with timer:
+            self.writer.writerows([format_row(row) for _, row in self.buffer])
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            urls = dict.fromkeys(url for url, _ in self.buffer)
+            self.checkpoint.write("".join(url + "\n" for url in urls))
+            self.checkpoint.flush()
+        self.buffer = []
+
+    def close(self):
+        """
+        Flushes the last rows, writes the numbers of the complete file like pandas.to_csv (see
+        float_columns), and removes the checkpoint file
+        """
+        self.flush()
+        self.file.close()
+        self.checkpoint.close()
+        float_columns(self.path)
+        os.remove(self.checkpoint_path)
+
+
+def float_columns(path):
+    """
+    Rewrites the whole numbers of a complete .csv file as floats ("233" -> "233.0") in every numeric
+    column that also holds a decimal or a missing value. This is how pandas.to_csv writes the
+    scraped rows, since such a column is float64 in a dataframe. Columns of whole numbers only are
+    kept as they are, like int64 columns. Text columns (att_text_columns) are never changed
+
+    Notes
+    -----
+    Rows are streamed, so the type of a column is only known once the whole file is written. The
+    file is read once, and only rewritten (through a temporary file) if a number changes.
+    """
+
+    def is_int(field):
+        return field.lstrip("-").isdigit()
+
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        numeric = [k for k, col in enumerate(header) if col not in att_text_columns]
+        mixed, ints = set(), set()
+        for row in reader:
+            for k in numeric:
+                (ints if is_int(row[k]) else mixed).add(k)
+    columns = sorted(mixed & ints)
+    if not columns:
+        return
+
+    tmp_path = path + ".tmp"
+    with open(path, "r", newline="") as f, open(tmp_path, "w", newline="") as out:
+        reader = csv.reader(f)
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(next(reader))
+        for row in reader:
+            for k in columns:
+                if is_int(row[k]):
+                    row[k] = repr(float(row[k]))
+            writer.writerow(row)
+    os.replace(tmp_path, path)
+
+
+def format_row(row):
+    """
+    Formats a row for csv.writer, writing NaN and None as empty fields like pandas.to_csv
+    """
+    return [
+        ""
+        if value is None or (isinstance(value, float) and math.isnan(value))
+        else value
+        for value in row
+    ]
+
+
+def pos_dtypes(att_list):
+    """
+    Returns the pandas dtype of every column of a position, derived from its attribute list.
+    Text columns (att_text_columns) are strings, every other column is float64
+    """
+    return {
+        col: "string" if col in att_text_columns else "float64"
+        for col in chain.from_iterable(att_list)
+    }
+
+
+def pos_schema(att_list):
+    """
+    Returns the pyarrow schema of a position, derived from its attribute list
+    """
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            (col, pa.string() if dtype == "string" else pa.float64())
+            for col, dtype in pos_dtypes(att_list).items()
+        ]
+    )
+
+
+def convert_output(csv_path, att_list, fmt):
+    """
+    Converts a complete .csv output file into a typed columnar file, then removes the .csv file
+
+    Parameters
+    ----------
+    csv_path (str): The .csv file written by checkpoint_writer
+    att_list (list): A list of positional headings, from pos_dict()
+    fmt (str): The output format, 'parquet' or 'feather'
+
+    Returns
+    --------
+    str: The path of the new file (same name, with a .parquet or .feather extension)
+    """
+    import pyarrow as pa
+
+    if fmt not in ("parquet", "feather"):
+        raise ValueError("Output format must be one of ['csv', 'parquet', 'feather']")
+
+    df = pd.read_csv(csv_path, dtype=pos_dtypes(att_list))
+    table = pa.Table.from_pandas(df, schema=pos_schema(att_list), preserve_index=False)
+
+    out_path = os.path.splitext(csv_path)[0] + "." + fmt
+    tmp_path = out_path + ".tmp"
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, tmp_path)
+    else:
+        import pyarrow.feather as feather
+
+        feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, out_path)
+    os.remove(csv_path)
+
+    logger.info(f"Converted {csv_path} to {out_path}")
+    return out_path
+
+
+def read_output(path):
+    """
+    Reads an output file written by scrapePage, whatever its format (.csv, .parquet or .feather)
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".feather"):
+        return pd.read_feather(path)
+    return pd.read_csv(path)
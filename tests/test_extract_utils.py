@@ -0,0 +1,67 @@
+"""
+The lxml extraction backend (utils/extract_utils.py) must read exactly the same cards and rows as
+the BeautifulSoup backend of scrape_utils, on the recorded pages and on synthetic edge cases.
+"""
+import pandas as pd
+import pytest
+
+from fixture_utils import FIXTURES_PATH, load_fixtures, make_profile
+from utils.extract_utils import extract_cards_lxml
+from utils.scrape_utils import extract_cards, parse_profile, pos_dict
+
+
+def recorded_profiles():
+    """
+    The html text of every recorded profile, with its position
+    """
+    index, pages = load_fixtures(FIXTURES_PATH)
+    return [
+        (index["position"], html)
+        for path, html in pages.items()
+        if path != index["position_path"]
+    ]
+
+
+def synthetic_profiles():
+    """
+    Profiles without a season, with a long career, and without a player name
+    """
+    return [
+        ("quarterback", make_profile(1, n_seasons=0)),
+        ("quarterback", make_profile(2, n_seasons=1)),
+        ("quarterback", make_profile(3, n_seasons=40)),
+        ("quarterback", make_profile(4).replace("<h1>Player 4</h1>", "")),
+    ]
+
+
+PROFILES = recorded_profiles() + synthetic_profiles()
+
+
+@pytest.mark.parametrize("pos, html", PROFILES, ids=range(len(PROFILES)))
+def test_cards_match(pos, html):
+    assert extract_cards_lxml(html, seasons=True) == extract_cards(html, seasons=True)
+
+
+@pytest.mark.parametrize(
+    "pos", ["quarterback", "running-back", "wide-receiver", "tight-end"]
+)
+def test_rows_match(pos):
+    att_list = pos_dict(pos)
+    columns = [col for card in att_list for col in card]
+    frames = {}
+    seasons = {}
+    for backend in ("bs4", "lxml"):
+        rows = []
+        seasons[backend] = []
+        for _, html in PROFILES:
+            row, season_rows = parse_profile(
+                html, att_list, backend=backend, seasons=True
+            )
+            rows.append(row)
+            seasons[backend] += season_rows
+        frames[backend] = pd.DataFrame(rows, columns=columns)
+
+    pd.testing.assert_frame_equal(frames["lxml"], frames["bs4"])
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(seasons["lxml"]), pd.DataFrame(seasons["bs4"])
+    )